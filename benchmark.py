@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the Minecraft Server Manager
+Runs provisioning and lifecycle scenarios against a local stand-in for the
+Mojang and PaperMC APIs and a fake `java`, so results need no network access
+and are comparable between changes. Linux, macOS and Termux only.
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import http.server
+
+MANAGER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "minecraft_server_manager.py")
+VERSIONS = ["1.20.1", "1.19.4"]
+PAPER_BUILDS = [195, 196]
+SCENARIOS = ["install", "fleet", "restart", "bundle", "cli"]
+
+# Stand-in for `java`: boots after a delay, prints the usual console lines and
+# handles "stop" on stdin. Timings come from the environment.
+FAKE_JAVA = r'''#!{python}
+import os, sys, time, signal
+boot = float(os.environ.get("BENCH_JAVA_BOOT", "0.5"))
+stop = float(os.environ.get("BENCH_JAVA_STOP", "0.2"))
+lines = int(os.environ.get("BENCH_JAVA_LINES", "40"))
+signal.signal(signal.SIGTERM, lambda *a: sys.exit(143))
+print("[Server thread/INFO]: Starting minecraft server version (benchmark)", flush=True)
+for i in range(lines):
+    time.sleep(boot / max(lines, 1))
+    print(f"[Worker-Main/INFO]: Preparing spawn area: {{i * 100 // max(lines, 1)}}%", flush=True)
+print(f'[Server thread/INFO]: Done ({{boot:.3f}}s)! For help, type "help"', flush=True)
+for line in sys.stdin:
+    if line.strip() == "stop":
+        print("[Server thread/INFO]: Stopping the server", flush=True)
+        print("[Server thread/INFO]: Saving worlds", flush=True)
+        time.sleep(stop)
+        sys.exit(0)
+    print(f"[Server thread/INFO]: Unknown command: {{line.strip()}}", flush=True)
+'''
+
+class StandInServer:
+    """Local HTTP server that mimics piston-meta, the Paper v2 API and artifact downloads"""
+    def __init__(self, artifact_bytes, latency=0.0, bandwidth=None):
+        self.latency = latency
+        self.bandwidth = bandwidth  # Bytes per second per connection; None = unlimited
+        self.requests = 0
+        self.routes = {}
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.build_routes(artifact_bytes)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def add_artifact(self, path, size, seed):
+        # Cheap deterministic filler: a repeated block that differs per artifact
+        block = hashlib.sha256(seed.encode()).digest() * 2048
+        data = (block * (size // len(block) + 1))[:size]
+        self.routes[path] = ("application/java-archive", data)
+        return data
+
+    def build_routes(self, artifact_bytes):
+        manifest = {'latest': {'release': VERSIONS[0]}, 'versions': []}
+        for version in VERSIONS:
+            jar = self.add_artifact(f"/objects/vanilla-{version}.jar", artifact_bytes, f"vanilla-{version}")
+            package = {'downloads': {'server': {
+                'url': f"{self.base_url}/objects/vanilla-{version}.jar",
+                'sha1': hashlib.sha1(jar).hexdigest(), 'size': len(jar)}}}
+            self.add_json(f"/v1/packages/{version}.json", package)
+            manifest['versions'].append({'id': version, 'type': "release", 'url': f"{self.base_url}/v1/packages/{version}.json"})
+
+            self.add_json(f"/v2/projects/paper/versions/{version}", {'version': version, 'builds': PAPER_BUILDS})
+            for build in PAPER_BUILDS:
+                name = f"paper-{version}-{build}.jar"
+                base = f"/v2/projects/paper/versions/{version}/builds/{build}"
+                jar = self.add_artifact(f"{base}/downloads/{name}", artifact_bytes, name)
+                self.add_json(base, {'build': build, 'downloads': {'application': {
+                    'name': name, 'sha256': hashlib.sha256(jar).hexdigest()}}})
+        self.add_json("/mc/game/version_manifest.json", manifest)
+
+    def add_json(self, path, document):
+        self.routes[path] = ("application/json", json.dumps(document).encode())
+
+    def handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond()
+
+            def respond(self, head=False):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                route = server.routes.get(self.path)
+                if route is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                content_type, data = route
+                etag = f'"{hashlib.sha1(data).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                start, end = 0, len(data) - 1
+                byte_range = self.headers.get("Range")
+                if byte_range and byte_range.startswith("bytes="):
+                    first, _, last = byte_range[6:].partition("-")
+                    start, end = int(first), min(int(last) if last else end, end)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", etag)
+                self.end_headers()
+                if head:
+                    return
+                try:
+                    self.send_body(data, start, end + 1)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client gave up (e.g. a cancelled download)
+
+            def send_body(self, data, start, stop):
+                chunk = 64 * 1024
+                for offset in range(start, stop, chunk):
+                    piece = data[offset:min(offset + chunk, stop)]
+                    self.wfile.write(piece)
+                    if server.bandwidth:
+                        time.sleep(len(piece) / server.bandwidth)
+
+        return Handler
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def percentile(samples, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+def prepare_home(root, base_url, options):
+    """Fresh HOME with a manager config that points at the stand-in server"""
+    home = os.path.join(root, "home")
+    os.makedirs(os.path.join(home, ".minecraft_server_manager"), exist_ok=True)
+    config = {
+        'version_manifest_url': f"{base_url}/mc/game/version_manifest.json",
+        'paper_api_url': f"{base_url}/v2",
+        'memory_budget_mb': 1024 * 1024,  # Fake servers use no real heap
+        'ready_timeout': 60,
+        'auto_restart': False,
+        'fleet_jobs': options['jobs'],
+    }
+    with open(os.path.join(home, ".minecraft_server_manager", "config.json"), 'w') as f:
+        json.dump(config, f, indent=2)
+    return home
+
+def write_fake_java(root):
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "java")
+    with open(path, 'w') as f:
+        f.write(FAKE_JAVA.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return bin_dir
+
+def run_child(args, env):
+    """Run a process to completion; returns (wall seconds, peak RSS bytes, stdout)"""
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        started = time.perf_counter()
+        proc = subprocess.Popen(args, env=env, stdin=subprocess.DEVNULL, stdout=out, stderr=err)
+        # wait4 rather than wait so the child's own resource usage comes back with it
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - started
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        stdout, stderr = out.read().decode(), err.read().decode()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args[1:3])} failed:\n{stderr.strip()[-2000:]}")
+    peak = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return elapsed, peak, stdout
+
+# Scenarios run in a child process (so HOME is set before the manager is
+# imported and peak RSS is per scenario) and print their samples as JSON.
+
+def clear_store(manager):
+    manager.resolved_artifacts.clear()
+    shutil.rmtree(manager.ARTIFACT_STORE_DIR, ignore_errors=True)
+    shutil.rmtree(manager.METADATA_CACHE_DIR, ignore_errors=True)
+
+def scenario_install(manager, options):
+    """Install and first boot of one server, with a cold and a warm artifact store"""
+    samples = {'install cold': [], 'install warm': [], 'first boot': []}
+    for run in range(options['runs']):
+        for label in ("install cold", "install warm"):
+            if label == "install cold":
+                clear_store(manager)
+            name = f"bench-{label.split()[1]}-{run}"
+            started = time.perf_counter()
+            server_dir = manager.create_server(name, VERSIONS[0], "paper", "java")
+            result = manager.initialize_server(server_dir)
+            samples[label].append(time.perf_counter() - started)
+            samples['first boot'].append(result['elapsed'])
+            if not result['ready']:
+                raise RuntimeError(f"{name} did not boot")
+    return samples
+
+def scenario_fleet(manager, options):
+    """Provision a whole fleet spec, cold store, several servers at a time"""
+    samples = {'fleet wall': [], 'fleet per server': []}
+    provision = manager.provision_server
+
+    def timed_provision(server, initialize=True):
+        started = time.perf_counter()
+        try:
+            return provision(server, initialize)
+        finally:
+            samples['fleet per server'].append(time.perf_counter() - started)
+    manager.provision_server = timed_provision
+
+    for run in range(options['runs']):
+        clear_store(manager)
+        spec = {'defaults': {'implementation': "java"}, 'concurrency': options['jobs'], 'initialize': True, 'servers': [
+            {'name': f"fleet{run}-{i}", 'type': ("vanilla", "paper")[i % 2], 'version': VERSIONS[i // 2 % len(VERSIONS)]}
+            for i in range(options['fleet_size'])
+        ]}
+        spec_path = os.path.join(os.path.expanduser("~"), f"fleet{run}.json")
+        with open(spec_path, 'w') as f:
+            json.dump(spec, f)
+        started = time.perf_counter()
+        results = manager.apply_fleet(spec_path)
+        samples['fleet wall'].append(time.perf_counter() - started)
+        failed = [r for r in results if r['status'] == "failed"]
+        if failed:
+            raise RuntimeError(f"{len(failed)} fleet servers failed: {failed[0]['detail']}")
+    return samples
+
+def scenario_restart(manager, options):
+    """Restart every running server at once and time each one until it is ready again"""
+    import concurrent.futures
+    samples = {'restart to ready': [], 'storm wall': []}
+    servers = [manager.create_server(f"storm-{i}", VERSIONS[0], "vanilla", "java") for i in range(options['restart_servers'])]
+    for server_dir in servers:
+        manager.start_server(server_dir)
+
+    def restart(server_dir):
+        offset = manager.log_end_offset(server_dir)  # Logical, so it survives a rotation mid-restart
+        started = time.time()
+        manager.restart_server(server_dir)
+        result = manager.wait_for_ready(server_dir, offset, started=started)
+        if not result['ready']:
+            raise RuntimeError(f"{server_dir} did not come back")
+        return result['elapsed']
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(servers)) as pool:
+            for server_dir in servers:
+                manager.wait_for_ready(server_dir)
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                samples['restart to ready'] += list(pool.map(restart, servers))
+                samples['storm wall'].append(time.perf_counter() - started)
+    finally:
+        for server_dir in servers:
+            manager.stop_server(server_dir)
+    return samples
+
+def scenario_bundle(manager, options):
+    """Export an offline bundle, then install from it with a cold store and the stand-in unused"""
+    samples = {'bundle export': [], 'install from bundle': []}
+    bundle_path = os.path.join(os.path.expanduser("~"), "bundle.zip")
+    targets = [("java", server_type, version) for server_type in ("vanilla", "paper") for version in VERSIONS]
+    for run in range(options['runs']):
+        clear_store(manager)
+        started = time.perf_counter()
+        manager.export_bundle(bundle_path, targets)
+        samples['bundle export'].append(time.perf_counter() - started)
+
+    manager.config_overrides['mirror'] = bundle_path
+    for run in range(options['runs']):
+        clear_store(manager)
+        started = time.perf_counter()
+        manager.create_server(f"bench-bundle-{run}", VERSIONS[0], "paper", "java")
+        samples['install from bundle'].append(time.perf_counter() - started)
+    return samples
+
+def run_scenario(name, options):
+    import minecraft_server_manager as manager
+    scenario = {'install': scenario_install, 'fleet': scenario_fleet, 'restart': scenario_restart,
+                'bundle': scenario_bundle}[name]
+    with contextlib.redirect_stdout(sys.stderr):  # Keep manager chatter out of the results
+        samples = scenario(manager, options)
+    print(json.dumps(samples))
+
+def bench_cli(env, options):
+    """Cold start of the manager: bare import and the first CLI prompt, in fresh processes"""
+    samples = {'import manager': [], 'first CLI prompt': []}
+    peaks = []
+    probe = f"import sys; sys.path.insert(0, {os.path.dirname(MANAGER_SCRIPT)!r}); import minecraft_server_manager"
+    for _ in range(options['runs']):
+        elapsed, _, _ = run_child([sys.executable, "-c", probe], env)
+        samples['import manager'].append(elapsed)
+        elapsed, peak, _ = run_child([sys.executable, MANAGER_SCRIPT, "--cli", "--manage"], env)
+        samples['first CLI prompt'].append(elapsed)
+        peaks.append(peak)
+    return samples, max(peaks)
+
+def report(results, as_json):
+    rows = []
+    for scenario, (samples, peak) in results.items():
+        for metric, values in samples.items():
+            if values:
+                rows.append({'scenario': scenario, 'metric': metric, 'n': len(values),
+                             'p50_ms': percentile(values, 50) * 1000, 'p99_ms': percentile(values, 99) * 1000,
+                             'peak_rss_mb': peak / 1024 / 1024 if peak else None})
+    if as_json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'Scenario':10} {'Metric':20} {'N':>4} {'p50 ms':>10} {'p99 ms':>10} {'Peak RSS':>9}")
+    print("-" * 68)
+    for row in rows:
+        peak = f"{row['peak_rss_mb']:.0f}MB" if row['peak_rss_mb'] else "-"
+        print(f"{row['scenario']:10} {row['metric']:20} {row['n']:4} {row['p50_ms']:10.1f} {row['p99_ms']:10.1f} {peak:>9}")
+
+def serve_stand_in(args):
+    """Run the stand-in server until the parent closes our stdin"""
+    server = StandInServer(int(args.artifact_mb * 1024 * 1024), args.latency_ms / 1000,
+                           args.bandwidth_mbps * 1024 * 1024 / 8 if args.bandwidth_mbps else None)
+    print(server.base_url, flush=True)
+    sys.stdin.read()
+    server.close()
+    print(server.requests, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the Minecraft Server Manager")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated scenarios ({', '.join(SCENARIOS)})")
+    parser.add_argument("--runs", type=int, default=5, help="Repetitions per scenario")
+    parser.add_argument("--fleet-size", type=int, default=50, help="Servers in the fleet scenario")
+    parser.add_argument("--restart-servers", type=int, default=10, help="Servers restarted at once in the restart scenario")
+    parser.add_argument("--jobs", type=int, default=8, help="Servers provisioned in parallel in the fleet scenario")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Added latency per HTTP request")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0, help="Per-connection download bandwidth (0 = unlimited)")
+    parser.add_argument("--artifact-mb", type=float, default=16, help="Size of each fake server jar")
+    parser.add_argument("--boot-time", type=float, default=0.5, help="Seconds the fake java takes to boot")
+    parser.add_argument("--stop-time", type=float, default=0.2, help="Seconds the fake java takes to save and exit")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--options", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scenario(args.child, json.loads(args.options))
+        return
+    if args.serve:
+        serve_stand_in(args)
+        return
+
+    if sys.platform == "win32":
+        sys.exit("The benchmarks need a Unix-like system (fake java is a script)")
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    options = {'runs': args.runs, 'fleet_size': args.fleet_size, 'restart_servers': args.restart_servers, 'jobs': args.jobs}
+    root = tempfile.mkdtemp(prefix="mcsm-bench-")
+    # The stand-in holds every fake jar in memory, so it gets its own process:
+    # children forked from a small parent report their own peak RSS
+    stand_in = subprocess.Popen([sys.executable, __file__, "--serve"] + sys.argv[1:],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    base_url = stand_in.stdout.readline().strip()
+    try:
+        bin_dir = write_fake_java(root)
+        results = {}
+        for scenario in scenarios:
+            # Every scenario starts from an empty manager directory
+            shutil.rmtree(os.path.join(root, "home"), ignore_errors=True)
+            env = dict(os.environ, HOME=prepare_home(root, base_url, options),
+                       PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""),
+                       BENCH_JAVA_BOOT=str(args.boot_time), BENCH_JAVA_STOP=str(args.stop_time))
+            print(f"Running {scenario}...", file=sys.stderr)
+            if scenario == "cli":
+                # Give the CLI a realistic registry to list
+                run_child([sys.executable, __file__, "--child", "fleet",
+                           "--options", json.dumps(dict(options, runs=1))], env)
+                results[scenario] = bench_cli(env, options)
+            else:
+                _, peak, out = run_child([sys.executable, __file__, "--child", scenario, "--options", json.dumps(options)], env)
+                results[scenario] = (json.loads(out.strip().splitlines()[-1]), peak)
+        report(results, args.json)
+    finally:
+        stand_in.stdin.close()
+        print(f"{stand_in.stdout.read().strip()} HTTP requests served", file=sys.stderr)
+        stand_in.wait()
+        if args.keep:
+            print(f"Scratch directory kept at {root}", file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
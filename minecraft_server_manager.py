@@ -11,36 +11,140 @@ import platform
 import subprocess
 import time
 import json
-import requests
 import shutil
 import argparse
 import traceback
+import re
+import signal
+import collections
+import socket
+import struct
+import mmap
+import hashlib
+import threading
+import uuid
+import errno
+import zlib
 
 # Define constants
 SERVER_MANAGER_DIR = os.path.join(os.path.expanduser("~"), ".minecraft_server_manager")
 SERVER_DATA_FILE = os.path.join(SERVER_MANAGER_DIR, "servers.json")
+REGISTRY_DB = os.path.join(SERVER_MANAGER_DIR, "servers.db")
 CONFIG_FILE = os.path.join(SERVER_MANAGER_DIR, "config.json")
 LOG_DIR = os.path.join(SERVER_MANAGER_DIR, "logs")
+RUN_DIR = os.path.join(SERVER_MANAGER_DIR, "run")
+BACKUP_DIR = os.path.join(SERVER_MANAGER_DIR, "backups")
+TRASH_DIR = os.path.join(SERVER_MANAGER_DIR, "trash")
+METADATA_CACHE_DIR = os.path.join(SERVER_MANAGER_DIR, "cache", "metadata")
+ARTIFACT_STORE_DIR = os.path.join(SERVER_MANAGER_DIR, "store")
+ARTIFACT_INDEX_FILE = os.path.join(ARTIFACT_STORE_DIR, "index.json")
 VERSION_MANIFEST_URL = "https://piston-meta.mojang.com/mc/game/version_manifest.json"
+PAPER_API_URL = "https://api.papermc.io/v2"
+HTTP_TIMEOUT = (5, 30)  # (connect, read) seconds
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_MIN_SEGMENT = 4 * 1024 * 1024  # Smaller files are fetched over one connection
+DOWNLOAD_RETRIES = 3
+HTTP_POOL_SIZE = 32
+
+# Defaults for config.json; user values override these
+DEFAULT_CONFIG = {
+    "metadata_ttl": 3600,  # Seconds before cached metadata is revalidated
+    "store_max_bytes": 4 * 1024 ** 3,  # Size cap for unreferenced artifacts in the store
+    "download_segments": 4,  # Concurrent HTTP Range connections per download
+    "downloads_per_host": 4,  # Concurrent artifact downloads from one remote host
+    "fleet_jobs": 8,  # Servers provisioned in parallel by --apply
+    "ready_timeout": 300,  # Seconds to wait for a server to finish booting
+    "stop_timeout": 60,  # Seconds to wait for "stop" to save and exit before SIGTERM
+    "kill_timeout": 10,  # Seconds to wait after SIGTERM before SIGKILL
+    "auto_restart": True,  # Restart crashed servers launched by a long-running manager
+    "memory_budget_mb": None,  # Memory servers may use on this host; None = total RAM minus reserve
+    "memory_reserve_mb": 1024,  # Memory left for the OS when memory_budget_mb is None
+    "heap_mb": {"vanilla": 2048, "paper": 2048, "fabric": 2048, "forge": 4096, "default": 1024},
+    "min_heap_mb": 512,  # Refuse to launch rather than run below this heap
+    "gc_presets": {"default": "g1-aikar", "nukkit": "g1"},  # GC flag set per server type
+    "cpu_pinning": False,  # Pin each server to its own CPU set (Linux, needs taskset)
+    "cpus_per_server": 2,
+    "telemetry_interval": 5,  # Seconds between resource samples
+    "telemetry_history": 720,  # Samples kept per server (1 hour at 5s)
+    "metrics_port": 9225,  # Local port for the Prometheus-style /metrics endpoint
+    "rcon_base_port": 25575,  # First RCON port handed out to new servers
+    "rcon_timeout": 5,  # Seconds to wait for an RCON reply
+    "save_timeout": 120,  # Seconds to wait for "save-all" before a backup
+    "gui_workers": 4,  # Background jobs (installs, starts, stops) the GUI runs at once
+    "trash_retention_hours": 24,  # Deleted servers can be restored for this long; 0 = reclaim at once
+    "disk_usage_interval": 300,  # Seconds before a running server's disk usage is measured again
+    "rolling_restarts": 1,  # Running servers restarted at once by --upgrade
+    "version_manifest_url": VERSION_MANIFEST_URL,  # Mojang version manifest (override for a mirror)
+    "paper_api_url": PAPER_API_URL,  # PaperMC v2 API base
+    "idle_stop_minutes": 15,  # Proxied servers are stopped after this long without players; 0 = never
+    "proxy_hold_seconds": 25,  # How long a joining player waits for a sleeping server before being asked to retry
+    "proxy_backend_base_port": 35565,  # First localhost port handed to servers moved behind the idle proxy
+    "log_rotate_mb": 64,  # Console log segments are rotated and compressed at this size
+    "log_rotate_hours": 24,  # ...or at this age
+    "log_retention_days": 14,  # Compressed segments older than this are deleted
+    "lag_history_days": 90,  # Hourly lag statistics kept per server
+    "mirror": None,  # Bundle file or http:// mirror that replaces every online resolver
+    "mirror_port": 8765,  # Port --serve-bundle listens on
+}
+
+# Console lines that mean a server has finished booting (Java, PocketMine, Nukkit, Bedrock)
+READY_PATTERN = re.compile(r"Done \(([\d.,]+) ?s\)! For help|Server started\.\s*$")
+SAVED_PATTERN = re.compile(r"Saved the (game|world)")
+# First-run exit when the EULA is not accepted; the files exist by then
+EULA_PATTERN = re.compile(r"You need to agree to the EULA")
+
+# Overload warnings in server output
+LAG_PATTERN = re.compile(r"Can't keep up! Is the server overloaded\? Running (\d+)ms or (\d+) ticks behind")
+TPS_PATTERN = re.compile(r"TPS from last 1m, 5m, 15m: \*?([\d.]+)")
+
+JVM_OVERHEAD_MB = 256  # Metaspace, threads and buffers on top of the heap
+
+# Aikar's G1 flags, widely used for Paper and other Java servers
+G1_AIKAR_FLAGS = [
+    "-XX:+UseG1GC", "-XX:+ParallelRefProcEnabled", "-XX:MaxGCPauseMillis=200",
+    "-XX:+UnlockExperimentalVMOptions", "-XX:+DisableExplicitGC", "-XX:+AlwaysPreTouch",
+    "-XX:G1HeapWastePercent=5", "-XX:G1MixedGCCountTarget=4", "-XX:G1MixedGCLiveThresholdPercent=90",
+    "-XX:G1RSetUpdatingPauseTimePercent=5", "-XX:SurvivorRatio=32", "-XX:+PerfDisableSharedMem",
+    "-XX:MaxTenuringThreshold=1"
+]
+G1_AIKAR_SMALL = ["-XX:G1NewSizePercent=30", "-XX:G1MaxNewSizePercent=40", "-XX:G1HeapRegionSize=8M",
+                  "-XX:G1ReservePercent=20", "-XX:InitiatingHeapOccupancyPercent=15"]
+G1_AIKAR_LARGE = ["-XX:G1NewSizePercent=40", "-XX:G1MaxNewSizePercent=50", "-XX:G1HeapRegionSize=16M",
+                  "-XX:G1ReservePercent=15", "-XX:InitiatingHeapOccupancyPercent=20"]
+GC_PRESETS = {
+    "g1-aikar": lambda heap_mb: G1_AIKAR_FLAGS + (G1_AIKAR_LARGE if heap_mb >= 12288 else G1_AIKAR_SMALL),
+    "g1": lambda heap_mb: ["-XX:+UseG1GC", "-XX:MaxGCPauseMillis=200", "-XX:+ParallelRefProcEnabled", "-XX:+DisableExplicitGC"],
+    "none": lambda heap_mb: []
+}
 
 # Server URLs
 SERVER_URLS = {
     "java": {
         "vanilla": lambda version: get_vanilla_url(version),
         "paper": lambda version: get_paper_url(version),
-        "fabric": lambda version: f"https://maven.fabricmc.net/net/fabricmc/fabric-server-launcher/{get_fabric_version(version)}/fabric-server-launcher-{get_fabric_version(version)}-universal.jar",
-        "forge": lambda version: f"https://maven.minecraftforge.net/net/minecraftforge/forge/{version}-{get_forge_build(version)}/forge-{version}-{get_forge_build(version)}-installer.jar"
+        "fabric": lambda version: get_fabric_url(version),
+        "forge": lambda version: get_forge_url(version)
     },
     "bedrock": {
-        "vanilla": "https://minecraft.azureedge.net/bin-win/bedrock-server-1.20.15.01.zip",
+        "vanilla": lambda version: get_bedrock_url(version),
         "pocketmine": "https://github.com/pmmp/PocketMine-MP/releases/latest/download/PocketMine-MP.phar",
         "nukkit": "https://ci.opencollab.dev/job/NukkitX/job/Nukkit/job/master/lastSuccessfulBuild/artifact/target/nukkit-1.0-SNAPSHOT.jar"
     }
 }
 
-# Ensure directories exist
-os.makedirs(SERVER_MANAGER_DIR, exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
+BEDROCK_SERVER_VERSION = "1.20.15.01"
+
+# How each server type is launched, and the file its artifact is saved as.
+# Anything not listed is a Java jar.
+SERVER_LAUNCHERS = {
+    ("bedrock", "vanilla"): {'runtime': "native", 'file': "bedrock_server.exe" if platform.system() == "Windows" else "bedrock_server"},
+    ("bedrock", "pocketmine"): {'runtime': "php", 'file': "PocketMine-MP.phar"},
+}
+JAVA_LAUNCHER = {'runtime': "java", 'file': "server.jar"}
+
+def get_launcher(implementation, server_type):
+    """Launcher entry (runtime and file) for a server type"""
+    return SERVER_LAUNCHERS.get((implementation, server_type), JAVA_LAUNCHER)
 
 def is_termux():
     """Check if running in Termux environment"""
@@ -87,11 +191,167 @@ def hide_folder(path):
             return False
     return path
 
+http_session = None
+http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Shared keep-alive HTTP session with connection pooling and retries"""
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry_options = dict(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+            try:
+                retry = Retry(allowed_methods=frozenset(["GET", "HEAD"]), **retry_options)
+            except TypeError:  # urllib3 < 1.26
+                retry = Retry(method_whitelist=frozenset(["GET", "HEAD"]), **retry_options)
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            http_session = session
+    return http_session
+
+# Settings given on the command line for this process only (e.g. --mirror)
+config_overrides = {}
+
+def get_config():
+    """Load config.json merged over the defaults"""
+    config = dict(DEFAULT_CONFIG)
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                config.update(json.load(f))
+        except:
+            pass
+    config.update(config_overrides)
+    return config
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over the target"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class FileLock:
+    """Exclusive lock shared by every manager process (daemon, CLI runs, idle proxy).
+
+    Backed by a lock file, so it also holds across processes. Reentrant within
+    a thread; other threads of the process queue on a local lock first.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.local.acquire()
+        if self.depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'a+b')
+                self.file.seek(0)
+                if platform.system() == "Windows":
+                    import msvcrt
+                    while True:
+                        try:
+                            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            pass  # LK_LOCK gives up after 10 seconds; keep waiting
+                else:
+                    import fcntl
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            except:
+                if self.file:
+                    self.file.close()
+                    self.file = None
+                self.local.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            if platform.system() == "Windows":
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()  # Also releases the flock
+            self.file = None
+        self.local.release()
+
+def metadata_cache_path(url):
+    """Cache file used for a metadata URL"""
+    return os.path.join(METADATA_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+def fetch_json_cached(url, ttl=None):
+    """Fetch a JSON document through the on-disk metadata cache.
+
+    Fresh entries are returned without touching the network. Expired entries
+    are revalidated with ETag/If-Modified-Since, and if the request fails the
+    stale copy is returned instead. ttl=None uses config.json's metadata_ttl;
+    ttl=-1 never expires (for content-addressed URLs).
+    """
+    if ttl is None:
+        ttl = get_config()["metadata_ttl"]
+    cache_file = metadata_cache_path(url)
+    entry = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r') as f:
+                entry = json.load(f)
+        except:
+            entry = None
+    
+    if entry and (ttl < 0 or time.time() - entry['fetched'] < ttl):
+        return entry['data']
+    
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    
+    try:
+        response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code == 304 and entry:
+            entry['fetched'] = time.time()
+        else:
+            response.raise_for_status()
+            entry = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched': time.time(),
+                'data': response.json()
+            }
+    except Exception:
+        if entry:
+            return entry['data']  # Offline: serve stale data
+        raise
+    
+    try:
+        write_json_atomic(cache_file, entry)
+    except OSError:
+        pass
+    return entry['data']
+
 def get_available_versions(server_type="java"):
-    """Get available Minecraft versions from Mojang API"""
+    """Get available Minecraft versions from Mojang API, or from the mirror if one is configured"""
+    mirror = get_config()["mirror"]
+    if mirror:
+        return bundle_versions(load_mirror_index(mirror), server_type)
     try:
-        response = requests.get(VERSION_MANIFEST_URL)
-        data = response.json()
+        data = fetch_json_cached(get_config()["version_manifest_url"])
         
         if server_type == "java":
             return [v['id'] for v in data['versions'] if v['type'] == 'release']
@@ -99,190 +359,4128 @@ def get_available_versions(server_type="java"):
             # Filter for Bedrock versions (simplified)
             return [v['id'] for v in data['versions'] if v['id'].startswith('1.') and '.' in v['id']]
     except:
-        # Fallback versions
-        return ["1.20.1", "1.19.4", "1.18.2", "1.17.1", "1.16.5"]
+        # Offline: versions from imported bundles, else a fallback list
+        return bundle_versions(load_bundle_pins(), server_type) or ["1.20.1", "1.19.4", "1.18.2", "1.17.1", "1.16.5"]
 
-def get_paper_build(version):
+def get_paper_build(version, ttl=None):
     """Get latest Paper build number for a version"""
-    url = f"https://api.papermc.io/v2/projects/paper/versions/{version}"
+    url = f"{get_config()['paper_api_url']}/projects/paper/versions/{version}"
     try:
-        response = requests.get(url)
-        data = response.json()
+        data = fetch_json_cached(url, ttl)
         return data['builds'][-1]  # Latest build
     except:
         return None
 
-def get_fabric_version(version):
-    """Get compatible Fabric version"""
-    # Simplified - in reality this would query Fabric API
-    return "1.0.0"  # Placeholder
+def get_fabric_version(version):
+    """Get compatible Fabric version"""
+    # Simplified - in reality this would query Fabric API
+    return "1.0.0"  # Placeholder
+
+def get_forge_build(version):
+    """Get latest Forge build for a version"""
+    # Simplified - would query Forge files
+    return "47.1.0"  # Placeholder
+
+def get_fabric_url(version):
+    """Get Fabric server launcher URL"""
+    fabric_version = get_fabric_version(version)
+    return f"https://maven.fabricmc.net/net/fabricmc/fabric-server-launcher/{fabric_version}/fabric-server-launcher-{fabric_version}-universal.jar"
+
+def get_forge_url(version):
+    """Get Forge installer URL"""
+    build = get_forge_build(version)
+    return f"https://maven.minecraftforge.net/net/minecraftforge/forge/{version}-{build}/forge-{version}-{build}-installer.jar"
+
+def get_vanilla_download(version, ttl=None):
+    """Get Vanilla server download info (url, sha1, size) from the version manifest"""
+    manifest = fetch_json_cached(get_config()["version_manifest_url"], ttl)
+    
+    # Find version details; per-version URLs embed their SHA-1, so never expire
+    version_entry = next((v for v in manifest['versions'] if v['id'] == version), None)
+    if version_entry is None:
+        raise ValueError(f"Unknown Vanilla version {version}")
+    version_manifest = fetch_json_cached(version_entry['url'], ttl=-1)
+    server = version_manifest['downloads']['server']
+    return {'url': server['url'], 'hash': f"sha1:{server['sha1']}", 'size': server.get('size')}
+
+def get_vanilla_url(version):
+    """Get Vanilla server URL for a specific version"""
+    return get_vanilla_download(version)['url']
+
+def get_bedrock_url(version):
+    """Get the Bedrock Dedicated Server archive URL for this platform"""
+    system = "win" if platform.system() == "Windows" else "linux"
+    return f"https://minecraft.azureedge.net/bin-{system}/bedrock-server-{BEDROCK_SERVER_VERSION}.zip"
+
+def get_paper_download(version, ttl=None):
+    """Get Paper server download info (url, sha256) for the latest build"""
+    build = get_paper_build(version, ttl)
+    if not build:
+        raise ValueError(f"No Paper build found for {version}")
+    base = f"{get_config()['paper_api_url']}/projects/paper/versions/{version}/builds/{build}"
+    try:
+        application = fetch_json_cached(base, ttl=-1)['downloads']['application']
+        name, digest = application['name'], f"sha256:{application['sha256']}"
+    except:
+        name, digest = f"paper-{version}-{build}.jar", None
+    return {'url': f"{base}/downloads/{name}", 'hash': digest, 'size': None, 'pinned': True}
+
+def get_paper_url(version):
+    """Get Paper server URL"""
+    return get_paper_download(version)['url']
+
+# Resolved artifacts are memoized for the life of the process
+resolved_artifacts = {}
+resolved_artifacts_lock = threading.Lock()
+
+def resolve_artifact(implementation, server_type, version, refresh=False):
+    """Resolve a server artifact to a dict with url, hash ("algo:hex" or None) and size.
+
+    Without a hash, pinned says whether the URL names one fixed build; the
+    others (such as "latest" links) may serve a new build at any time.
+
+    A configured mirror answers every lookup, and artifacts pinned by an
+    imported bundle are never looked up online. refresh=True skips the memo
+    and revalidates cached metadata, for upgrade checks.
+    """
+    cache_key = (implementation, server_type, version)
+    ttl = 0 if refresh else None
+    with resolved_artifacts_lock:
+        if cache_key in resolved_artifacts and not refresh:
+            return dict(resolved_artifacts[cache_key])
+    
+    try:
+        source = SERVER_URLS[implementation][server_type]
+    except KeyError:
+        raise ValueError(f"Unsupported server type: {implementation}/{server_type}")
+    
+    mirror = get_config()["mirror"]
+    if mirror:
+        artifact = mirror_artifact(mirror, implementation, server_type, version)
+    else:
+        artifact = load_bundle_pins()['artifacts'].get(bundle_target_key(implementation, server_type, version))
+    if artifact is None and implementation == "java" and server_type == "vanilla":
+        artifact = get_vanilla_download(version, ttl)
+    elif artifact is None and implementation == "java" and server_type == "paper":
+        artifact = get_paper_download(version, ttl)
+    if artifact is None:
+        url = source(version) if callable(source) else source
+        artifact = {'url': url, 'hash': None, 'size': None, 'pinned': callable(source)}
+    
+    with resolved_artifacts_lock:
+        resolved_artifacts[cache_key] = artifact
+    return dict(artifact)
+
+# Server registry: SQLite in WAL mode, one connection per thread
+REGISTRY_COLUMNS = ("path", "name", "version", "type", "implementation", "artifact", "created")
+registry_local = threading.local()
+
+def get_registry():
+    """Open (and on first use create/migrate) the server registry for this thread"""
+    conn = getattr(registry_local, "conn", None)
+    if conn is None:
+        import sqlite3
+        os.makedirs(SERVER_MANAGER_DIR, exist_ok=True)
+        conn = sqlite3.connect(REGISTRY_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS servers (
+                path TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                version TEXT,
+                type TEXT,
+                implementation TEXT,
+                artifact TEXT,
+                created TEXT,
+                extra TEXT NOT NULL DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_servers_name ON servers(name);
+            CREATE TABLE IF NOT EXISTS trash (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                trash_path TEXT NOT NULL,
+                deleted REAL NOT NULL,
+                bytes INTEGER,
+                server TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS disk_usage (
+                path TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                files INTEGER NOT NULL,
+                scanned REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lag_cursor (
+                path TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lag_hourly (
+                path TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                behind_ms INTEGER NOT NULL,
+                max_ms INTEGER NOT NULL,
+                watchdogs INTEGER NOT NULL,
+                buckets TEXT NOT NULL,
+                PRIMARY KEY (path, hour)
+            ) WITHOUT ROWID;
+        """)
+        registry_local.conn = conn
+        migrate_server_data(conn)
+    return conn
+
+def migrate_server_data(conn):
+    """Import a legacy servers.json into the registry, then set it aside"""
+    if not os.path.exists(SERVER_DATA_FILE):
+        return
+    try:
+        with open(SERVER_DATA_FILE, 'r') as f:
+            servers = json.load(f).get('servers', [])
+    except Exception as e:
+        print(f"Could not migrate {SERVER_DATA_FILE}: {e}")
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for server in servers:
+            conn.execute(*registry_upsert(server, replace=False))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+    try:
+        os.replace(SERVER_DATA_FILE, SERVER_DATA_FILE + ".migrated")
+    except FileNotFoundError:
+        pass  # Another process migrated it first
+
+def registry_upsert(server, replace=True):
+    """SQL and parameters that store a server dict in the registry"""
+    extra = {k: v for k, v in server.items() if k not in REGISTRY_COLUMNS}
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    sql = f"{verb} INTO servers ({', '.join(REGISTRY_COLUMNS)}, extra) VALUES ({', '.join('?' * (len(REGISTRY_COLUMNS) + 1))})"
+    return sql, [server.get(c) for c in REGISTRY_COLUMNS] + [json.dumps(extra)]
+
+def registry_row(row):
+    """Convert a registry row into a server dict"""
+    server = {c: row[c] for c in REGISTRY_COLUMNS}
+    server.update(json.loads(row['extra']))
+    return server
+
+def list_servers():
+    """All registered servers, oldest first"""
+    rows = get_registry().execute("SELECT * FROM servers ORDER BY created, rowid").fetchall()
+    return [registry_row(r) for r in rows]
+
+def get_server(name=None, path=None):
+    """Look up a registered server by name or path"""
+    if path is not None:
+        row = get_registry().execute("SELECT * FROM servers WHERE path = ?", (path,)).fetchone()
+    else:
+        row = get_registry().execute("SELECT * FROM servers WHERE name = ? ORDER BY rowid DESC", (name,)).fetchone()
+    return registry_row(row) if row else None
+
+def register_server(server):
+    """Add a server to the registry, replacing any entry with the same path"""
+    get_registry().execute(*registry_upsert(server))
+
+def update_server(path, **fields):
+    """Update fields of a registered server in one transaction; returns the new entry"""
+    conn = get_registry()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT * FROM servers WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return None
+        server = registry_row(row)
+        server.update(fields)
+        conn.execute(*registry_upsert(server))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+    return server
+
+def unregister_server(path):
+    """Remove a server from the registry"""
+    get_registry().execute("DELETE FROM servers WHERE path = ?", (path,))
+
+def get_server_data():
+    """Load server data in the legacy {'servers': [...]} shape"""
+    return {'servers': list_servers()}
+
+def save_server_data(data):
+    """Replace the whole registry with data in the legacy {'servers': [...]} shape"""
+    conn = get_registry()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM servers")
+        for server in data['servers']:
+            conn.execute(*registry_upsert(server))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+
+def read_properties(path):
+    """Parse a Java .properties file into a dict"""
+    properties = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith(("#", "!")) and "=" in line:
+                    key, value = line.split("=", 1)
+                    properties[key.strip()] = value.strip()
+    return properties
+
+def update_properties(path, updates):
+    """Set keys in a .properties file, keeping other lines, comments and order intact"""
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    remaining = dict(updates)
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped and not stripped.startswith(("#", "!")) and "=" in stripped:
+            key = stripped.split("=", 1)[0].strip()
+            if key in remaining:
+                lines[i] = f"{key}={remaining.pop(key)}"
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+# Bukkit, Spigot and Paper write block-style YAML. Settings are edited line by
+# line, like .properties files, so comments and everything else stay untouched
+# and PyYAML is not needed.
+YAML_KEY = re.compile(r"""^( *)([^\s#'"\-][^:#]*?|'[^']*'|"[^"]*"):(?:\s+(.*?))?\s*$""")
+
+def format_setting(value):
+    """A setting value as written to .properties and YAML files"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def yaml_scalar(value):
+    text = format_setting(value)
+    if not text or text != text.strip() or re.search(r"""[:#{}\[\],&*!|>'"%@`]""", text):
+        return json.dumps(text)
+    return text
+
+def parse_yaml_scalar(text):
+    text = (text or "").strip()
+    if text[:1] in ("'", '"'):
+        end = text.find(text[0], 1)
+        return text[1:end] if end > 0 else text[1:]
+    return text.split(" #", 1)[0].strip() or None  # A bare "key:" opens a nested block
+
+def scan_yaml(lines):
+    """Map each mapping key path in YAML lines to (line index, indent); list items are skipped"""
+    keys, stack = {}, []
+    for i, line in enumerate(lines):
+        match = YAML_KEY.match(line)
+        if not match:
+            continue
+        indent = len(match.group(1))
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        stack.append((indent, match.group(2).strip("'\"")))
+        keys[tuple(key for _, key in stack)] = (i, indent)
+    return keys
+
+def yaml_block_end(lines, start, indent):
+    """Index of the last line belonging to the key on line start"""
+    end = start
+    for i in range(start + 1, len(lines)):
+        stripped = lines[i].strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if len(lines[i]) - len(lines[i].lstrip(" ")) <= indent:
+            break
+        end = i
+    return end
+
+def read_yaml_values(path, keys):
+    """Current values of dotted keys in a YAML file; None where unset"""
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    found = scan_yaml(lines)
+    values = {}
+    for key in keys:
+        entry = found.get(tuple(key.split(".")))
+        values[key] = parse_yaml_scalar(YAML_KEY.match(lines[entry[0]]).group(3)) if entry else None
+    return values
+
+def update_yaml(path, updates):
+    """Set dotted keys in a YAML file, adding missing parents and keeping other lines intact"""
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    for dotted, value in updates.items():
+        path_keys = tuple(dotted.split("."))
+        keys = scan_yaml(lines)
+        if path_keys in keys:
+            i, indent = keys[path_keys]
+            match = YAML_KEY.match(lines[i])
+            lines[i] = f"{match.group(1)}{match.group(2)}: {yaml_scalar(value)}"
+            continue
+        # Insert the missing part of the path at the end of its deepest existing parent
+        depth = max((n for n in range(len(path_keys)) if path_keys[:n] in keys), default=0)
+        if depth:
+            i, parent_indent = keys[path_keys[:depth]]
+            at = yaml_block_end(lines, i, parent_indent) + 1
+            siblings = [indent for key, (_, indent) in keys.items() if len(key) == depth + 1 and key[:depth] == path_keys[:depth]]
+            step = (siblings[0] - parent_indent) if siblings else 2
+            indent = parent_indent + step
+        else:
+            at, indent, step = len(lines), 0, 2
+        new_lines = []
+        for key in path_keys[depth:-1]:
+            new_lines.append(f"{' ' * indent}{key}:")
+            indent += step
+        new_lines.append(f"{' ' * indent}{path_keys[-1]}: {yaml_scalar(value)}")
+        lines[at:at] = new_lines
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+def new_server_directory(server_name):
+    """Create (and hide) the directory for a new server"""
+    server_dir_name = f"minecraft_server_{server_name}"
+    server_dir = os.path.join(os.path.expanduser("~"), server_dir_name)
+    os.makedirs(server_dir, exist_ok=True)
+    
+    # Hide the folder
+    return hide_folder(server_dir) or server_dir
+
+def create_server(server_name, version, server_type="vanilla", implementation="java", progress=None, cancel=None, profile=None):
+    """Create a new Minecraft server, optionally tuned with a performance profile"""
+    server_dir = new_server_directory(server_name)
+    
+    # Resolve and fetch the server through the shared artifact store
+    try:
+        artifact = resolve_artifact(implementation, server_type, version)
+        launcher = get_launcher(implementation, server_type)
+        artifact_key = install_artifact(artifact, server_dir, launcher['file'], progress, cancel)
+    except Exception:
+        if not os.listdir(server_dir):
+            os.rmdir(server_dir)  # Don't leave an empty folder behind a failed or cancelled install
+        raise
+    
+    # Create essential files
+    if launcher['runtime'] == "java":
+        eula_path = os.path.join(server_dir, "eula.txt")
+        with open(eula_path, 'w') as f:
+            f.write("eula=true\n")
+    
+    # Enable RCON so the manager can send acknowledged commands
+    rcon_port = configure_rcon(server_dir) if supports_rcon(implementation, server_type) else None
+    
+    # Save to server data
+    register_server({
+        'name': server_name,
+        'version': version,
+        'type': server_type,
+        'implementation': implementation,
+        'path': server_dir,
+        'artifact': artifact_key,
+        'rcon_port': rcon_port,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S")
+    })
+    if profile:
+        apply_profile(server_dir, profile)
+    
+    return server_dir
+
+# Performance profiles: presets merged into server.properties and, for Paper,
+# bukkit.yml, spigot.yml and Paper's own config. Only the listed keys are set;
+# everything else in the files is kept. Every profile sets what "pregen" turns
+# off, so switching away from it brings mobs and the watchdog back.
+PERFORMANCE_PROFILES = {
+    "low-latency": {
+        'description': "Responsive play for a few players: moderate view distance, quick chunk saves",
+        'properties': {"view-distance": 8, "simulation-distance": 6, "network-compression-threshold": 512,
+                       "entity-broadcast-range-percentage": 75, "sync-chunk-writes": False,
+                       "max-tick-time": 60000, "spawn-monsters": True, "spawn-animals": True},
+        'bedrock': {"view-distance": 16, "tick-distance": 4, "compression-threshold": 512},
+        'bukkit': {"spawn-limits.monsters": 50, "spawn-limits.animals": 8, "spawn-limits.water-animals": 3,
+                   "spawn-limits.water-ambient": 5, "spawn-limits.ambient": 1, "ticks-per.monster-spawns": 2,
+                   "chunk-gc.period-in-ticks": 400},
+        'spigot': {"world-settings.default.entity-activation-range.animals": 16,
+                   "world-settings.default.entity-activation-range.monsters": 24,
+                   "world-settings.default.entity-activation-range.raiders": 48,
+                   "world-settings.default.entity-activation-range.misc": 8,
+                   "world-settings.default.entity-activation-range.water": 8,
+                   "world-settings.default.entity-activation-range.villagers": 16,
+                   "world-settings.default.merge-radius.item": 3.5, "world-settings.default.merge-radius.exp": 4.0,
+                   "world-settings.default.mob-spawn-range": 6, "settings.timeout-time": 60},
+        'paper': {"chunks.max-auto-save-chunks-per-tick": 8, "chunks.delay-chunk-unloads-by": "10s",
+                  "chunks.prevent-moving-into-unloaded-chunks": True,
+                  "collisions.max-entity-collisions": 2, "environment.optimize-explosions": True,
+                  "tick-rates.grass-spread": 4, "tick-rates.mob-spawner": 2, "hopper.disable-move-event": True},
+        'paper-legacy': {"max-auto-save-chunks-per-tick": 8, "delay-chunk-unloads-by": "10s",
+                         "prevent-moving-into-unloaded-chunks": True,
+                         "max-entity-collisions": 2, "optimize-explosions": True, "grass-spread-tick-rate": 4,
+                         "mob-spawner-tick-rate": 2, "hopper.disable-move-event": True},
+    },
+    "high-density": {
+        'description': "Many servers on one small host: short view and simulation distances, lean mob caps",
+        'properties': {"view-distance": 6, "simulation-distance": 4, "network-compression-threshold": 256,
+                       "entity-broadcast-range-percentage": 50, "sync-chunk-writes": False,
+                       "max-tick-time": 60000, "spawn-monsters": True, "spawn-animals": True},
+        'bedrock': {"view-distance": 10, "tick-distance": 4, "compression-threshold": 256},
+        'bukkit': {"spawn-limits.monsters": 30, "spawn-limits.animals": 5, "spawn-limits.water-animals": 2,
+                   "spawn-limits.water-ambient": 2, "spawn-limits.ambient": 1, "ticks-per.monster-spawns": 4,
+                   "ticks-per.animal-spawns": 400, "chunk-gc.period-in-ticks": 300},
+        'spigot': {"world-settings.default.entity-activation-range.animals": 12,
+                   "world-settings.default.entity-activation-range.monsters": 16,
+                   "world-settings.default.entity-activation-range.raiders": 32,
+                   "world-settings.default.entity-activation-range.misc": 4,
+                   "world-settings.default.entity-activation-range.water": 4,
+                   "world-settings.default.entity-activation-range.villagers": 12,
+                   "world-settings.default.merge-radius.item": 4.0, "world-settings.default.merge-radius.exp": 6.0,
+                   "world-settings.default.mob-spawn-range": 4, "world-settings.default.nerf-spawner-mobs": True,
+                   "settings.timeout-time": 60},
+        'paper': {"chunks.max-auto-save-chunks-per-tick": 6, "chunks.delay-chunk-unloads-by": "5s",
+                  "chunks.prevent-moving-into-unloaded-chunks": True, "collisions.max-entity-collisions": 2,
+                  "environment.optimize-explosions": True, "entities.armor-stands.tick": False,
+                  "tick-rates.grass-spread": 4, "tick-rates.container-update": 2, "hopper.disable-move-event": True},
+        'paper-legacy': {"max-auto-save-chunks-per-tick": 6, "delay-chunk-unloads-by": "5s",
+                         "prevent-moving-into-unloaded-chunks": True, "max-entity-collisions": 2,
+                         "optimize-explosions": True, "armor-stands-tick": False, "grass-spread-tick-rate": 4,
+                         "container-update-tick-rate": 2, "hopper.disable-move-event": True},
+    },
+    "pregen": {
+        'description': "Pre-generating a world before players join: no mob spawning, no tick watchdog",
+        'properties': {"view-distance": 4, "simulation-distance": 4, "sync-chunk-writes": False,
+                       "max-tick-time": -1, "spawn-monsters": False, "spawn-animals": False},
+        'bedrock': {"view-distance": 10, "tick-distance": 4},
+        'bukkit': {"spawn-limits.monsters": 0, "spawn-limits.animals": 0, "spawn-limits.water-animals": 0,
+                   "spawn-limits.water-ambient": 0, "spawn-limits.ambient": 0, "chunk-gc.period-in-ticks": 200},
+        'spigot': {"world-settings.default.entity-activation-range.animals": 8,
+                   "world-settings.default.entity-activation-range.monsters": 8,
+                   "world-settings.default.entity-activation-range.misc": 4,
+                   "settings.timeout-time": 600},
+        'paper': {"chunks.max-auto-save-chunks-per-tick": 48, "chunks.delay-chunk-unloads-by": "1s",
+                  "environment.optimize-explosions": True},
+        'paper-legacy': {"max-auto-save-chunks-per-tick": 48, "delay-chunk-unloads-by": "1s",
+                         "optimize-explosions": True},
+    },
+}
+
+# Paper moved its settings from paper.yml into config/ in 1.19
+PAPER_WORLD_CONFIG = os.path.join("config", "paper-world-defaults.yml")
+
+def uses_legacy_paper_config(server):
+    """Whether a Paper server keeps its settings in paper.yml rather than config/"""
+    if os.path.exists(os.path.join(server['path'], PAPER_WORLD_CONFIG)):
+        return False
+    if os.path.exists(os.path.join(server['path'], "paper.yml")):
+        return True
+    return tuple(int(n) for n in re.findall(r"\d+", server['version'])[:2]) < (1, 19)
+
+def profile_targets(server, profile):
+    """The settings a profile sets on a server, as {config file: {key: value}}"""
+    if profile not in PERFORMANCE_PROFILES:
+        raise ValueError(f"Unknown profile {profile}; choose from {', '.join(PERFORMANCE_PROFILES)}")
+    settings = PERFORMANCE_PROFILES[profile]
+    if server['implementation'] == "bedrock":
+        # PocketMine and Nukkit have their own config formats
+        return {"server.properties": settings['bedrock']} if server['type'] == "vanilla" else {}
+    targets = {"server.properties": settings['properties']}
+    if server['type'] == "paper":
+        targets["bukkit.yml"] = settings['bukkit']
+        targets["spigot.yml"] = settings['spigot']
+        if uses_legacy_paper_config(server):
+            targets["paper.yml"] = {f"world-settings.default.{k}": v for k, v in settings['paper-legacy'].items()}
+        else:
+            targets[PAPER_WORLD_CONFIG] = settings['paper']
+    return targets
+
+def read_settings(path, keys):
+    if path.endswith(".yml"):
+        return read_yaml_values(path, keys)
+    properties = read_properties(path)
+    return {key: properties.get(key) for key in keys}
+
+def profile_diff(server_directory, profile=None):
+    """What applying a profile would change: [file, key, current, wanted] rows, current None if unset.
+
+    Defaults to the server's own profile, showing where its files have drifted from it.
+    """
+    server = get_server(path=server_directory)
+    profile = profile or server.get('profile')
+    if not profile:
+        return []
+    changes = []
+    for filename, settings in profile_targets(server, profile).items():
+        current = read_settings(os.path.join(server_directory, filename), settings)
+        for key, value in settings.items():
+            if current[key] != format_setting(value):
+                changes.append([filename, key, current[key], format_setting(value)])
+    return changes
+
+def apply_profile(server_directory, profile=None):
+    """Merge a profile into a server's config files and record it; returns the changes made.
+
+    YAML files that a server writes on its first boot are patched once they
+    exist (see apply_pending_profile). Takes effect on the next start.
+    """
+    server = get_server(path=server_directory)
+    profile = profile or server.get('profile')
+    changes, pending = [], []
+    for filename, settings in profile_targets(server, profile).items():
+        path = os.path.join(server_directory, filename)
+        if filename.endswith(".yml") and not os.path.exists(path):
+            pending.append(filename)
+            continue
+        current = read_settings(path, settings)
+        updates = {key: value for key, value in settings.items() if current[key] != format_setting(value)}
+        if not updates:
+            continue
+        if filename.endswith(".yml"):
+            update_yaml(path, updates)
+        else:
+            update_properties(path, {key: format_setting(value) for key, value in updates.items()})
+        changes.extend([filename, key, current[key], format_setting(value)] for key, value in updates.items())
+    update_server(server_directory, profile=profile, profile_pending=pending)
+    return changes
+
+def apply_pending_profile(server_directory):
+    """Patch the profile into config files the server has generated since it was applied"""
+    server = get_server(path=server_directory)
+    if server and server.get('profile_pending') and any(
+            os.path.exists(os.path.join(server_directory, f)) for f in server['profile_pending']):
+        apply_profile(server_directory)
+
+def print_profile_diff(servers, profile=None):
+    """Print the settings that differ from a profile (default: each server's own); returns how many"""
+    total = 0
+    for server in servers:
+        name = profile or server.get('profile')
+        if not name:
+            print(f"{server['name']}: no profile")
+            continue
+        changes = profile_diff(server['path'], name)
+        print(f"{server['name']} ({server['type']} {server['version']}) vs {name}: "
+              f"{len(changes)} setting{'s' if len(changes) != 1 else ''} differ")
+        for filename, key, current, wanted in changes:
+            print(f"  {filename:32} {key:58} {'(unset)' if current is None else current} -> {wanted}")
+        total += len(changes)
+    return total
+
+# Templates: an initialized server whose files seed new servers. Files that never
+# change after install are hardlinked; everything else is copied (reflinked where
+# the filesystem supports it) so clones can diverge.
+TEMPLATE_SHARED_DIRS = ("libraries", "versions", "bundler", "cache")
+TEMPLATE_SHARED_SUFFIXES = (".jar", ".phar", "bedrock_server", "bedrock_server.exe")
+TEMPLATE_SKIPPED = ("logs", "crash-reports")
+
+def mark_template(server_directory, enabled=True):
+    """Mark a registered server as a template for cloning"""
+    server = update_server(server_directory, template=enabled)
+    if server is None:
+        raise ValueError(f"Unknown server: {server_directory}")
+    return server
+
+def copy_file_fast(src, dst):
+    """Copy a file, using a copy-on-write reflink when the filesystem allows it"""
+    if reflink_file(src, dst):
+        shutil.copystat(src, dst)
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+def clone_server(template_name, server_name):
+    """Create a new server from a template; returns its directory"""
+    template = get_server(name=template_name)
+    if not template or not template.get('template'):
+        raise ValueError(f"{template_name} is not a template (mark it first)")
+    if get_server(name=server_name):
+        raise ValueError(f"A server named {server_name} already exists")
+    if get_server_pid(template['path']):
+        raise RuntimeError(f"Stop {template_name} before cloning it")
+    
+    src_root = template['path']
+    server_dir = new_server_directory(server_name)
+    for root, dirs, files in os.walk(src_root):
+        rel_root = os.path.relpath(root, src_root)
+        top = rel_root.split(os.sep)[0]
+        if rel_root == ".":
+            dirs[:] = [d for d in dirs if d not in TEMPLATE_SKIPPED and not d.startswith(".restore-")]
+        os.makedirs(os.path.join(server_dir, rel_root), exist_ok=True)
+        for filename in files:
+            src = os.path.join(root, filename)
+            dst = os.path.join(server_dir, rel_root, filename)
+            if top in TEMPLATE_SHARED_DIRS or filename.endswith(TEMPLATE_SHARED_SUFFIXES):
+                link_file(src, dst)
+            else:
+                copy_file_fast(src, dst)
+    
+    artifact = template.get('artifact')
+    if artifact:
+        try:
+            store_add_ref(artifact, server_dir)
+        except ValueError as e:
+            print(f"{e}; {server_name} will fetch its server file again on the next upgrade")
+            artifact = None
+    rcon_port = None
+    if supports_rcon(template['implementation'], template['type']):
+        rcon_port = configure_rcon(server_dir, regenerate=True)
+    
+    register_server({
+        'name': server_name,
+        'version': template['version'],
+        'type': template['type'],
+        'implementation': template['implementation'],
+        'path': server_dir,
+        'artifact': artifact,
+        'rcon_port': rcon_port,
+        'cloned_from': template_name,
+        'profile': template.get('profile'),  # Its tuned config files were copied too
+        'created': time.strftime("%Y-%m-%d %H:%M:%S")
+    })
+    return server_dir
+
+def print_lineage():
+    """Print each template with the servers cloned from it"""
+    servers = list_servers()
+    templates = [s for s in servers if s.get('template')]
+    if not templates:
+        print("No templates")
+    for template in templates:
+        clones = [s['name'] for s in servers if s.get('cloned_from') == template['name']]
+        print(f"{template['name']} ({template['type']} {template['version']}): {', '.join(clones) or 'no clones'}")
+    orphans = [s for s in servers if s.get('cloned_from') and s['cloned_from'] not in {t['name'] for t in templates}]
+    for server in orphans:
+        print(f"{server['name']}: cloned from {server['cloned_from']} (no longer a template)")
+
+def console_progress(downloaded, total, rate):
+    """Download progress callback that prints to the console"""
+    if total:
+        print(f"Downloading... {downloaded / total * 100:.1f}% ({rate / 1024 / 1024:.1f} MB/s)", end='\r')
+        if downloaded >= total:
+            print("\nDownload complete.")
+
+def probe_download(url):
+    """HEAD a URL; returns (size or None, accepts byte ranges, etag)"""
+    import requests
+    try:
+        r = get_http_session().head(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
+        r.raise_for_status()
+    except requests.RequestException:
+        return None, False, None
+    size = int(r.headers['content-length']) if r.headers.get('content-length', '').isdigit() else None
+    ranges = r.headers.get('accept-ranges', '').lower() == 'bytes' and bool(size)
+    return size or None, ranges, r.headers.get('etag')
+
+def revalidate_download(url, validators):
+    """Ask whether a download has changed since it was stored; returns (changed, validators).
+
+    A conditional GET with the ETag/Last-Modified recorded at download time;
+    only the headers are read. validators are those of the current content.
+    If the host cannot be reached the stored copy is taken as current.
+    """
+    import requests
+    validators = validators or {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    try:
+        with get_http_session().get(url, headers=headers, stream=True, allow_redirects=True, timeout=HTTP_TIMEOUT) as r:
+            if r.status_code == 304:
+                return False, validators
+            r.raise_for_status()
+            current = {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified'),
+                       'size': int(r.headers['content-length']) if r.headers.get('content-length', '').isdigit() else None}
+    except requests.RequestException:
+        return False, validators  # Offline: keep using what we have
+    # Hosts that ignore conditional requests still answer with the same validators
+    if current['etag'] and current['etag'] == validators.get('etag'):
+        return False, validators
+    if (current['last_modified'] and current['size'] is not None
+            and (current['last_modified'], current['size']) == (validators.get('last_modified'), validators.get('size'))):
+        return False, validators
+    return True, current
+
+def split_segments(size, count):
+    """Split [0, size) into up to count inclusive byte ranges of at least DOWNLOAD_MIN_SEGMENT"""
+    count = max(1, min(count, size // DOWNLOAD_MIN_SEGMENT))
+    step = -(-size // count)
+    return [{'start': i, 'end': min(i + step, size) - 1, 'done': 0} for i in range(0, size, step)]
+
+def contiguous_bytes(state):
+    """Length of the unbroken prefix already written to a partial download"""
+    for seg in state['segments']:
+        if seg['end'] is None or seg['start'] + seg['done'] <= seg['end']:
+            return seg['start'] + seg['done']
+    return state['size']
+
+class DownloadCancelled(Exception):
+    pass
+
+def download_file(url, file_path, expected_hash=None, progress=None, segments=None, cancel=None, stream=None):
+    """Download url to file_path over parallel HTTP Range segments.
+
+    Data is written to file_path + ".part" with a ".part.json" sidecar that
+    records per-segment progress, so an interrupted download resumes where it
+    stopped. The file is renamed into place only after its checksum matches
+    expected_hash ("algo:hex"). progress(downloaded, total, bytes_per_sec) is
+    called as data arrives, and stream(part_path, available) whenever the
+    unbroken prefix of the partial file grows, so it can be consumed before
+    the download ends; stream(part_path, None) then says the partial file is
+    about to be renamed and must no longer be open. Setting the cancel event stops the download with
+    DownloadCancelled, keeping the partial file for a later resume. Returns
+    the "algo:hex" digest of the file; raises on failure.
+    """
+    import requests
+    import concurrent.futures
+    part_path = file_path + ".part"
+    state_path = part_path + ".json"
+    if segments is None:
+        segments = get_config()["download_segments"]
+    size, ranges, etag = probe_download(url)
+    
+    state = None
+    if ranges and os.path.exists(part_path) and os.path.exists(state_path):
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if (state['url'], state['size'], state['etag']) != (url, size, etag):
+                state = None
+        except:
+            state = None
+    if state is None:
+        state = {
+            'url': url, 'size': size, 'etag': etag,
+            'segments': split_segments(size, segments) if ranges else [{'start': 0, 'end': None, 'done': 0}]
+        }
+        with open(part_path, 'wb') as f:
+            if size:
+                f.truncate(size)
+    
+    lock = threading.Lock()
+    resumed = sum(seg['done'] for seg in state['segments'])
+    counters = {'downloaded': resumed, 'saved': time.time()}
+    started = time.time()
+    
+    def report(count):
+        with lock:
+            counters['downloaded'] += count
+            downloaded = counters['downloaded']
+            if time.time() - counters['saved'] > 1:
+                counters['saved'] = time.time()
+                write_json_atomic(state_path, state)
+            available = contiguous_bytes(state) if stream else None
+        if stream:
+            stream(part_path, available)
+        if progress:
+            rate = (downloaded - resumed) / max(time.time() - started, 1e-6)
+            progress(downloaded, size, rate)
+    
+    def fetch(seg):
+        failures = 0
+        while True:
+            headers = {}
+            if ranges:
+                offset = seg['start'] + seg['done']
+                if offset > seg['end']:
+                    return
+                headers['Range'] = f"bytes={offset}-{seg['end']}"
+            else:
+                report(-seg['done'])  # No range support: restart from zero
+                seg['done'] = offset = 0
+            try:
+                with get_http_session().get(url, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as r:
+                    r.raise_for_status()
+                    if ranges and r.status_code != 206:
+                        raise RuntimeError(f"Server ignored Range request for {url}")
+                    with open(part_path, 'r+b', buffering=0) as f:
+                        f.seek(offset)
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            if cancel is not None and cancel.is_set():
+                                raise DownloadCancelled(f"Download of {url} cancelled")
+                            f.write(chunk)
+                            seg['done'] += len(chunk)
+                            report(len(chunk))
+                if not ranges or seg['start'] + seg['done'] > seg['end']:
+                    return
+                raise RuntimeError("Connection closed before the segment completed")
+            except (requests.RequestException, OSError, RuntimeError):
+                failures += 1
+                if failures >= DOWNLOAD_RETRIES:
+                    raise
+                time.sleep(2 ** failures)
+    
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(state['segments'])) as pool:
+            for future in [pool.submit(fetch, seg) for seg in state['segments']]:
+                future.result()
+    except DownloadCancelled:
+        write_json_atomic(state_path, state)
+        raise
+    except Exception as e:
+        write_json_atomic(state_path, state)
+        raise RuntimeError(f"Download failed: {e}")
+    if stream:
+        stream(part_path, None)  # Windows cannot rename or remove a file someone has open
+    
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    if size is not None and sum(seg['done'] for seg in state['segments']) != size:
+        os.remove(part_path)
+        raise RuntimeError(f"Download of {url} is incomplete")
+    
+    algorithm = expected_hash.split(":", 1)[0] if expected_hash else "sha1"
+    key = f"{algorithm}:{hash_file(part_path, algorithm)}"
+    if expected_hash and key != expected_hash.lower():
+        os.remove(part_path)
+        raise ValueError(f"Checksum mismatch for {url}: expected {expected_hash}, got {key}")
+    os.replace(part_path, file_path)
+    return key
+
+# Content-addressed artifact store: objects live under store/objects/<algo>/<xx>/<hex>
+# and are linked into server directories, so identical jars are downloaded once.
+store_lock = FileLock(os.path.join(ARTIFACT_STORE_DIR, ".lock"))  # The daemon and CLI runs share the index
+download_locks_lock = threading.Lock()
+download_locks = {}
+host_semaphores = {}
+
+def host_semaphore(url):
+    """Semaphore bounding concurrent downloads from the host serving url"""
+    from urllib.parse import urlsplit
+    host = urlsplit(url).netloc
+    with download_locks_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(get_config()["downloads_per_host"])
+        return host_semaphores[host]
+
+def hash_file(path, algorithm="sha1"):
+    """Compute the hex digest of a file"""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def store_object_path(key):
+    """Path of a store object for an "algo:hex" key"""
+    algorithm, hexdigest = key.split(":", 1)
+    return os.path.join(ARTIFACT_STORE_DIR, "objects", algorithm, hexdigest[:2], hexdigest)
+
+def load_store_index():
+    """Load the artifact store index"""
+    if os.path.exists(ARTIFACT_INDEX_FILE):
+        try:
+            with open(ARTIFACT_INDEX_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return {'objects': {}}
+
+def reflink_file(src, dst):
+    """Copy-on-write clone src to dst (Linux FICLONE); returns False if unsupported"""
+    if platform.system() != "Linux":
+        return False
+    try:
+        import fcntl
+        FICLONE = 0x40049409
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except Exception:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+def link_file(src, dst):
+    """Place src at dst as a hardlink, falling back to a reflink and then a copy"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if reflink_file(src, dst):
+        return "reflink"
+    shutil.copyfile(src, dst)
+    return "copy"
+
+def store_add_file(file_path, key, url=None, validators=None):
+    """Move a verified file into the store under key ("algo:hex"); returns the key.
+
+    validators (ETag, Last-Modified, size) let a later fetch of a URL without
+    a published checksum ask whether it still serves the same file.
+    """
+    object_path = store_object_path(key)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    if platform.system() != "Windows":
+        os.chmod(file_path, 0o444)  # Objects are shared via hardlinks; never edit in place
+    os.replace(file_path, object_path)
+    
+    with store_lock:
+        index = load_store_index()
+        entry = index['objects'].setdefault(key, {'refs': []})
+        entry.update({'size': os.path.getsize(object_path), 'last_used': time.time(), 'fetched': time.time(), 'url': url})
+        if validators:
+            entry['validators'] = validators
+        write_json_atomic(ARTIFACT_INDEX_FILE, index)
+    return key
+
+def store_fetch(artifact, dest_path, server_dir, progress=None, cancel=None, stream=None):
+    """Link an artifact into dest_path, downloading it into the store only if missing.
+
+    With dest_path=None the object is only fetched and referenced. stream is
+    passed on to download_file and is not called if the object was cached.
+    """
+    key = artifact.get('hash')
+    with download_locks_lock:
+        url_lock = download_locks.setdefault(artifact['url'], threading.Lock())
+    with url_lock:  # Concurrent installs of one artifact share a single download
+        validators = None
+        if not key:
+            # No published checksum: reuse the newest object fetched from this URL if
+            # the URL names one fixed build, or if the host says it has not changed
+            fetched = [(e.get('fetched', 0), k, e) for k, e in load_store_index()['objects'].items()
+                       if e.get('url') == artifact['url'] and os.path.exists(store_object_path(k))]
+            entry = None
+            if fetched:
+                _, key, entry = max(fetched, key=lambda f: f[0])
+            if not artifact.get('pinned'):
+                # Also run before a first download, to record what to revalidate against
+                changed, validators = revalidate_download(artifact['url'], entry and entry.get('validators'))
+                if changed:
+                    key = None
+        if not (key and os.path.exists(store_object_path(key))):
+            tmp_dir = os.path.join(ARTIFACT_STORE_DIR, "tmp")
+            os.makedirs(tmp_dir, exist_ok=True)
+            # Stable name so an interrupted download resumes on the next attempt
+            tmp_path = os.path.join(tmp_dir, hashlib.sha1(artifact['url'].encode()).hexdigest())
+            with host_semaphore(artifact['url']):
+                key = download_file(artifact['url'], tmp_path, artifact.get('hash'), progress, cancel=cancel, stream=stream)
+            store_add_file(tmp_path, key, artifact['url'], validators)
+    
+    with store_lock:  # Referenced before a collection in another process can evict it
+        if dest_path:
+            link_file(store_object_path(key), dest_path)
+        store_add_ref(key, server_dir)
+    gc_artifact_store()
+    return key
+
+def store_add_ref(key, server_dir):
+    """Record that a server directory uses a store object.
+
+    If the object has been evicted meanwhile (say while its server sat in the
+    trash), it is put back from the server's own copy of the file; raises
+    ValueError if the server has none.
+    """
+    with store_lock:
+        index = load_store_index()
+        entry = index['objects'].get(key)
+        if entry is None:
+            object_path = store_object_path(key)
+            if not os.path.exists(object_path):
+                restore_store_object(key, server_dir)
+            entry = index['objects'][key] = {'refs': [], 'size': os.path.getsize(object_path), 'url': None}
+        if server_dir is not None and server_dir not in entry['refs']:  # None: fetched for a bundle
+            entry['refs'].append(server_dir)
+        entry['last_used'] = time.time()
+        write_json_atomic(ARTIFACT_INDEX_FILE, index)
+
+def restore_store_object(key, server_dir):
+    """Put an evicted object back in the store from a server directory's copy of it"""
+    algorithm = key.split(":", 1)[0]
+    names = {launcher['file'] for launcher in SERVER_LAUNCHERS.values()} | {JAVA_LAUNCHER['file']}
+    for name in sorted(names) if server_dir else []:
+        path = os.path.join(server_dir, name)
+        if os.path.isfile(path) and f"{algorithm}:{hash_file(path, algorithm)}" == key:
+            object_path = store_object_path(key)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{os.getpid()}.tmp"
+            link_file(path, tmp_path)
+            if platform.system() != "Windows":
+                os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, object_path)
+            return
+    raise ValueError(f"Store object {key} has been evicted and {server_dir} has no copy of it")
+
+def store_release(server_dir, key=None):
+    """Drop the store references held by a server directory (every one, or just key's)"""
+    with store_lock:
+        index = load_store_index()
+        for object_key, entry in index['objects'].items():
+            if server_dir in entry['refs'] and key in (None, object_key):
+                entry['refs'].remove(server_dir)
+                entry['last_used'] = time.time()
+        write_json_atomic(ARTIFACT_INDEX_FILE, index)
+    gc_artifact_store()
+
+def gc_artifact_store(max_bytes=None):
+    """Evict least recently used unreferenced objects until the store fits the size cap"""
+    if max_bytes is None:
+        max_bytes = get_config()["store_max_bytes"]
+    removed = []
+    with store_lock:
+        index = load_store_index()
+        total = sum(e.get('size') or 0 for e in index['objects'].values())
+        unreferenced = sorted(
+            (k for k, e in index['objects'].items() if not e['refs'] and not e.get('pinned')),
+            key=lambda k: index['objects'][k].get('last_used', 0)
+        )
+        for key in unreferenced:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(store_object_path(key))
+            except FileNotFoundError:
+                pass
+            total -= index['objects'].pop(key).get('size') or 0
+            removed.append(key)
+        if removed:
+            write_json_atomic(ARTIFACT_INDEX_FILE, index)
+    return removed
+
+def verify_artifact_store():
+    """Re-hash every store object; corrupt or missing objects are dropped from the index"""
+    bad = []
+    with store_lock:
+        index = load_store_index()
+        for key in list(index['objects']):
+            path = store_object_path(key)
+            algorithm, expected = key.split(":", 1)
+            if not os.path.exists(path) or hash_file(path, algorithm) != expected:
+                bad.append(key)
+                index['objects'].pop(key)
+                if os.path.exists(path):
+                    os.remove(path)
+        if bad:
+            write_json_atomic(ARTIFACT_INDEX_FILE, index)
+    return bad
+
+# Offline bundles: resolved artifacts packed with their index into one
+# uncompressed zip (members stay at fixed offsets, so they can be copied or
+# served by range without inflating anything). An imported bundle pins its
+# resolutions and objects in the store; a mirror (a bundle file or an HTTP
+# server for one) replaces every online resolver.
+BUNDLE_INDEX_NAME = "bundle.json"
+BUNDLE_PINS_FILE = os.path.join(ARTIFACT_STORE_DIR, "bundles.json")
+
+def bundle_target_key(implementation, server_type, version):
+    return f"{implementation}/{server_type}/{version}"
+
+def bundle_object_name(key):
+    algorithm, hexdigest = key.split(":", 1)
+    return f"objects/{algorithm}/{hexdigest}"
+
+def parse_bundle_targets(text):
+    """(implementation, type, version) targets from "type:version", "implementation/type:version",
+    fleet spec paths and "registered", separated by commas"""
+    targets = []
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        if item == "registered":
+            targets.extend((s['implementation'], s['type'], s['version']) for s in list_servers())
+        elif item.endswith((".json", ".yaml", ".yml")) and os.path.exists(item):
+            _, servers = load_fleet_spec(item)
+            targets.extend((s['implementation'], s['type'], s['version']) for s in servers if s.get('version'))
+        elif ":" in item:
+            kind, version = item.split(":", 1)
+            implementation, _, server_type = kind.rpartition("/")
+            targets.append((implementation or "java", server_type, version))
+        else:
+            raise ValueError(f"Bundle target {item} is not type:version, a fleet spec or 'registered'")
+    return sorted(set(targets))
+
+def read_bundle_index(bundle_path):
+    import zipfile
+    with zipfile.ZipFile(bundle_path) as zf:
+        return json.loads(zf.read(BUNDLE_INDEX_NAME))
+
+def export_bundle(bundle_path, targets, jobs=None):
+    """Resolve, fetch and verify artifacts and pack them with their index into one archive; returns the index"""
+    import concurrent.futures
+    import zipfile
+    fetched = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or get_config()["fleet_jobs"]) as pool:
+        futures = {pool.submit(lambda t: store_fetch(resolve_artifact(*t, refresh=True), None, None), target): target
+                   for target in targets}
+        for future in concurrent.futures.as_completed(futures):
+            fetched[futures[future]] = future.result()  # Any failure aborts the export
+    
+    index = {'format': 1, 'created': time.time(), 'artifacts': {}}
+    tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for target, key in sorted(fetched.items()):
+                artifact = resolve_artifact(*target)
+                if bundle_object_name(key) not in zf.NameToInfo:
+                    zf.write(store_object_path(key), bundle_object_name(key))
+                index['artifacts'][bundle_target_key(*target)] = {
+                    'url': artifact['url'], 'hash': key, 'size': os.path.getsize(store_object_path(key))
+                }
+                print(f"packed    {bundle_target_key(*target)}: {format_bytes(index['artifacts'][bundle_target_key(*target)]['size'])}")
+            zf.writestr(BUNDLE_INDEX_NAME, json.dumps(index, indent=2))
+        os.replace(tmp_path, bundle_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index
+
+def extract_bundle_object(bundle_path, entry):
+    """Copy one artifact out of a bundle into the store, verifying its checksum"""
+    import zipfile
+    key = entry['hash']
+    tmp_dir = os.path.join(ARTIFACT_STORE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, key.replace(":", "-") + ".bundle")
+    with zipfile.ZipFile(bundle_path) as zf, zf.open(bundle_object_name(key)) as src, open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    if f"{key.split(':', 1)[0]}:{hash_file(tmp_path, key.split(':', 1)[0])}" != key:
+        os.remove(tmp_path)
+        raise ValueError(f"Checksum mismatch for {key} in {bundle_path}")
+    return store_add_file(tmp_path, key, entry['url'])
+
+def load_bundle_pins():
+    if os.path.exists(BUNDLE_PINS_FILE):
+        try:
+            with open(BUNDLE_PINS_FILE, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return {'artifacts': {}}
+
+def import_bundle(bundle_path):
+    """Copy a bundle's artifacts into the store and pin its resolutions; returns the imported entries.
+    
+    Pinned artifacts are resolved without any network access and are never
+    evicted from the store.
+    """
+    index = read_bundle_index(bundle_path)
+    for entry in index['artifacts'].values():
+        if not os.path.exists(store_object_path(entry['hash'])):
+            extract_bundle_object(bundle_path, entry)
+    with store_lock:
+        store_index = load_store_index()
+        for entry in index['artifacts'].values():
+            if entry['hash'] in store_index['objects']:
+                store_index['objects'][entry['hash']]['pinned'] = True
+        write_json_atomic(ARTIFACT_INDEX_FILE, store_index)
+        pins = load_bundle_pins()
+        pins['artifacts'].update(index['artifacts'])
+        write_json_atomic(BUNDLE_PINS_FILE, pins)
+    with resolved_artifacts_lock:
+        resolved_artifacts.clear()
+    return index['artifacts']
+
+def is_http_mirror(source):
+    return source.startswith(("http://", "https://"))
+
+def load_mirror_index(source):
+    if is_http_mirror(source):
+        return fetch_json_cached(f"{source.rstrip('/')}/{BUNDLE_INDEX_NAME}")
+    return read_bundle_index(source)
+
+def mirror_artifact(source, implementation, server_type, version):
+    """Resolve an artifact from a mirror; raises ValueError if the mirror does not have it"""
+    entry = load_mirror_index(source)['artifacts'].get(bundle_target_key(implementation, server_type, version))
+    if entry is None:
+        raise ValueError(f"{implementation}/{server_type} {version} is not in the mirror {source}")
+    if is_http_mirror(source):
+        # Keep the upstream file name: it tells installers how to unpack the artifact
+        url = f"{source.rstrip('/')}/{bundle_object_name(entry['hash'])}/{entry['url'].rstrip('/').rsplit('/', 1)[-1]}"
+    else:
+        url = entry['url']
+        if not os.path.exists(store_object_path(entry['hash'])):
+            extract_bundle_object(source, entry)  # Store hits never touch the URL
+    return {'url': url, 'hash': entry['hash'], 'size': entry.get('size')}
+
+def bundle_versions(index, implementation):
+    """Versions an index has artifacts for, newest first"""
+    versions = {key.split("/", 2)[2] for key in index['artifacts'] if key.startswith(implementation + "/")}
+    return sorted(versions, key=lambda v: [int(n) for n in re.findall(r"\d+", v)], reverse=True)
+
+def bundle_member_offset(f, info):
+    """File offset of a stored zip member's data, past its local header"""
+    f.seek(info.header_offset)
+    name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+def serve_bundle(bundle_path, port=None):
+    """Serve a bundle as an HTTP mirror for other hosts in a background thread; returns the HTTP server"""
+    import http.server
+    import zipfile
+    port = port if port is not None else get_config()["mirror_port"]
+    members = {}
+    with zipfile.ZipFile(bundle_path) as zf, open(bundle_path, 'rb') as f:
+        index_body = zf.read(BUNDLE_INDEX_NAME)
+        for info in zf.infolist():
+            if info.filename.startswith("objects/") and info.compress_type == zipfile.ZIP_STORED:
+                members[info.filename] = (bundle_member_offset(f, info), info.file_size)
+    index_etag = f'"{hashlib.sha1(index_body).hexdigest()}"'
+    
+    class MirrorHandler(http.server.BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self.respond(send_body=False)
+        
+        def do_GET(self):
+            self.respond(send_body=True)
+        
+        def respond(self, send_body):
+            path = self.path.split("?")[0].lstrip("/")
+            if path == BUNDLE_INDEX_NAME:
+                if self.headers.get("If-None-Match") == index_etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(index_body)))
+                self.send_header("ETag", index_etag)
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(index_body)
+                return
+            # objects/<algo>/<hex>, optionally followed by the upstream file name
+            member = members.get("/".join(path.split("/")[:3]))
+            if member is None:
+                self.send_error(404)
+                return
+            offset, size = member
+            start, end = 0, size - 1
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    start = max(size - int(match.group(2)), 0)
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Content-Type", "application/octet-stream")
+            self.end_headers()
+            if send_body:
+                with open(bundle_path, 'rb') as f:
+                    self.connection.sendfile(f, offset + start, end - start + 1)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = http.server.ThreadingHTTPServer(("", port), MirrorHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Archive installs (Bedrock): the zip is unpacked front to back from its local
+# file headers while it downloads, so install time is about the download time.
+ARCHIVE_PRESERVED = ("server.properties", "allowlist.json", "whitelist.json", "permissions.json", "worlds")
+
+def artifact_format(url):
+    """How an artifact is installed: "zip" (unpacked), "phar" or "jar" (linked as one file)"""
+    from urllib.parse import urlsplit
+    path = urlsplit(url).path.lower()
+    if path.endswith(".zip"):
+        return "zip"
+    return "phar" if path.endswith(".phar") else "jar"
+
+class ZipStreamExtractor:
+    """Unpack a zip archive into dest without waiting for its central directory.
+
+    follow(path, available) is a download_file stream callback: a worker thread
+    unpacks each newly arrived stretch of the partial file, and stops once told
+    the download is complete. finish(path) unpacks
+    whatever is left from the complete archive and checks every CRC. Entries
+    that cannot be unpacked in order (stored with a trailing size, zip64) are
+    left for finish, which reads them through the central directory.
+    """
+    LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+    
+    def __init__(self, dest):
+        self.dest = os.path.abspath(dest)
+        self.condition = threading.Condition()
+        self.path = None
+        self.available = 0
+        self.closing = False
+        self.abandoned = False
+        self.error = None
+        self.worker = None
+        self.entry = None
+        self.reset()
+    
+    def reset(self):
+        """Start over from the first byte with an empty destination"""
+        self.close_entry()
+        self.buffer = b''
+        self.pos = 0  # Parse position in buffer
+        self.offset = 0  # Archive bytes read so far
+        self.descriptor = None  # CRC of an entry whose data descriptor is next
+        self.done = False  # Nothing more to unpack in order
+        self.deferred = False  # Stopped early; the remaining entries need the central directory
+        self.unpacked = set()
+        if os.path.isdir(self.dest):
+            shutil.rmtree(self.dest)
+        os.makedirs(self.dest)
+    
+    def close_entry(self):
+        if self.entry and self.entry['file']:
+            self.entry['file'].close()
+        self.entry = None
+    
+    def follow(self, path, available):
+        if available is None:  # The download is complete: let go of the partial file
+            self.stop()
+            return
+        with self.condition:
+            self.path = path
+            self.available = available
+            self.condition.notify()
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+    
+    def run(self):
+        try:
+            while not (self.done or self.abandoned):
+                with self.condition:
+                    while self.available == self.offset and not self.closing:
+                        self.condition.wait()
+                    available = self.available
+                if available == self.offset:
+                    return
+                if available < self.offset:  # The download restarted from zero
+                    self.reset()
+                    continue
+                # Opened per read, never held while waiting, so the downloader can rename it
+                with open(self.path, 'rb') as f:
+                    f.seek(self.offset)
+                    block = f.read(min(available - self.offset, 4 * DOWNLOAD_CHUNK_SIZE))
+                self.feed(block)
+        except Exception as e:
+            self.error = e
+    
+    def stop(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        if self.worker is not None:
+            self.worker.join()
+    
+    def finish(self, path):
+        """Unpack the rest of the complete archive at path; raises ValueError if it is damaged"""
+        import zipfile
+        self.stop()
+        if self.error:
+            raise self.error
+        with open(path, 'rb') as f:
+            f.seek(self.offset)
+            while not self.done:
+                block = f.read(1024 * 1024)
+                if not block:
+                    raise ValueError("Zip archive is truncated")
+                self.feed(block)
+        # Permissions only live in the central directory, which is here now
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if self.deferred and info.filename not in self.unpacked:
+                    self.target(info.filename)
+                    archive.extract(info, self.dest)
+                mode = (info.external_attr >> 16) & 0o777
+                if info.create_system == 3 and mode and not info.is_dir():
+                    os.chmod(self.target(info.filename), mode)
+    
+    def close(self):
+        """Stop following and remove whatever was unpacked but not merged"""
+        self.abandoned = True
+        self.stop()
+        self.close_entry()
+        if os.path.isdir(self.dest):
+            shutil.rmtree(self.dest, ignore_errors=True)
+    
+    def target(self, name):
+        path = os.path.normpath(os.path.join(self.dest, name.replace("\\", "/")))
+        if os.path.commonpath([self.dest, path]) != self.dest:
+            raise ValueError(f"Zip entry escapes the destination: {name}")
+        return path
+    
+    def feed(self, data):
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        self.offset += len(data)
+        while not self.done and self.step():
+            pass
+    
+    def step(self):
+        """Consume one record (or as much of an entry as is buffered); False when more bytes are needed"""
+        buffer, pos = self.buffer, self.pos
+        left = len(buffer) - pos
+        if self.descriptor is not None:
+            if left < 16:  # The central directory follows, so 16 bytes always arrive
+                return False
+            signed = buffer[pos:pos + 4] == b"PK\x07\x08"
+            crc = struct.unpack_from("<I", buffer, pos + 4 if signed else pos)[0]
+            if crc != self.descriptor:
+                raise ValueError("CRC mismatch in zip archive")
+            self.pos += 16 if signed else 12
+            self.descriptor = None
+            return True
+        
+        if self.entry is None:
+            if left < 4:
+                return False
+            signature = buffer[pos:pos + 4]
+            if signature in (b"PK\x01\x02", b"PK\x05\x06"):
+                self.done = True
+                return False
+            if signature != b"PK\x03\x04":
+                raise ValueError("Not a zip archive, or it is damaged")
+            if left < self.LOCAL_HEADER.size:
+                return False
+            fields = self.LOCAL_HEADER.unpack_from(buffer, pos)
+            flags, method, crc, compressed, name_length, extra_length = fields[2], fields[3], fields[6], fields[7], fields[9], fields[10]
+            header_length = self.LOCAL_HEADER.size + name_length + extra_length
+            if left < header_length:
+                return False
+            name_start = pos + self.LOCAL_HEADER.size
+            name = buffer[name_start:name_start + name_length].decode("utf-8" if flags & 0x800 else "cp437")
+            sized = not flags & 0x8
+            if flags & 0x1:
+                raise ValueError(f"Encrypted zip entry: {name}")
+            if method not in (0, 8) or compressed == 0xFFFFFFFF or (method == 0 and not sized):
+                self.done = self.deferred = True
+                return False
+            self.pos += header_length
+            path = self.target(name)
+            if name.endswith("/"):
+                os.makedirs(path, exist_ok=True)
+                handle = None
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handle = open(path, 'wb')
+            self.entry = {'file': handle, 'inflate': zlib.decompressobj(-15) if method == 8 else None,
+                          'remaining': compressed if sized else None, 'crc': crc if sized else None, 'actual': 0}
+            self.unpacked.add(name)
+            return True
+        
+        entry = self.entry
+        inflate = entry['inflate']
+        if entry['remaining'] is not None:
+            count = min(entry['remaining'], left)
+            chunk = memoryview(buffer)[pos:pos + count]
+            self.pos += count
+            entry['remaining'] -= count
+            data = inflate.decompress(chunk) if inflate else bytes(chunk)
+            if not entry['remaining'] and inflate:
+                data += inflate.flush()
+        else:
+            if not left:
+                return False
+            data = inflate.decompress(memoryview(buffer)[pos:])
+            self.pos = len(buffer) - len(inflate.unused_data)
+        entry['actual'] = zlib.crc32(data, entry['actual'])
+        if entry['file']:
+            entry['file'].write(data)
+        if entry['remaining'] or (entry['remaining'] is None and not inflate.eof):
+            return False
+        
+        self.close_entry()
+        if entry['crc'] is None:
+            self.descriptor = entry['actual']
+        elif entry['crc'] != entry['actual']:
+            raise ValueError("CRC mismatch in zip archive")
+        return True
+
+def merge_archive(staging, server_dir, executable=None):
+    """Move unpacked files into server_dir, keeping its existing settings, allowlists and worlds"""
+    for root, dirs, files in os.walk(staging):
+        rel_root = os.path.relpath(root, staging)
+        if rel_root == ".":
+            kept = {name for name in ARCHIVE_PRESERVED if os.path.exists(os.path.join(server_dir, name))}
+            dirs[:] = [d for d in dirs if d not in kept]
+            files = [f for f in files if f not in kept]
+        os.makedirs(os.path.join(server_dir, rel_root), exist_ok=True)
+        for filename in files:
+            os.replace(os.path.join(root, filename), os.path.join(server_dir, rel_root, filename))
+    shutil.rmtree(staging)
+    if executable and platform.system() != "Windows" and os.path.exists(os.path.join(server_dir, executable)):
+        os.chmod(os.path.join(server_dir, executable), 0o755)
+
+def install_artifact(artifact, server_dir, filename, progress=None, cancel=None):
+    """Put an artifact in place: archives are unpacked as they download, other files linked as filename.
+
+    Returns the store key.
+    """
+    if artifact_format(artifact['url']) != "zip":
+        return store_fetch(artifact, os.path.join(server_dir, filename), server_dir, progress, cancel)
+    extractor = ZipStreamExtractor(os.path.join(server_dir, f".install-{uuid.uuid4().hex[:8]}"))
+    try:
+        key = store_fetch(artifact, None, server_dir, progress, cancel, stream=extractor.follow)
+        extractor.finish(store_object_path(key))
+        merge_archive(extractor.dest, server_dir, filename)
+    finally:
+        extractor.close()
+    return key
+
+def unpack_stored_archive(key, server_dir, filename):
+    """Unpack an archive already in the store over a server directory"""
+    extractor = ZipStreamExtractor(os.path.join(server_dir, f".install-{uuid.uuid4().hex[:8]}"))
+    try:
+        extractor.finish(store_object_path(key))
+        merge_archive(extractor.dest, server_dir, filename)
+    finally:
+        extractor.close()
+
+# Server logs: a pump process per server reads its console output from a pipe
+# and appends it to a live segment. Segments rotate by size and age and are
+# gzip-compressed in independent 1 MB blocks, so any offset can be read without
+# inflating the whole file. Offsets are logical (bytes since the first line ever
+# logged) and stay valid across rotation. A sidecar index of (time, offset)
+# records maps wall-clock times to offsets.
+LOG_INDEX_RECORD = struct.Struct("<dQ")
+LOG_BLOCK_SIZE = 1024 * 1024
+LOG_READ_LIMIT = 32 * 1024 * 1024  # Most read_log returns at once
+
+def get_log_base(server_directory):
+    return os.path.join(LOG_DIR, os.path.basename(server_directory))
+
+def get_log_file(server_directory):
+    """Path of a server's live console log segment"""
+    return get_log_base(server_directory) + ".log"
+
+def load_log_meta(server_directory):
+    """Rotated segments and the live segment's starting offset"""
+    try:
+        with open(get_log_base(server_directory) + ".segments.json", 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'segments': [], 'live_start': 0, 'live_started': None}
+
+def get_log_files(server_directory):
+    """Every file making up a server's logs"""
+    base = get_log_base(server_directory)
+    names = [os.path.join(LOG_DIR, s['file']) for s in load_log_meta(server_directory)['segments']]
+    return names + [base + ".log", base + ".idx", base + ".segments.json"]
+
+def log_end_offset(server_directory):
+    """Logical offset just past the last byte logged so far"""
+    for _ in range(3):
+        meta = load_log_meta(server_directory)
+        try:
+            size = os.path.getsize(get_log_file(server_directory))
+        except FileNotFoundError:
+            size = 0
+        if load_log_meta(server_directory)['live_start'] == meta['live_start']:
+            return meta['live_start'] + size
+    return meta['live_start'] + size
+
+def read_segment(path, segment, start, end):
+    """Bytes [start, end) of a rotated segment, inflating only the blocks that cover them"""
+    if not segment.get('blocks'):
+        with open(path, 'rb') as f:
+            f.seek(start - segment['start'])
+            return f.read(end - start)
+    import bisect
+    blocks = segment['blocks']
+    first = bisect.bisect_right([b[0] for b in blocks], start) - 1
+    out = []
+    with open(path, 'rb') as f:
+        for i in range(first, len(blocks)):
+            block_start, position = blocks[i]
+            if block_start >= end:
+                break
+            f.seek(position)
+            length = blocks[i + 1][1] - position if i + 1 < len(blocks) else -1
+            data = zlib.decompress(f.read(length), 31)
+            out.append(data[max(start - block_start, 0):end - block_start])
+    return b''.join(out)
+
+def read_log(server_directory, offset, end=None):
+    """Read logged output from logical offset up to end (or the end of the log).
+
+    Returns (data, next offset). Offsets older than the retained logs start at
+    the oldest byte kept. At most LOG_READ_LIMIT bytes come back per call.
+    """
+    for _ in range(3):
+        meta = load_log_meta(server_directory)
+        segments = meta['segments']
+        oldest = segments[0]['start'] if segments else meta['live_start']
+        offset = max(offset, oldest)
+        try:
+            with open(get_log_file(server_directory), 'rb') as live:
+                if load_log_meta(server_directory)['live_start'] != meta['live_start']:
+                    continue  # Rotated between reading the metadata and opening the file
+                live_end = meta['live_start'] + os.fstat(live.fileno()).st_size
+                stop = min(live_end if end is None else end, offset + LOG_READ_LIMIT)
+                pieces = []
+                for segment in segments:
+                    if segment['start'] < stop and segment['end'] > offset:
+                        path = os.path.join(LOG_DIR, segment['file'])
+                        pieces.append(read_segment(path, segment, max(offset, segment['start']), min(stop, segment['end'])))
+                if stop > meta['live_start']:
+                    position = max(offset, meta['live_start'])
+                    live.seek(position - meta['live_start'])
+                    pieces.append(live.read(stop - position))
+        except FileNotFoundError:
+            if not os.path.exists(get_log_file(server_directory)) and not segments:
+                return b'', offset
+            continue  # A segment was compressed or expired meanwhile; look again
+        data = b''.join(pieces)
+        return data, offset + len(data)
+    return b'', offset
+
+def log_offset_at(server_directory, when, after=False):
+    """Logical offset of output logged around a time.
+
+    With after=False this is where output from `when` onwards starts (possibly a
+    second early); with after=True it is where output after `when` starts.
+    """
+    index_file = get_log_base(server_directory) + ".idx"
+    try:
+        with open(index_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // LOG_INDEX_RECORD.size
+            if not count:
+                return log_end_offset(server_directory) if after else 0
+            with mmap.mmap(f.fileno(), count * LOG_INDEX_RECORD.size, access=mmap.ACCESS_READ) as index:
+                low, high = 0, count  # First record stamped after `when`
+                while low < high:
+                    middle = (low + high) // 2
+                    if LOG_INDEX_RECORD.unpack_from(index, middle * LOG_INDEX_RECORD.size)[0] <= when:
+                        low = middle + 1
+                    else:
+                        high = middle
+                if after:
+                    return LOG_INDEX_RECORD.unpack_from(index, low * LOG_INDEX_RECORD.size)[1] if low < count else log_end_offset(server_directory)
+                return LOG_INDEX_RECORD.unpack_from(index, (low - 1) * LOG_INDEX_RECORD.size)[1] if low else 0
+    except FileNotFoundError:
+        return log_end_offset(server_directory) if after else 0
+
+def log_lines_between(server_directory, start_time, end_time=None):
+    """Lines logged between two times, found through the index rather than by scanning"""
+    offset = log_offset_at(server_directory, start_time)
+    end = log_offset_at(server_directory, end_time, after=True) if end_time else log_end_offset(server_directory)
+    lines = []
+    while offset < end:
+        data, next_offset = read_log(server_directory, offset, end)
+        if next_offset == offset:
+            break
+        lines.append(data)
+        offset = next_offset
+    return b''.join(lines).decode('utf-8', 'replace').splitlines()
+
+def tail_log(server_directory, count=100, end=None):
+    """The last count lines of a server's log before end (default: now), read backwards"""
+    if end is None:
+        end = log_end_offset(server_directory)
+    window = 64 * 1024
+    while True:
+        start = max(end - window, 0)
+        data, _ = read_log(server_directory, start, end)
+        lines = data.decode('utf-8', 'replace').splitlines()
+        if len(lines) > count or start == 0 or window >= LOG_READ_LIMIT or len(data) < end - start:
+            return lines[-count:] if count else []
+        window *= 4
+
+def parse_log_time(text):
+    """Timestamp for "HH:MM[:SS]" (today) or "YYYY-MM-DD HH:MM[:SS]" in local time"""
+    text = text.strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%H:%M:%S", "%H:%M"):
+        try:
+            parsed = time.strptime(text, fmt)
+        except ValueError:
+            continue
+        if fmt.startswith("%H"):
+            today = time.localtime()
+            parsed = time.struct_time((today.tm_year, today.tm_mon, today.tm_mday, parsed.tm_hour,
+                                       parsed.tm_min, parsed.tm_sec, 0, 0, -1))
+        return time.mktime(parsed)
+    raise ValueError(f"Unrecognized time {text!r} (use HH:MM or YYYY-MM-DD HH:MM)")
+
+def follow_log(server_directory, offset=None, stop=None, interval=0.25):
+    """Yield complete lines as they are logged, from offset (default: the current end)"""
+    if offset is None:
+        offset = log_end_offset(server_directory)
+    pending = b''
+    while stop is None or not stop.is_set():
+        data, offset = read_log(server_directory, offset)
+        if not data:
+            time.sleep(interval)
+            continue
+        *lines, pending = (pending + data).split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8', 'replace').rstrip('\r')
+
+class LogPump:
+    """Copies one server's console output from a pipe into rotating, indexed log segments"""
+    def __init__(self, server_directory):
+        config = get_config()
+        self.server_directory = server_directory
+        self.base = get_log_base(server_directory)
+        self.rotate_bytes = config["log_rotate_mb"] * 1024 * 1024
+        self.rotate_seconds = config["log_rotate_hours"] * 3600
+        self.retention = config["log_retention_days"] * 86400
+        self.meta_lock = threading.Lock()
+        self.meta = load_log_meta(server_directory)
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self.live = open(self.base + ".log", 'ab')
+        self.size = self.live.tell()
+        if self.meta['live_started'] is None:
+            self.meta['live_started'] = time.time()
+        self.index = open(self.base + ".idx", 'ab')
+        self.marked = 0
+        import queue
+        self.compress_queue = queue.Queue()
+        self.compressor = threading.Thread(target=self.compress_worker, daemon=True)
+        self.compressor.start()
+        for segment in self.meta['segments']:
+            if not segment.get('blocks'):
+                self.compress_queue.put(segment['file'])  # Interrupted before it was compressed
+    
+    def save_meta(self):
+        with self.meta_lock:
+            write_json_atomic(self.base + ".segments.json", self.meta)
+    
+    def write(self, data):
+        now = time.time()
+        if now - self.marked >= 1:  # One index record per second of output is plenty
+            self.index.write(LOG_INDEX_RECORD.pack(now, self.meta['live_start'] + self.size))
+            self.index.flush()
+            self.marked = now
+        self.live.write(data)
+        self.live.flush()
+        self.size += len(data)
+        if self.size >= self.rotate_bytes:
+            self.rotate()
+    
+    def tick(self):
+        """Rotate a live segment that has grown too old, even if the server is quiet"""
+        if self.size and time.time() - self.meta['live_started'] >= self.rotate_seconds:
+            self.rotate()
+    
+    def rotate(self):
+        now = time.time()
+        name = f"{os.path.basename(self.base)}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.log"
+        self.live.close()
+        os.replace(self.base + ".log", os.path.join(LOG_DIR, name))
+        with self.meta_lock:
+            start = self.meta['live_start']
+            self.meta['segments'].append({'file': name, 'start': start, 'end': start + self.size,
+                                          'first': self.meta['live_started'], 'last': now, 'blocks': None})
+            self.meta['live_start'] = start + self.size
+            self.meta['live_started'] = now
+        self.save_meta()
+        self.live = open(self.base + ".log", 'ab')
+        self.size = 0
+        self.compress_queue.put(name)
+        self.expire()
+    
+    def expire(self):
+        """Delete segments past the retention period and the index records that point into them"""
+        cutoff = time.time() - self.retention
+        with self.meta_lock:
+            expired = [s for s in self.meta['segments'] if s['last'] < cutoff and s.get('blocks')]
+            if not expired:
+                return
+            self.meta['segments'] = [s for s in self.meta['segments'] if s not in expired]
+        self.save_meta()
+        for segment in expired:
+            try:
+                os.remove(os.path.join(LOG_DIR, segment['file']))
+            except FileNotFoundError:
+                pass
+        oldest = self.meta['segments'][0]['start'] if self.meta['segments'] else self.meta['live_start']
+        with open(self.base + ".idx", 'rb') as f:
+            records = f.read()
+        keep = len(records) // LOG_INDEX_RECORD.size
+        for i in range(keep):
+            if LOG_INDEX_RECORD.unpack_from(records, i * LOG_INDEX_RECORD.size)[1] >= oldest:
+                keep = i
+                break
+        self.index.close()
+        with open(self.base + ".idx.tmp", 'wb') as f:
+            f.write(records[keep * LOG_INDEX_RECORD.size:len(records) // LOG_INDEX_RECORD.size * LOG_INDEX_RECORD.size])
+        os.replace(self.base + ".idx.tmp", self.base + ".idx")
+        self.index = open(self.base + ".idx", 'ab')
+    
+    def compress_worker(self):
+        while True:
+            name = self.compress_queue.get()
+            if name is None:
+                return
+            try:
+                self.compress(name)
+            except OSError as e:
+                print(f"Could not compress {name}: {e}")
+    
+    def compress(self, name):
+        """Gzip a rotated segment as independent members, one per block, and record where each starts"""
+        path = os.path.join(LOG_DIR, name)
+        with self.meta_lock:
+            segment = next((s for s in self.meta['segments'] if s['file'] == name), None)
+        if segment is None or segment.get('blocks') or not os.path.exists(path):
+            return
+        blocks = []
+        with open(path, 'rb') as src, open(path + ".gz.tmp", 'wb') as dst:
+            logical = segment['start']
+            for block in iter(lambda: src.read(LOG_BLOCK_SIZE), b''):
+                blocks.append([logical, dst.tell()])
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                dst.write(compressor.compress(block) + compressor.flush())
+                logical += len(block)
+        os.replace(path + ".gz.tmp", path + ".gz")
+        with self.meta_lock:
+            segment['file'] = name + ".gz"
+            segment['blocks'] = blocks
+        self.save_meta()
+        os.remove(path)
+    
+    def close(self):
+        self.live.close()
+        self.index.close()
+        self.save_meta()
+        self.compress_queue.put(None)
+    
+    def run(self, fd):
+        """Copy from fd until the writer closes it. A reader thread drains the pipe so the
+        server never blocks on output while a segment is being rotated or written."""
+        import queue
+        chunks = queue.Queue()
+        
+        def reader():
+            while True:
+                try:
+                    data = os.read(fd, 65536)
+                except OSError:
+                    data = b''
+                chunks.put(data)
+                if not data:
+                    return
+        
+        threading.Thread(target=reader, daemon=True).start()
+        self.save_meta()
+        try:
+            while True:
+                try:
+                    data = chunks.get(timeout=1)
+                except queue.Empty:
+                    self.tick()
+                    continue
+                if not data:
+                    break
+                self.write(data)
+        finally:
+            self.close()
+        self.compressor.join(timeout=60)  # A cut-short compression is redone next time
+
+def run_log_pump(server_directory):
+    """Entry point of the per-server log pump process (reads the server's output on stdin)"""
+    if platform.system() != "Windows":
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    LogPump(server_directory).run(sys.stdin.fileno())
+
+def start_log_pump(server_directory):
+    """Launch the log pump for a server; returns the Popen whose stdin the server writes to"""
+    kwargs = {'stdin': subprocess.PIPE, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    if platform.system() == "Windows":
+        kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True  # Outlives the manager, like the server
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--log-pump", server_directory], **kwargs)
+
+# Processes launched by this manager process, keyed by server directory
+supervised = {}
+supervised_lock = threading.Lock()
+launch_lock = FileLock(os.path.join(RUN_DIR, ".launch.lock"))  # Planning and launch must not interleave, in any process
+restart_backoff = {}
+
+def get_state_file(server_directory):
+    """Path of a server's PID/state record"""
+    return os.path.join(RUN_DIR, f"{os.path.basename(server_directory)}.json")
+
+def get_console_fifo(server_directory):
+    """Path of the named pipe feeding a server's console on Unix"""
+    return os.path.join(RUN_DIR, f"{os.path.basename(server_directory)}.stdin")
+
+def read_server_state(server_directory):
+    """Load a server's PID/state record"""
+    try:
+        with open(get_state_file(server_directory), 'r') as f:
+            return json.load(f)
+    except:
+        return {'state': "stopped", 'pid': None}
+
+def write_server_state(server_directory, **fields):
+    """Merge fields into a server's PID/state record"""
+    state = read_server_state(server_directory)
+    state.update(fields)
+    write_json_atomic(get_state_file(server_directory), state)
+    return state
+
+def is_pid_alive(pid):
+    """Check whether a process exists and has not exited"""
+    if not pid:
+        return False
+    if platform.system() == "Windows":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"  # Unreaped zombie
+    except (OSError, IndexError):
+        return True
+
+def get_process_start(pid):
+    """When a process started, as a token that differs if its PID is reused; None if unknown"""
+    if platform.system() == "Windows":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return None
+        times = [ctypes.c_ulonglong() for _ in range(4)]
+        ok = kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times))
+        kernel32.CloseHandle(handle)
+        return str(times[0].value) if ok else None  # Creation time
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            ticks = f.read().rsplit(")", 1)[1].split()[19]  # Field 22: start time in ticks since boot
+    except (OSError, IndexError):
+        return None  # No /proc (macOS): PIDs are trusted as before
+    try:
+        with open("/proc/sys/kernel/random/boot_id", 'r') as f:
+            return f"{f.read().strip()}:{ticks}"
+    except OSError:
+        return ticks
+
+def is_server_process(state):
+    """Whether the PID in a state record still belongs to the process that was started"""
+    pid = state.get('pid')
+    if not is_pid_alive(pid):
+        return False
+    recorded = state.get('process_start')
+    current = get_process_start(pid) if recorded else None
+    return current is None or current == recorded
+
+def get_server_pid(server_directory):
+    """PID of a server's running process, or None"""
+    with supervised_lock:
+        proc = supervised.get(server_directory)
+    if proc is not None:
+        return proc.pid if proc.poll() is None else None
+    state = read_server_state(server_directory)
+    if not is_pid_alive(state.get('pid')):
+        return None
+    if not is_server_process(state):
+        # The PID was reused (e.g. after a reboot): the record describes nothing that runs
+        try:
+            os.remove(get_state_file(server_directory))
+        except FileNotFoundError:
+            pass
+        return None
+    return state['pid']
+
+def get_host_memory_mb():
+    """Total physical memory of this host in MB"""
+    if platform.system() == "Windows":
+        import ctypes
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return status.ullTotalPhys // (1024 * 1024)
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+def get_cpu_ids():
+    """CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def running_server_states():
+    """State records of every server whose process is alive"""
+    states = []
+    if os.path.isdir(RUN_DIR):
+        for entry in os.listdir(RUN_DIR):
+            if entry.endswith(".json"):
+                try:
+                    with open(os.path.join(RUN_DIR, entry), 'r') as f:
+                        state = json.load(f)
+                except:
+                    continue
+                if state.get('state') in ("running", "stopping") and is_server_process(state):
+                    states.append(state)
+    return states
+
+def plan_launch(server_directory):
+    """Choose heap size, GC flags and CPU set for a server from the host's free budget.
+
+    Raises RuntimeError when the server cannot get at least min_heap_mb (or its
+    pinned heap_mb) without overcommitting the host.
+    """
+    config = get_config()
+    server = get_server(path=server_directory) or {}
+    server_type = server.get('type', "default")
+    
+    budget = config["memory_budget_mb"] or get_host_memory_mb() - config["memory_reserve_mb"]
+    running = [st for st in running_server_states() if st.get('path') != server_directory]
+    held = sum((st.get('heap_mb') or 0) + JVM_OVERHEAD_MB for st in running)
+    available = budget - held - JVM_OVERHEAD_MB
+    
+    if server.get('heap_mb'):
+        heap_mb = server['heap_mb']  # Explicit per-server size: never shrink it
+        if heap_mb > available:
+            raise RuntimeError(f"Not enough memory: {heap_mb} MB heap requested, {max(available, 0)} MB free in the {budget} MB budget")
+    else:
+        heap_sizes = config["heap_mb"]
+        wanted = heap_sizes.get(server_type, heap_sizes.get("default", 1024))
+        heap_mb = min(wanted, available) // 256 * 256
+        if heap_mb < config["min_heap_mb"]:
+            raise RuntimeError(f"Not enough memory: {max(available, 0)} MB free in the {budget} MB budget, "
+                               f"{len(running)} servers already running")
+    
+    presets = config["gc_presets"]
+    gc_flags = GC_PRESETS[presets.get(server_type, presets.get("default", "none"))](heap_mb)
+    
+    cpus = None
+    if config["cpu_pinning"] and shutil.which("taskset"):
+        # Give this server the cores least used by the other running servers
+        usage = {cpu: 0 for cpu in get_cpu_ids()}
+        for st in running:
+            for cpu in st.get('cpus') or []:
+                if cpu in usage:
+                    usage[cpu] += 1
+        count = min(config["cpus_per_server"], len(usage))
+        cpus = sorted(sorted(usage, key=lambda c: (usage[c], c))[:count])
+    launcher = get_launcher(server.get('implementation'), server.get('type'))
+    return {'heap_mb': heap_mb, 'gc_flags': gc_flags, 'cpus': cpus, 'launcher': launcher}
+
+def find_php(server_directory):
+    """PHP binary for PocketMine: the one bundled with the server if present, else php on PATH"""
+    for bundled in (os.path.join("bin", "php7", "bin", "php"), os.path.join("bin", "php", "php.exe")):
+        path = os.path.join(server_directory, bundled)
+        if os.path.exists(path):
+            return path
+    return shutil.which("php") or "php"
+
+def build_launch_command(server_directory, plan):
+    """Command line used to run a server under a launch plan"""
+    launcher = plan.get('launcher', JAVA_LAUNCHER)
+    server_file = os.path.join(server_directory, launcher['file'])
+    if launcher['runtime'] == "native":
+        cmd = [server_file]
+    elif launcher['runtime'] == "php":
+        cmd = [find_php(server_directory), server_file, "--no-wizard"]
+    else:
+        # The heap figure is only enforced for Java; other runtimes just reserve it
+        heap = f"{plan['heap_mb']}M"
+        cmd = ["java", f"-Xmx{heap}", f"-Xms{heap}"] + plan['gc_flags'] + ["-jar", server_file, "nogui"]
+    if plan['cpus']:
+        cmd = ["taskset", "-c", ",".join(map(str, plan['cpus']))] + cmd
+    return cmd
+
+def start_server(server_directory):
+    """Start an existing Minecraft server as a tracked background process"""
+    pid = get_server_pid(server_directory)
+    if pid:
+        print(f"Server is already running (PID {pid})")
+        return pid
+    
+    os.makedirs(RUN_DIR, exist_ok=True)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    apply_pending_profile(server_directory)
+    with launch_lock:
+        plan = plan_launch(server_directory)
+        cmd = build_launch_command(server_directory, plan)
+        pump = start_log_pump(server_directory)
+        threading.Thread(target=pump.wait, daemon=True).start()  # Reap it when the server's output ends
+        kwargs = {'cwd': server_directory, 'stdout': pump.stdin, 'stderr': subprocess.STDOUT}
+        if plan['launcher']['runtime'] == "native" and platform.system() != "Windows":
+            kwargs['env'] = dict(os.environ, LD_LIBRARY_PATH=".")  # Bedrock ships its own libraries
+        fifo_fd = None
+        if platform.system() == "Windows":
+            kwargs['stdin'] = subprocess.PIPE
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # A named pipe as stdin lets any manager process type into the console.
+            # Opening it read-write keeps a writer attached, so the server never sees EOF.
+            fifo = get_console_fifo(server_directory)
+            if os.path.exists(fifo):
+                os.remove(fifo)
+            os.mkfifo(fifo, 0o600)
+            fifo_fd = os.open(fifo, os.O_RDWR)
+            kwargs['stdin'] = fifo_fd
+            kwargs['start_new_session'] = True  # Survive the manager exiting
+        try:
+            proc = subprocess.Popen(cmd, **kwargs)
+        finally:
+            pump.stdin.close()  # The server holds the only write end now
+            if fifo_fd is not None:
+                os.close(fifo_fd)
+        
+        with supervised_lock:
+            supervised[server_directory] = proc
+        write_server_state(
+            server_directory, pid=proc.pid, process_start=get_process_start(proc.pid), state="running",
+            started=time.time(), path=server_directory, command=cmd, heap_mb=plan['heap_mb'], cpus=plan['cpus'], exit_code=None
+        )
+    threading.Thread(target=watch_server, args=(server_directory, proc), daemon=True).start()
+    return proc.pid
+
+def watch_server(server_directory, proc=None, pid=None):
+    """Restart a server if it exits without being asked to stop.
+
+    Servers launched by this process are watched through their Popen handle;
+    servers adopted from an earlier manager (pid only) are polled.
+    """
+    started = time.time()
+    if proc is not None:
+        code = proc.wait()
+        with supervised_lock:
+            if supervised.get(server_directory) is not proc:
+                return
+    else:
+        state = read_server_state(server_directory)
+        while is_server_process(state):
+            time.sleep(1)
+        code = None
+        if read_server_state(server_directory).get('pid') != pid:
+            return  # Restarted by someone else meanwhile
+    if read_server_state(server_directory).get('state') != "running":
+        return  # Exit was requested by stop_server
+    
+    write_server_state(server_directory, state="crashed", pid=None, exit_code=code)
+    print(f"Server {os.path.basename(server_directory)} exited unexpectedly (code {code})")
+    if not get_config()["auto_restart"]:
+        return
+    
+    # Exponential backoff, reset once a run has stayed up for five minutes
+    delay = 1 if time.time() - started > 300 else restart_backoff.get(server_directory, 1)
+    restart_backoff[server_directory] = min(delay * 2, 60)
+    time.sleep(delay)
+    state = read_server_state(server_directory)
+    if state.get('state') == "crashed":
+        write_server_state(server_directory, restarts=state.get('restarts', 0) + 1)
+        start_server(server_directory)
+
+def adopt_running_servers():
+    """Watch servers started by an earlier manager process so crashes are still restarted"""
+    adopted = []
+    for state in running_server_states():
+        path = state.get('path')
+        if path and path not in supervised:
+            threading.Thread(target=watch_server, args=(path, None, state['pid']), daemon=True).start()
+            adopted.append(path)
+    return adopted
+
+def send_console_command(server_directory, command):
+    """Write a line to a running server's console; returns False if it cannot be reached"""
+    with supervised_lock:
+        proc = supervised.get(server_directory)
+    line = (command.rstrip("\n") + "\n").encode()
+    if proc is not None and proc.poll() is None and proc.stdin:
+        try:
+            proc.stdin.write(line)
+            proc.stdin.flush()
+            return True
+        except OSError:
+            return False
+    fifo = get_console_fifo(server_directory)
+    if platform.system() != "Windows" and os.path.exists(fifo):
+        try:
+            fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            return False  # No reader: the server is gone
+        try:
+            os.write(fd, line)
+            return True
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+    return False
+
+def send_rcon_stop(server_directory):
+    """Send "stop" over RCON when the console cannot be reached; returns True if it was sent"""
+    try:
+        get_rcon(server_directory).command("stop", retry=False)
+        return True
+    except RconError as e:
+        return "closed" in str(e)  # The server may hang up before replying
+    except OSError:
+        return False
+
+def wait_for_exit(server_directory, pid, timeout):
+    """Wait up to timeout seconds for a server process to exit; returns True if it did"""
+    with supervised_lock:
+        proc = supervised.get(server_directory)
+    if proc is not None and proc.pid == pid:
+        try:
+            proc.wait(timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not is_pid_alive(pid):
+            return True
+        time.sleep(0.2)
+    return not is_pid_alive(pid)
+
+def terminate_pid(pid, force=False):
+    """Ask a process to terminate (SIGTERM), or kill it outright (SIGKILL)"""
+    if platform.system() == "Windows":
+        cmd = ["taskkill", "/pid", str(pid), "/t"] + (["/f"] if force else [])
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    try:
+        os.kill(pid, signal.SIGKILL if force else signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+def wait_for_ready(server_directory, offset=0, timeout=None, started=None):
+    """Tail a server's log from offset until it reports it has booted.
+
+    Returns a dict with 'ready', 'elapsed' (measured seconds since started),
+    'reported' (the server's own "Done (Xs)" figure, if printed) and 'reason'
+    ("ready", "eula", "exited" if the process died first, or "timeout").
+    """
+    if timeout is None:
+        timeout = get_config()["ready_timeout"]
+    started = started or time.time()
+    pending = b''
+    
+    while time.time() - started < timeout:
+        # Checked before reading, so whatever it logged before exiting is seen first
+        alive = get_server_pid(server_directory) is not None
+        data, offset = read_log(server_directory, offset)
+        if not data and not alive:
+            return {'ready': False, 'elapsed': time.time() - started, 'reported': None, 'reason': "exited"}
+        if data:
+            *lines, pending = (pending + data).split(b'\n')
+            for raw in lines:
+                line = raw.decode('utf-8', 'replace')
+                match = READY_PATTERN.search(line)
+                if match:
+                    reported = float(match.group(1).replace(',', '.')) if match.group(1) else None
+                    return {'ready': True, 'elapsed': time.time() - started, 'reported': reported, 'reason': "ready"}
+                if EULA_PATTERN.search(line):
+                    return {'ready': True, 'elapsed': time.time() - started, 'reported': None, 'reason': "eula"}
+        time.sleep(0.2)
+    return {'ready': False, 'elapsed': time.time() - started, 'reported': None, 'reason': "timeout"}
+
+def stop_server(server_directory, timeout=None):
+    """Stop a server gracefully, escalating to SIGTERM and then SIGKILL; returns True once it has exited"""
+    config = get_config()
+    if timeout is None:
+        timeout = config["stop_timeout"]
+    pid = get_server_pid(server_directory)
+    if pid:
+        write_server_state(server_directory, state="stopping")
+        # "stop" saves the world before exiting, so give it time before escalating
+        sent = send_console_command(server_directory, "stop") or send_rcon_stop(server_directory)
+        if not (sent and wait_for_exit(server_directory, pid, timeout)):
+            terminate_pid(pid)
+            if not wait_for_exit(server_directory, pid, config["kill_timeout"]):
+                terminate_pid(pid, force=True)
+                wait_for_exit(server_directory, pid, config["kill_timeout"])
+    
+    stopped = not (pid and is_pid_alive(pid))
+    if stopped:
+        with supervised_lock:
+            supervised.pop(server_directory, None)
+        write_server_state(server_directory, state="stopped", pid=None, stopped=time.time())
+        fifo = get_console_fifo(server_directory)
+        if os.path.exists(fifo):
+            os.remove(fifo)
+    return stopped
+
+def restart_server(server_directory):
+    """Restart a server once the previous instance has actually exited"""
+    if not stop_server(server_directory):
+        raise RuntimeError(f"Server at {server_directory} did not stop; not restarting")
+    return start_server(server_directory)
+
+def initialize_server(server_directory, timeout=None):
+    """Start a new server once so it generates its files, then stop it as soon as it has booted"""
+    offset = log_end_offset(server_directory)
+    started = time.time()
+    start_server(server_directory)
+    result = wait_for_ready(server_directory, offset, timeout, started)
+    stop_server(server_directory)
+    apply_pending_profile(server_directory)
+    return result
+
+def delete_server(server_directory):
+    """Move a stopped server to the trash; its space is reclaimed in the background"""
+    if get_server_pid(server_directory):
+        return "Stop the server before deleting it"
+    server = get_server(path=server_directory) or {'name': os.path.basename(server_directory), 'path': server_directory}
+    
+    # A rename is atomic and instant however large the worlds are
+    entry_id = f"{uuid.uuid4().hex[:12]}-{os.path.basename(server_directory)}"
+    trash_path = os.path.join(TRASH_DIR, entry_id)
+    try:
+        os.makedirs(TRASH_DIR, exist_ok=True)
+        try:
+            os.rename(server_directory, trash_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Different filesystem: use a trash folder beside the server instead
+            trash_path = os.path.join(os.path.dirname(server_directory), ".minecraft_server_trash", entry_id)
+            os.makedirs(os.path.dirname(trash_path), exist_ok=True)
+            os.rename(server_directory, trash_path)
+    except FileNotFoundError:
+        trash_path = None  # Already gone; just forget it
+    except OSError as e:
+        return f"Could not delete server directory: {e}"
+    
+    for log_file in get_log_files(server_directory):
+        if os.path.exists(log_file):
+            try:
+                if trash_path:
+                    os.makedirs(os.path.join(trash_path, ".manager-logs"), exist_ok=True)
+                    shutil.move(log_file, os.path.join(trash_path, ".manager-logs", os.path.basename(log_file)))
+                else:
+                    os.remove(log_file)
+            except OSError:
+                pass
+    
+    conn = get_registry()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM servers WHERE path = ?", (server_directory,))
+        usage = conn.execute("SELECT bytes FROM disk_usage WHERE path = ?", (server_directory,)).fetchone()
+        conn.execute("DELETE FROM disk_usage WHERE path = ?", (server_directory,))
+        if trash_path:
+            conn.execute("INSERT INTO trash (id, name, path, trash_path, deleted, bytes, server) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (entry_id, server['name'], server_directory, trash_path, time.time(),
+                          usage['bytes'] if usage else None, json.dumps(server)))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+    store_release(server_directory)
+    start_trash_reaper()
+    
+    if get_config()["trash_retention_hours"] > 0:
+        return f"Server moved to trash (restore with --undelete {server['name']})"
+    return "Server deleted successfully"
+
+# Trash: deleted servers wait here for the retention window, then a
+# low-priority thread removes them
+trash_lock = threading.Lock()
+trash_thread = None
+trash_wakeup = threading.Event()
+TRASH_REAPING_SUFFIX = ".reaping"  # Marks a trash entry whose files are being removed
+
+def list_trash():
+    """Deleted servers that can still be restored, newest first"""
+    rows = get_registry().execute("SELECT * FROM trash WHERE trash_path NOT LIKE ? ORDER BY deleted DESC",
+                                  ("%" + TRASH_REAPING_SUFFIX,)).fetchall()
+    retention = get_config()["trash_retention_hours"] * 3600
+    return [{'id': r['id'], 'name': r['name'], 'path': r['path'], 'deleted': r['deleted'],
+             'bytes': r['bytes'], 'expires': r['deleted'] + retention} for r in rows]
+
+def undelete_server(name_or_id):
+    """Restore the most recently deleted server with this name (or trash id) to its old place"""
+    conn = get_registry()
+    row = conn.execute("SELECT * FROM trash WHERE (id = ? OR name = ?) AND trash_path NOT LIKE ? ORDER BY deleted DESC",
+                       (name_or_id, name_or_id, "%" + TRASH_REAPING_SUFFIX)).fetchone()
+    if row is None:
+        raise ValueError(f"No deleted server named {name_or_id} in the trash")
+    if os.path.exists(row['path']) or get_server(path=row['path']):
+        raise RuntimeError(f"{row['path']} is in use by another server")
+    server = json.loads(row['server'])
+    if get_server(name=server['name']):
+        raise RuntimeError(f"A server named {server['name']} already exists")
+    
+    with trash_lock:  # Not while the reaper might be removing it
+        current = conn.execute("SELECT trash_path FROM trash WHERE id = ?", (row['id'],)).fetchone()
+        if current is None or current['trash_path'] != row['trash_path']:
+            raise RuntimeError(f"{server['name']} is being removed from the trash")
+        if not os.path.isdir(row['trash_path']):
+            conn.execute("DELETE FROM trash WHERE id = ?", (row['id'],))
+            raise RuntimeError(f"{server['name']} has already been removed from the trash")
+        os.rename(row['trash_path'], row['path'])
+        conn.execute("DELETE FROM trash WHERE id = ?", (row['id'],))
+    
+    saved_logs = os.path.join(row['path'], ".manager-logs")
+    if os.path.isdir(saved_logs):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        for name in os.listdir(saved_logs):
+            shutil.move(os.path.join(saved_logs, name), os.path.join(LOG_DIR, name))
+        os.rmdir(saved_logs)
+    elif os.path.exists(os.path.join(row['path'], ".manager.log")):  # Deleted before logs were segmented
+        os.makedirs(LOG_DIR, exist_ok=True)
+        shutil.move(os.path.join(row['path'], ".manager.log"), get_log_file(row['path']))
+    if server.get('artifact'):
+        try:
+            store_add_ref(server['artifact'], row['path'])
+        except ValueError as e:
+            print(f"{e}; {server['name']} will fetch its server file again on the next upgrade")
+            del server['artifact']
+    register_server(server)
+    return server
+
+def purge_trash(force=False):
+    """Remove trash entries past the retention window (all of them with force); returns bytes freed"""
+    retention = 0 if force else get_config()["trash_retention_hours"] * 3600
+    conn = get_registry()
+    # Removals an earlier process did not finish are picked up again whatever their age
+    rows = conn.execute("SELECT * FROM trash WHERE deleted <= ? OR trash_path LIKE ? ORDER BY deleted",
+                        (time.time() - retention, "%" + TRASH_REAPING_SUFFIX)).fetchall()
+    freed = 0
+    for row in rows:
+        reaping_path = row['trash_path']
+        with trash_lock:
+            if not conn.execute("SELECT 1 FROM trash WHERE id = ?", (row['id'],)).fetchone():
+                continue  # Restored meanwhile
+            if not reaping_path.endswith(TRASH_REAPING_SUFFIX):
+                # Rename first so a removal cut short is never restored half-deleted,
+                # but stays in the registry until its files are really gone
+                reaping_path += TRASH_REAPING_SUFFIX
+                try:
+                    os.rename(row['trash_path'], reaping_path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:  # Still in use (Windows); leave it for the next pass
+                    print(f"Could not remove {row['trash_path']} yet: {e}")
+                    continue
+                conn.execute("UPDATE trash SET trash_path = ? WHERE id = ?", (reaping_path, row['id']))
+        size = disk_usage_of(reaping_path)[0] if row['bytes'] is None else row['bytes']
+        shutil.rmtree(reaping_path, ignore_errors=True)
+        if os.path.exists(reaping_path):
+            print(f"Could not remove all of {reaping_path}; will retry later")
+            continue
+        conn.execute("DELETE FROM trash WHERE id = ?", (row['id'],))
+        freed += size
+        if not get_server(path=row['path']):
+            conn.execute("DELETE FROM lag_hourly WHERE path = ?", (row['path'],))
+            conn.execute("DELETE FROM lag_cursor WHERE path = ?", (row['path'],))
+    return freed
+
+def start_trash_reaper():
+    """Reclaim expired trash in a low-priority background thread (one per process)"""
+    global trash_thread
+    def loop():
+        global trash_thread
+        if platform.system() == "Linux":
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)  # Only this thread
+            except OSError:
+                pass
+        while True:
+            try:
+                purge_trash()
+                pending = list_trash()
+            except Exception as e:
+                print(f"Trash cleanup error: {e}")
+                pending = []
+            with trash_lock:
+                if not pending and not trash_wakeup.is_set():
+                    trash_thread = None
+                    return
+            if pending:
+                due = min(t['expires'] for t in pending) - time.time()
+                trash_wakeup.wait(min(max(due, 1), 3600))
+            trash_wakeup.clear()
+    with trash_lock:
+        if trash_thread is None or not trash_thread.is_alive():
+            trash_thread = threading.Thread(target=loop, daemon=True)
+            trash_thread.start()
+        else:
+            trash_wakeup.set()  # New entry: re-check what is due
+    return trash_thread
+
+# Disk usage index: per-server totals cached in the registry. A stopped server
+# is only measured again if it has run since its last scan.
+def disk_usage_of(path):
+    """Bytes allocated under path and the number of files, counting hardlinks once"""
+    total = files = 0
+    seen = set()
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            total += st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+            files += 1
+    return total, files
+
+def refresh_disk_usage(max_scans=None):
+    """Re-measure servers whose cached usage may be stale; returns how many were scanned"""
+    conn = get_registry()
+    cached = {r['path']: r for r in conn.execute("SELECT * FROM disk_usage")}
+    interval = get_config()["disk_usage_interval"]
+    scanned = 0
+    for server in list_servers():
+        path = server['path']
+        entry = cached.get(path)
+        if entry is not None:
+            if get_server_pid(path):
+                if time.time() - entry['scanned'] < interval:
+                    continue
+            else:
+                state_file = get_state_file(path)
+                last_run = os.path.getmtime(state_file) if os.path.exists(state_file) else 0
+                if entry['scanned'] > last_run:
+                    continue  # Nothing has run in it since the last scan
+        if max_scans is not None and scanned >= max_scans:
+            break
+        total, files = disk_usage_of(path)
+        conn.execute("INSERT OR REPLACE INTO disk_usage (path, bytes, files, scanned) VALUES (?, ?, ?, ?)",
+                     (path, total, files, time.time()))
+        scanned += 1
+    return scanned
+
+def invalidate_disk_usage(path):
+    """Forget a server's cached usage after the manager changed its files"""
+    get_registry().execute("DELETE FROM disk_usage WHERE path = ?", (path,))
+
+def get_disk_usage():
+    """Cached disk usage of every server: {path: bytes}"""
+    return {r['path']: r['bytes'] for r in get_registry().execute("SELECT path, bytes FROM disk_usage")}
+
+# Resource telemetry: per-server ring buffers of /proc samples plus lag counters
+telemetry = {}
+telemetry_lock = threading.Lock()
+telemetry_thread = None
+
+def sample_process(pid):
+    """Read CPU seconds, RSS, thread count and I/O bytes of a process from /proc"""
+    sample = {'time': time.time(), 'cpu_seconds': None, 'rss_bytes': None, 'threads': None,
+              'read_bytes': None, 'write_bytes': None}
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        sample['cpu_seconds'] = (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+        sample['threads'] = int(fields[17])
+        sample['rss_bytes'] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return sample
+    try:
+        with open(f"/proc/{pid}/io", 'r') as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+        sample['read_bytes'] = int(io['read_bytes'])
+        sample['write_bytes'] = int(io['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        pass  # /proc/<pid>/io needs ptrace access
+    return sample
+
+def scan_lag_output(server_directory, record):
+    """Count overload warnings and TPS reports written to a server's log since the last scan"""
+    if record['log_offset'] is None:
+        record['log_offset'] = log_end_offset(server_directory)  # Start at the end; history is not live telemetry
+        return
+    data, _ = read_log(server_directory, record['log_offset'])
+    data = data[:data.rfind(b'\n') + 1]  # Leave partial lines for the next scan
+    record['log_offset'] += len(data)
+    for line in data.decode('utf-8', 'replace').splitlines():
+        lag = LAG_PATTERN.search(line)
+        if lag:
+            record['lag_events'] += 1
+            record['ticks_behind'] = int(lag.group(2))
+        tps = TPS_PATTERN.search(line)
+        if tps:
+            record['tps'] = float(tps.group(1))
+
+def sample_servers():
+    """Take one telemetry sample of every registered server"""
+    servers = list_servers()
+    with telemetry_lock:
+        for server in servers:
+            path = server['path']
+            record = telemetry.setdefault(path, {
+                'name': server['name'], 'history': collections.deque(maxlen=get_config()["telemetry_history"]),
+                'log_offset': None, 'lag_events': 0, 'ticks_behind': None, 'tps': None, 'cpu_percent': None
+            })
+            pid = get_server_pid(path)
+            sample = sample_process(pid) if pid else {'time': time.time()}
+            sample['up'] = pid is not None
+            previous = record['history'][-1] if record['history'] else None
+            if previous and previous.get('cpu_seconds') is not None and sample.get('cpu_seconds') is not None:
+                elapsed = sample['time'] - previous['time']
+                sample['cpu_percent'] = 100 * (sample['cpu_seconds'] - previous['cpu_seconds']) / elapsed if elapsed > 0 else None
+            else:
+                sample['cpu_percent'] = None
+            record['history'].append(sample)
+            record['cpu_percent'] = sample['cpu_percent']
+            scan_lag_output(path, record)
+        for path in set(telemetry) - {s['path'] for s in servers}:
+            del telemetry[path]
+
+def get_server_stats(server_directory):
+    """Latest telemetry for a server as a flat dict (empty if never sampled)"""
+    with telemetry_lock:
+        record = telemetry.get(server_directory)
+        if not record or not record['history']:
+            return {}
+        stats = dict(record['history'][-1])
+        stats.update({k: record[k] for k in ('lag_events', 'ticks_behind', 'tps')})
+        return stats
+
+# Lag analytics: overload warnings and watchdog dumps are folded into hourly
+# per-server rows (counts, totals and a histogram of how far behind the server
+# fell). Parsing resumes from the last log offset processed, so each byte of
+# output is read once.
+LAG_EVENT_PATTERN = re.compile(rb"Can't keep up! Is the server overloaded\? Running (\d+)ms or \d+ ticks behind"
+                               rb"|The server has (?:not responded for (\d+) seconds|stopped responding)")
+LAG_BUCKETS_MS = (500, 1000, 2000, 5000, 10000, 30000)  # Histogram upper bounds; one more bucket above
+
+def lag_bucket_labels():
+    """Histogram bucket names, from <500ms up to >=30s"""
+    bounds = [format_duration_ms(b) for b in LAG_BUCKETS_MS]
+    return [f"<{bounds[0]}"] + [f"{a}-{b}" for a, b in zip(bounds, bounds[1:])] + [f">={bounds[-1]}"]
+
+def format_duration_ms(ms):
+    return f"{ms / 1000:g}s" if ms >= 1000 else f"{ms}ms"
+
+def log_times(server_directory, start, end):
+    """Index records covering logical offsets [start, end) as (offsets, times) lists"""
+    index_file = get_log_base(server_directory) + ".idx"
+    try:
+        with open(index_file, 'rb') as f:
+            count = os.fstat(f.fileno()).st_size // LOG_INDEX_RECORD.size
+            if not count:
+                return [], []
+            with mmap.mmap(f.fileno(), count * LOG_INDEX_RECORD.size, access=mmap.ACCESS_READ) as index:
+                low, high = 0, count  # First record past start
+                while low < high:
+                    middle = (low + high) // 2
+                    if LOG_INDEX_RECORD.unpack_from(index, middle * LOG_INDEX_RECORD.size)[1] <= start:
+                        low = middle + 1
+                    else:
+                        high = middle
+                offsets, times = [], []
+                for i in range(max(low - 1, 0), count):
+                    when, offset = LOG_INDEX_RECORD.unpack_from(index, i * LOG_INDEX_RECORD.size)
+                    if offset >= end:
+                        break
+                    offsets.append(offset)
+                    times.append(when)
+                return offsets, times
+    except FileNotFoundError:
+        return [], []
+
+def update_lag_history(server_directory, max_bytes=None):
+    """Fold lag events logged since the last run into the hourly table; returns bytes processed"""
+    import bisect
+    conn = get_registry()
+    row = conn.execute("SELECT offset FROM lag_cursor WHERE path = ?", (server_directory,)).fetchone()
+    offset = row['offset'] if row else 0
+    processed = 0
+    while max_bytes is None or processed < max_bytes:
+        data, next_offset = read_log(server_directory, offset)
+        offset = next_offset - len(data)  # Past the cursor if the segments it pointed into have expired
+        data = data[:data.rfind(b'\n') + 1]  # Partial lines wait for the next run
+        if not data:
+            break
+        offsets, times = log_times(server_directory, offset, offset + len(data))
+        hours = {}
+        for match in LAG_EVENT_PATTERN.finditer(data):
+            position = offset + match.start()
+            i = bisect.bisect_right(offsets, position) - 1
+            when = times[i] if i >= 0 else time.time()
+            entry = hours.setdefault(int(when // 3600), [0, 0, 0, 0, [0] * (len(LAG_BUCKETS_MS) + 1)])
+            if match.group(1):
+                behind = int(match.group(1))
+                entry[0] += 1
+                entry[1] += behind
+                entry[2] = max(entry[2], behind)
+                entry[4][bisect.bisect_right(LAG_BUCKETS_MS, behind)] += 1
+            else:
+                entry[3] += 1
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for hour, (events, behind, worst, watchdogs, buckets) in hours.items():
+                existing = conn.execute("SELECT * FROM lag_hourly WHERE path = ? AND hour = ?", (server_directory, hour)).fetchone()
+                if existing:
+                    events += existing['events']
+                    behind += existing['behind_ms']
+                    worst = max(worst, existing['max_ms'])
+                    watchdogs += existing['watchdogs']
+                    buckets = [a + b for a, b in zip(buckets, json.loads(existing['buckets']))]
+                conn.execute("INSERT OR REPLACE INTO lag_hourly (path, hour, events, behind_ms, max_ms, watchdogs, buckets) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (server_directory, hour, events, behind, worst, watchdogs, json.dumps(buckets)))
+            conn.execute("INSERT OR REPLACE INTO lag_cursor (path, offset) VALUES (?, ?)", (server_directory, offset + len(data)))
+            cutoff = int(time.time() // 3600) - get_config()["lag_history_days"] * 24
+            conn.execute("DELETE FROM lag_hourly WHERE path = ? AND hour < ?", (server_directory, cutoff))
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        offset += len(data)
+        processed += len(data)
+    return processed
+
+def lag_report(days=7, limit=10):
+    """Rank servers and hours by how far they fell behind over the last days.
+
+    Returns {'servers': [...], 'hours': [...]}; each server entry carries its
+    totals and histogram, each hour entry its server name and totals.
+    """
+    servers = {s['path']: s['name'] for s in list_servers()}
+    for path in servers:
+        update_lag_history(path)
+    since = int(time.time() // 3600) - days * 24
+    conn = get_registry()
+    ranked = []
+    for path, name in servers.items():
+        rows = conn.execute("SELECT * FROM lag_hourly WHERE path = ? AND hour >= ?", (path, since)).fetchall()
+        if not rows:
+            continue
+        histogram = [0] * (len(LAG_BUCKETS_MS) + 1)
+        for r in rows:
+            histogram = [a + b for a, b in zip(histogram, json.loads(r['buckets']))]
+        ranked.append({
+            'name': name, 'path': path, 'events': sum(r['events'] for r in rows),
+            'behind_ms': sum(r['behind_ms'] for r in rows), 'max_ms': max(r['max_ms'] for r in rows),
+            'watchdogs': sum(r['watchdogs'] for r in rows), 'lagging_hours': len(rows), 'histogram': histogram
+        })
+    ranked.sort(key=lambda s: (s['behind_ms'], s['watchdogs']), reverse=True)
+    
+    hours = []
+    for r in conn.execute("SELECT * FROM lag_hourly WHERE hour >= ? ORDER BY behind_ms DESC, watchdogs DESC", (since,)):
+        if r['path'] in servers:
+            hours.append({'name': servers[r['path']], 'hour': r['hour'] * 3600, 'events': r['events'],
+                          'behind_ms': r['behind_ms'], 'max_ms': r['max_ms'], 'watchdogs': r['watchdogs']})
+            if len(hours) >= limit:
+                break
+    return {'servers': ranked[:limit], 'hours': hours}
+
+def lag_timeline(server_directory, days=7):
+    """Hourly lag totals of one server over the last days, oldest first"""
+    update_lag_history(server_directory)
+    since = int(time.time() // 3600) - days * 24
+    rows = get_registry().execute("SELECT * FROM lag_hourly WHERE path = ? AND hour >= ? ORDER BY hour",
+                                  (server_directory, since)).fetchall()
+    return [{'hour': r['hour'] * 3600, 'events': r['events'], 'behind_ms': r['behind_ms'], 'max_ms': r['max_ms'],
+             'watchdogs': r['watchdogs'], 'histogram': json.loads(r['buckets'])} for r in rows]
+
+def print_lag_report(days=7, names=None):
+    """Print the worst servers and worst hours, and timelines for the named servers"""
+    report = call_manager("lag_report", days=days)
+    print(f"Worst servers, last {days} days")
+    print(f"{'Server':20} {'Events':>7} {'Behind':>9} {'Worst':>7} {'Watchdog':>8}  Histogram ({', '.join(lag_bucket_labels())})")
+    for s in report['servers']:
+        print(f"{s['name'][:20]:20} {s['events']:7} {format_duration_ms(s['behind_ms']):>9} {format_duration_ms(s['max_ms']):>7} "
+              f"{s['watchdogs']:8}  {' '.join(str(n) for n in s['histogram'])}")
+    if not report['servers']:
+        print("No lag events recorded")
+    print("\nWorst hours")
+    for h in report['hours']:
+        hour = time.strftime("%Y-%m-%d %H:00", time.localtime(h['hour']))
+        print(f"{hour}  {h['name'][:20]:20} {h['events']:5} events, {format_duration_ms(h['behind_ms'])} behind, "
+              f"worst {format_duration_ms(h['max_ms'])}, {h['watchdogs']} watchdog dumps")
+    for name in names or ():
+        server = get_server(name=name)
+        if not server:
+            raise ValueError(f"No server named {name}")
+        timeline = lag_timeline(server['path'], days)
+        peak = max((t['behind_ms'] for t in timeline), default=0)
+        print(f"\n{name}: hourly time behind")
+        for t in timeline:
+            bar = "#" * max(1, round(40 * t['behind_ms'] / peak)) if peak and t['behind_ms'] else ""
+            print(f"{time.strftime('%m-%d %H:00', time.localtime(t['hour']))}  {format_duration_ms(t['behind_ms']):>8}  {bar}"
+                  + (f"  ({t['watchdogs']} watchdog)" if t['watchdogs'] else ""))
+
+def start_telemetry(interval=None):
+    """Sample every registered server in a background thread"""
+    global telemetry_thread
+    interval = interval or get_config()["telemetry_interval"]
+    def loop():
+        while True:
+            try:
+                sample_servers()
+                refresh_disk_usage(max_scans=1)  # Spread tree walks over many ticks
+                for server in list_servers():
+                    update_lag_history(server['path'], max_bytes=LOG_READ_LIMIT)
+            except Exception as e:
+                print(f"Telemetry error: {e}")
+            time.sleep(interval)
+    telemetry_thread = threading.Thread(target=loop, daemon=True)
+    telemetry_thread.start()
+    return telemetry_thread
+
+def format_bytes(size):
+    """Human-readable byte count"""
+    if size is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+def render_metrics():
+    """Current telemetry in the Prometheus text exposition format"""
+    metrics = [
+        ("mc_server_up", "gauge", "1 if the server process is running", 'up'),
+        ("mc_server_cpu_percent", "gauge", "CPU usage over the last sample interval", 'cpu_percent'),
+        ("mc_server_rss_bytes", "gauge", "Resident memory", 'rss_bytes'),
+        ("mc_server_threads", "gauge", "Thread count", 'threads'),
+        ("mc_server_read_bytes_total", "counter", "Bytes read from storage", 'read_bytes'),
+        ("mc_server_write_bytes_total", "counter", "Bytes written to storage", 'write_bytes'),
+        ("mc_server_lag_events_total", "counter", "Can't keep up warnings since sampling began", 'lag_events'),
+        ("mc_server_ticks_behind", "gauge", "Ticks behind in the latest overload warning", 'ticks_behind'),
+        ("mc_server_tps", "gauge", "Latest reported 1-minute TPS", 'tps'),
+    ]
+    with telemetry_lock:
+        paths = list(telemetry)
+    stats = {path: get_server_stats(path) for path in paths}
+    lines = []
+    for name, kind, help_text, key in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for path, values in stats.items():
+            value = values.get(key)
+            if value is not None:
+                label = os.path.basename(path).replace('"', '\\"')
+                number = float(value)
+                text = str(int(number)) if number.is_integer() else f"{number:.3f}"
+                lines.append(f'{name}{{server="{label}"}} {text}')
+    return "\n".join(lines) + "\n"
+
+def serve_metrics(port=None):
+    """Serve /metrics on localhost in a background thread; returns the HTTP server"""
+    import http.server
+    port = port if port is not None else get_config()["metrics_port"]
+    
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# RCON: authenticated TCP console access, one persistent connection per server
+RCON_LOGIN = 3
+RCON_COMMAND = 2
+
+class RconError(Exception):
+    pass
+
+class RconClient:
+    """Minimal Source RCON client as spoken by Minecraft servers"""
+    
+    def __init__(self, host, port, password, timeout=5):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.sock = None
+        self.request_id = 0
+        self.lock = threading.Lock()
+    
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        request_id = self.send_packet(RCON_LOGIN, self.password)
+        reply_id, _, _ = self.read_packet()
+        if reply_id == -1 or reply_id != request_id:
+            self.close()
+            raise RconError(f"RCON authentication failed for {self.host}:{self.port}")
+    
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+    
+    def packet(self, kind, body):
+        """Encode a packet under a fresh request id; returns (request id, bytes)"""
+        self.request_id = self.request_id % 0x7fffffff + 1
+        payload = struct.pack("<ii", self.request_id, kind) + body.encode('utf-8') + b"\x00\x00"
+        return self.request_id, struct.pack("<i", len(payload)) + payload
+    
+    def send_packet(self, kind, body):
+        request_id, data = self.packet(kind, body)
+        self.sock.sendall(data)
+        return request_id
+    
+    def is_stale(self):
+        """Whether the server has hung up on a pooled connection (it never speaks unasked)"""
+        import select
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+    
+    def recv_exact(self, count):
+        data = b''
+        while len(data) < count:
+            try:
+                chunk = self.sock.recv(count - len(data))
+            except ConnectionResetError:
+                chunk = b''
+            if not chunk:
+                raise RconError("RCON connection closed")
+            data += chunk
+        return data
+    
+    def read_packet(self):
+        length, = struct.unpack("<i", self.recv_exact(4))
+        payload = self.recv_exact(length)
+        request_id, kind = struct.unpack("<ii", payload[:8])
+        return request_id, kind, payload[8:-2].decode('utf-8', 'replace')
+    
+    def command(self, command, retry=True):
+        """Run a console command and return its output.
+
+        An empty command follows it as a sentinel: its reply marks the end of
+        one that was split over several packets. A pooled connection the
+        server has closed is reopened before sending. The command is sent
+        again only if sending it failed outright (and never with retry=False);
+        once it may have run, errors are raised, not retried.
+        """
+        with self.lock:
+            for attempt in range(2):
+                if self.sock is not None and self.is_stale():
+                    self.close()
+                reused = self.sock is not None
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    request_id, data = self.packet(RCON_COMMAND, command)
+                    sentinel_id, sentinel = self.packet(RCON_COMMAND, "")
+                    self.sock.sendall(data + sentinel)
+                except (OSError, RconError):
+                    self.close()
+                    if attempt == 1 or not (retry and reused):
+                        raise
+                    continue
+                try:
+                    reply = ""
+                    while True:
+                        reply_id, _, body = self.read_packet()
+                        if reply_id == sentinel_id:
+                            return reply
+                        if reply_id == request_id:
+                            reply += body
+                except (OSError, RconError):
+                    self.close()
+                    raise
+
+rcon_pool = {}
+rcon_pool_lock = threading.Lock()
+rcon_ports_claimed = set()
+
+def supports_rcon(implementation, server_type):
+    """Whether a server implementation speaks RCON"""
+    return implementation == "java" or server_type == "nukkit"
+
+def configure_rcon(server_directory, regenerate=False):
+    """Enable RCON in server.properties with a free port and a random password; returns the port"""
+    import secrets
+    properties_path = os.path.join(server_directory, "server.properties")
+    existing = read_properties(properties_path)
+    if not regenerate and existing.get('enable-rcon') == "true" and existing.get('rcon.password'):
+        return int(existing.get('rcon.port', 25575))
+    
+    with rcon_pool_lock:
+        used = {s.get('rcon_port') for s in list_servers()} | rcon_ports_claimed
+        port = get_config()["rcon_base_port"]
+        while port in used:
+            port += 1
+        rcon_ports_claimed.add(port)
+    update_properties(properties_path, {
+        'enable-rcon': "true",
+        'rcon.port': port,
+        'rcon.password': secrets.token_urlsafe(24),
+        'broadcast-rcon-to-ops': "false"
+    })
+    return port
+
+def get_rcon(server_directory):
+    """Pooled RCON connection for a server, from the settings in its server.properties"""
+    properties = read_properties(os.path.join(server_directory, "server.properties"))
+    if properties.get('enable-rcon') != "true" or not properties.get('rcon.password'):
+        raise RconError(f"RCON is not enabled for {server_directory}")
+    port = int(properties.get('rcon.port', 25575))
+    with rcon_pool_lock:
+        client = rcon_pool.get(server_directory)
+        if client is None or (client.port, client.password) != (port, properties['rcon.password']):
+            if client:
+                client.close()
+            client = RconClient("127.0.0.1", port, properties['rcon.password'], get_config()["rcon_timeout"])
+            rcon_pool[server_directory] = client
+    return client
+
+def rcon_command(server_directory, command):
+    """Run a console command on a server over RCON and return the reply"""
+    return get_rcon(server_directory).command(command)
+
+def rcon_fanout(server_directories, command, jobs=16):
+    """Send one command to many servers concurrently; returns {path: reply or exception}"""
+    import concurrent.futures
+    results = {}
+    if not server_directories:
+        return results
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(jobs, len(server_directories))) as pool:
+        futures = {pool.submit(rcon_command, path, command): path for path in server_directories}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    return results
+
+def server_command(server_directory, command):
+    """Run a command on a running server; returns the RCON reply, or None if it went via the console"""
+    try:
+        return rcon_command(server_directory, command)
+    except (OSError, RconError):
+        if send_console_command(server_directory, command):
+            return None
+        raise RuntimeError(f"Cannot reach the console of {server_directory}")
+
+def wait_for_log(server_directory, pattern, offset, timeout):
+    """Wait until a line matching pattern is written to a server's log after offset"""
+    deadline = time.time() + timeout
+    pending = b''
+    while time.time() < deadline:
+        data, offset = read_log(server_directory, offset)
+        *lines, pending = (pending + data).split(b'\n')
+        if any(pattern.search(line.decode('utf-8', 'replace')) for line in lines):
+            return True
+        if not data:
+            time.sleep(0.2)
+    return False
+
+def flush_worlds(server_directory, offset, timeout):
+    """Send "save-all flush" exactly once and wait up to timeout for the save; returns whether it was confirmed.
+
+    A full save can outlast rcon_timeout, so the pooled connection (which
+    retries) is not used: resending would only queue more full saves.
+    """
+    try:
+        pooled = get_rcon(server_directory)
+        client = RconClient(pooled.host, pooled.port, pooled.password, timeout)
+        client.connect()
+    except (OSError, RconError):
+        client = None  # Nothing sent yet, so the console can still take it
+    if client is not None:
+        try:
+            return bool(SAVED_PATTERN.search(client.command("save-all flush", retry=False)))
+        except (OSError, RconError):
+            return False  # Sent, but not confirmed in time; the save may still be running
+        finally:
+            client.close()
+    if not send_console_command(server_directory, "save-all flush"):
+        raise RuntimeError(f"Cannot reach the console of {server_directory}")
+    return wait_for_log(server_directory, SAVED_PATTERN, offset, timeout)
+
+# World backups: region files are split into chunks and every chunk, like every
+# other world file, is stored once in a content-addressed object store shared by
+# all servers. A snapshot is a manifest listing the objects that make it up.
+REGION_SECTOR = 4096
+backup_lock = FileLock(os.path.join(BACKUP_DIR, ".lock"))  # Object GC must not run while a snapshot is being written
+
+def get_world_dirs(server_directory):
+    """World folders of a server (directories holding a level.dat), relative to it"""
+    worlds = []
+    for parent in (server_directory, os.path.join(server_directory, "worlds")):
+        if os.path.isdir(parent):
+            for entry in sorted(os.listdir(parent)):
+                if os.path.exists(os.path.join(parent, entry, "level.dat")):
+                    worlds.append(os.path.relpath(os.path.join(parent, entry), server_directory))
+    return worlds
+
+def backup_object_path(digest):
+    """Path of a backup object"""
+    return os.path.join(BACKUP_DIR, "objects", digest[:2], digest)
+
+def put_backup_object(data):
+    """Store bytes in the backup object store unless already present; returns (digest, bytes written)"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = backup_object_path(digest)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest, len(data)
+
+def read_backup_object(digest):
+    """Load a backup object"""
+    with open(backup_object_path(digest), 'rb') as f:
+        return f.read()
+
+def backup_region_file(path, previous):
+    """Store the chunks of a .mca region file; returns (manifest entry, bytes written)"""
+    written = 0
+    chunks = []
+    old_chunks = {c[0]: c for c in (previous or {}).get('chunks', [])}
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 2 * REGION_SECTOR:
+            return None, 0  # Empty or truncated header: store the file whole
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for index in range(1024):
+                location, = struct.unpack_from(">I", mm, index * 4)
+                if location == 0:
+                    continue
+                timestamp, = struct.unpack_from(">I", mm, REGION_SECTOR + index * 4)
+                offset = (location >> 8) * REGION_SECTOR
+                if offset + 5 > size:
+                    continue  # Corrupt location entry
+                length, = struct.unpack_from(">I", mm, offset)
+                if length == 0 or offset + 4 + length > size:
+                    continue
+                old = old_chunks.get(index)
+                if old and old[1] == timestamp and old[3] == length + 4:
+                    chunks.append(old)  # Unchanged since the last snapshot: skip hashing
+                    continue
+                digest, count = put_backup_object(mm[offset:offset + 4 + length])
+                written += count
+                chunks.append([index, timestamp, digest, length + 4])
+    return {'type': "region", 'chunks': chunks}, written
+
+def backup_server(server_directory):
+    """Take an incremental snapshot of a server's worlds; returns the snapshot manifest"""
+    name = os.path.basename(server_directory)
+    snapshot_dir = os.path.join(BACKUP_DIR, name)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    
+    # Flush and pause saving so the files on disk are consistent while we read them
+    paused = False
+    try:
+        if get_server_pid(server_directory) is not None:
+            offset = log_end_offset(server_directory)
+            paused = True  # From here on, saving must be turned back on whatever happens
+            server_command(server_directory, "save-off")
+            if not flush_worlds(server_directory, offset, get_config()["save_timeout"]):
+                raise RuntimeError(f"{name} did not confirm saving its worlds within {get_config()['save_timeout']}s; "
+                                   "backup aborted rather than copying region files that may be mid-write")
+        
+        with backup_lock:
+            # Read under the lock: a prune may remove the previous snapshot and its objects
+            snapshots = list_snapshots(server_directory)
+            previous = load_snapshot(server_directory, snapshots[-1]) if snapshots else {'files': {}}
+            started = time.time()
+            snapshot_id = time.strftime("%Y%m%d-%H%M%S")
+            if snapshots and snapshots[-1].startswith(snapshot_id):
+                snapshot_id += f"-{len(snapshots)}"  # Several snapshots within one second
+            manifest = {'id': snapshot_id, 'server': name, 'created': time.time(),
+                        'worlds': get_world_dirs(server_directory), 'files': {}}
+            written = 0
+            for world in manifest['worlds']:
+                for root, _, files in os.walk(os.path.join(server_directory, world)):
+                    for filename in files:
+                        path = os.path.join(root, filename)
+                        rel = os.path.relpath(path, server_directory)
+                        stat = os.stat(path)
+                        old = previous['files'].get(rel)
+                        if old and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                            manifest['files'][rel] = old
+                            continue
+                        entry = None
+                        if filename.endswith(".mca"):
+                            entry, count = backup_region_file(path, old)
+                            written += count
+                        if entry is None:
+                            with open(path, 'rb') as f:
+                                digest, count = put_backup_object(f.read())
+                            written += count
+                            entry = {'type': "file", 'hash': digest}
+                        entry.update({'size': stat.st_size, 'mtime': stat.st_mtime})
+                        manifest['files'][rel] = entry
+            manifest['bytes_written'] = written
+            manifest['duration'] = time.time() - started
+            write_json_atomic(os.path.join(snapshot_dir, f"{manifest['id']}.json"), manifest)
+    finally:
+        if paused:
+            try:
+                server_command(server_directory, "save-on")
+            except RuntimeError as e:
+                print(f"WARNING: could not turn saving back on for {name} ({e}); run save-on on its console")
+    return manifest
+
+def list_snapshots(server_directory):
+    """Snapshot ids of a server, oldest first"""
+    snapshot_dir = os.path.join(BACKUP_DIR, os.path.basename(server_directory))
+    if not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(f[:-5] for f in os.listdir(snapshot_dir) if f.endswith(".json"))
+
+def load_snapshot(server_directory, snapshot_id):
+    """Load a snapshot manifest"""
+    path = os.path.join(BACKUP_DIR, os.path.basename(server_directory), f"{snapshot_id}.json")
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def restore_server(server_directory, snapshot_id=None):
+    """Replace a stopped server's worlds with a snapshot (latest by default)"""
+    if get_server_pid(server_directory):
+        raise RuntimeError("Stop the server before restoring a backup")
+    snapshots = list_snapshots(server_directory)
+    if not snapshots:
+        raise ValueError(f"No backups for {server_directory}")
+    manifest = load_snapshot(server_directory, snapshot_id or snapshots[-1])
+    
+    # Rebuild into a staging directory, then swap each world in
+    staging = os.path.join(server_directory, f".restore-{manifest['id']}")
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    for rel, entry in manifest['files'].items():
+        path = os.path.join(staging, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            if entry['type'] == "file":
+                f.write(read_backup_object(entry['hash']))
+            else:
+                # Lay the chunks out back to back after a fresh header
+                header = bytearray(2 * REGION_SECTOR)
+                sector = 2
+                f.write(header)
+                for index, timestamp, digest, length in entry['chunks']:
+                    data = read_backup_object(digest)
+                    sectors = -(-len(data) // REGION_SECTOR)
+                    struct.pack_into(">I", header, index * 4, (sector << 8) | min(sectors, 255))
+                    struct.pack_into(">I", header, REGION_SECTOR + index * 4, timestamp)
+                    f.write(data + b"\x00" * (sectors * REGION_SECTOR - len(data)))
+                    sector += sectors
+                f.seek(0)
+                f.write(header)
+        os.utime(path, (entry['mtime'], entry['mtime']))
+    
+    for world in set(manifest['worlds']) | set(get_world_dirs(server_directory)):
+        target = os.path.join(server_directory, world)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        if os.path.exists(os.path.join(staging, world)):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(os.path.join(staging, world), target)
+    shutil.rmtree(staging, ignore_errors=True)
+    invalidate_disk_usage(server_directory)
+    return manifest
+
+def prune_backups(server_directory, keep):
+    """Delete all but the newest keep snapshots, then drop objects no snapshot uses"""
+    snapshot_dir = os.path.join(BACKUP_DIR, os.path.basename(server_directory))
+    with backup_lock:
+        for snapshot_id in list_snapshots(server_directory)[:-keep] if keep else list_snapshots(server_directory):
+            os.remove(os.path.join(snapshot_dir, f"{snapshot_id}.json"))
+        return gc_backup_objects()
+
+def gc_backup_objects():
+    """Remove backup objects that no snapshot of any server references; returns bytes freed"""
+    started = time.time()
+    freed = 0
+    objects_dir = os.path.join(BACKUP_DIR, "objects")
+    with backup_lock:  # Shared with backups in every process, from reading the manifests to the last removal
+        referenced = set()
+        if os.path.isdir(BACKUP_DIR):
+            for name in os.listdir(BACKUP_DIR):
+                if name == "objects":
+                    continue
+                for snapshot_id in list_snapshots(name):
+                    for entry in load_snapshot(name, snapshot_id)['files'].values():
+                        if entry['type'] == "file":
+                            referenced.add(entry['hash'])
+                        else:
+                            referenced.update(c[2] for c in entry['chunks'])
+        if os.path.isdir(objects_dir):
+            for root, _, files in os.walk(objects_dir):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    if filename in referenced or os.path.getmtime(path) > started:
+                        continue  # Written after we started, by something that did not take the lock
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+    return freed
+
+def load_fleet_spec(spec_path):
+    """Load a fleet spec (JSON, or YAML if PyYAML is installed); returns (spec, servers)"""
+    with open(spec_path, 'r') as f:
+        text = f.read()
+    if spec_path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML fleet specs require PyYAML (pip install pyyaml)")
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+    
+    defaults = spec.get('defaults', {})
+    servers = []
+    for entry in spec.get('servers', []):
+        server = {'implementation': "java", 'type': "vanilla", **defaults, **entry}
+        if not server.get('name') or not (server.get('version') or server.get('template')):
+            raise ValueError(f"Fleet entry needs a name and a version or template: {entry}")
+        if server.get('profile') and server['profile'] not in PERFORMANCE_PROFILES:
+            raise ValueError(f"Unknown profile {server['profile']} for {server['name']}; "
+                             f"choose from {', '.join(PERFORMANCE_PROFILES)}")
+        servers.append(server)
+    
+    names = [s['name'] for s in servers]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate server names in fleet spec: {', '.join(duplicates)}")
+    return spec, servers
+
+def provision_server(server, initialize=True):
+    """Create one fleet server unless an identical one is already registered; returns (status, detail)"""
+    template = get_server(name=server['template']) if server.get('template') else None
+    if server.get('template') and not template:
+        return "failed", f"template {server['template']} is not registered"
+    source = template or server
+    wanted = (source['version'], source['type'], source['implementation'])
+    existing = get_server(name=server['name'])
+    if existing and not os.path.exists(existing['path']):
+        # Directory vanished: forget the stale entry and provision again
+        unregister_server(existing['path'])
+        existing = None
+    
+    if existing:
+        if (existing['version'], existing['type'], existing['implementation']) != wanted:
+            return "drifted", f"registered as {existing['implementation']}/{existing['type']} {existing['version']}"
+        if server.get('profile') and server['profile'] != existing.get('profile'):
+            changes = apply_profile(existing['path'], server['profile'])
+            return "updated", f"{existing['path']} (profile {server['profile']}, {len(changes)} settings changed)"
+        return "unchanged", existing['path']
+    
+    if template:
+        server_dir = clone_server(template['name'], server['name'])
+        if server.get('profile'):
+            apply_profile(server_dir, server['profile'])
+        return "created", f"{server_dir} (from {template['name']})"
+    
+    server_dir = create_server(server['name'], server['version'], server['type'], server['implementation'],
+                               profile=server.get('profile'))
+    if initialize:
+        result = initialize_server(server_dir)
+        if not result['ready']:
+            return "failed", f"{server_dir} did not boot within {result['elapsed']:.0f}s"
+        return "created", f"{server_dir} (booted in {result['elapsed']:.1f}s)"
+    return "created", server_dir
+
+def apply_fleet(spec_path, jobs=None):
+    """Provision every server in a fleet spec concurrently; safe to re-run"""
+    import concurrent.futures
+    spec, servers = load_fleet_spec(spec_path)
+    jobs = jobs or spec.get('concurrency') or get_config()["fleet_jobs"]
+    initialize = spec.get('initialize', True)
+    
+    results = []
+    print(f"Applying {len(servers)} servers from {spec_path} ({jobs} at a time)")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(provision_server, server, initialize): server for server in servers}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]['name']
+            try:
+                status, detail = future.result()
+            except Exception as e:
+                status, detail = "failed", str(e)
+            print(f"{status:9} {name}: {detail}")
+            results.append({'name': name, 'status': status, 'detail': detail})
+    return results
+
+# In-place upgrades: new jars are staged next to the old ones while servers
+# keep running, then swapped in; running servers restart a few at a time.
+def installed_artifact_matches(server, artifact):
+    """Whether a server's installed jar is already the resolved artifact"""
+    installed = server.get('artifact')
+    if artifact.get('hash'):
+        algorithm = artifact['hash'].split(":", 1)[0]
+        if installed and installed.split(":", 1)[0] == algorithm:
+            return installed == artifact['hash']
+        jar = os.path.join(server['path'], get_launcher(server['implementation'], server['type'])['file'])
+        return os.path.exists(jar) and f"{algorithm}:{hash_file(jar, algorithm)}" == artifact['hash']
+    # No published checksum: a URL naming one build is that build; a moving one
+    # matches while the host says it still serves what was installed from it
+    entry = load_store_index()['objects'].get(installed) if installed else None
+    if not entry or entry.get('url') != artifact['url']:
+        return False
+    if artifact.get('pinned'):
+        return True
+    return not revalidate_download(artifact['url'], entry.get('validators'))[0]
+
+def prepare_upgrade(server, version=None, refresh=True):
+    """Stage the newest jar for a server if it differs from the installed one; returns a plan or None.
+
+    Archives are only fetched into the store; they are unpacked when applied.
+    """
+    version = version or server['version']
+    artifact = resolve_artifact(server['implementation'], server['type'], version, refresh)
+    if version == server['version'] and installed_artifact_matches(server, artifact):
+        return None
+    staged = None
+    if artifact_format(artifact['url']) != "zip":
+        staged = os.path.join(server['path'], get_launcher(server['implementation'], server['type'])['file'] + ".upgrade")
+    key = store_fetch(artifact, staged, server['path'])
+    plan = {'version': version, 'artifact': key, 'staged': staged}
+    if version == server['version'] and key == server.get('artifact'):
+        discard_upgrade(server, plan)  # New URL, same bytes
+        return None
+    return plan
+
+def apply_upgrade(server, plan):
+    """Swap a staged jar in and record the new version; takes effect on the next start"""
+    filename = get_launcher(server['implementation'], server['type'])['file']
+    if plan['staged']:
+        os.replace(plan['staged'], os.path.join(server['path'], filename))
+    else:
+        unpack_stored_archive(plan['artifact'], server['path'], filename)
+    update_server(server['path'], version=plan['version'], artifact=plan['artifact'])
+    if server.get('artifact') and server['artifact'] != plan['artifact']:
+        store_release(server['path'], server['artifact'])
+    if server.get('profile'):
+        apply_profile(server['path'])  # New builds can bring new defaults
+
+def discard_upgrade(server, plan):
+    if plan['staged'] and os.path.exists(plan['staged']):
+        os.remove(plan['staged'])
+    if plan['artifact'] != server.get('artifact'):
+        store_release(server['path'], plan['artifact'])
+
+def upgrade_fleet(names=None, version=None, jobs=None, batch=None):
+    """Upgrade servers in place, downloading only changed jars; returns one result per server.
+
+    Jars are fetched in parallel first. Stopped servers then switch over at once,
+    running ones are restarted at most batch at a time, each waiting until the
+    previous ones are ready again. A server that fails to come back stops the
+    rollout, leaving the remaining servers on their old jar.
+    """
+    import concurrent.futures
+    config = get_config()
+    jobs = jobs or config["fleet_jobs"]
+    batch = batch or config["rolling_restarts"]
+    servers = [s for s in list_servers() if names is None or s['name'] in names]
+    missing = set(names or ()) - {s['name'] for s in servers}
+    if missing:
+        raise ValueError(f"Unknown servers: {', '.join(sorted(missing))}")
+    
+    results = []
+    def report(server, status, detail):
+        print(f"{status:9} {server['name']}: {detail}")
+        results.append({'name': server['name'], 'status': status, 'detail': detail})
+    
+    def change(server, plan):
+        if plan['version'] != server['version']:
+            return f"{server['version']} -> {plan['version']}"
+        return f"new {server['type']} build for {plan['version']}"
+    
+    plans = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(jobs, len(servers)), 1)) as pool:
+        # Look up each distinct target once; failures surface per server below
+        targets = {(s['implementation'], s['type'], version or s['version']) for s in servers}
+        for future in [pool.submit(resolve_artifact, *target, refresh=True) for target in targets]:
+            future.exception()
+        futures = {pool.submit(prepare_upgrade, server, version, False): server for server in servers}
+        for future in concurrent.futures.as_completed(futures):
+            server = futures[future]
+            try:
+                plan = future.result()
+            except Exception as e:
+                report(server, "failed", str(e))
+                continue
+            if plan is None:
+                report(server, "current", f"{server['version']} is up to date")
+            elif get_server_pid(server['path']):
+                plans.append((server, plan))
+            else:
+                apply_upgrade(server, plan)
+                report(server, "upgraded", change(server, plan))
+    
+    aborted = threading.Event()
+    def roll(server, plan):
+        if aborted.is_set():
+            discard_upgrade(server, plan)
+            return "skipped", "rollout stopped after a failed restart"
+        apply_upgrade(server, plan)
+        offset = log_end_offset(server['path'])
+        started = time.time()
+        call_manager("restart_server", server_directory=server['path'])
+        result = wait_for_ready(server['path'], offset, started=started)
+        if not result['ready']:
+            aborted.set()
+            return "failed", f"upgraded to {plan['version']} but not ready after restart ({result['reason']})"
+        return "restarted", f"{change(server, plan)}, ready in {result['elapsed']:.1f}s"
+    
+    if plans:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=batch) as pool:
+            futures = {pool.submit(roll, server, plan): server for server, plan in plans}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    status, detail = future.result()
+                except Exception as e:
+                    aborted.set()
+                    status, detail = "failed", str(e)
+                report(futures[future], status, detail)
+    return results
+
+# Sleep-on-idle proxy: asyncio front ends on the public ports of proxied Java
+# servers, whose real listeners move to localhost. Status pings of a sleeping
+# server are answered from its last status response; a login wakes it and is
+# spliced through once it is ready; an idle server is stopped again.
+PROXY_CHECK_INTERVAL = 30  # Seconds between idle checks and status refreshes
+proxy_ports_lock = threading.Lock()
+
+def get_status_cache_file(server_directory):
+    """Path of a server's cached status (MOTD) response"""
+    return os.path.join(RUN_DIR, f"{os.path.basename(server_directory)}.status.json")
+
+def enable_idle_proxy(server_directory):
+    """Move a Java server behind the idle proxy: its listener goes to a localhost port; returns (public, backend)"""
+    server = get_server(path=server_directory)
+    if server is None:
+        raise ValueError(f"Unknown server: {server_directory}")
+    if server['implementation'] != "java":
+        raise ValueError("Only Java servers can sleep behind the proxy (Bedrock clients use UDP)")
+    if server.get('proxy_port'):
+        return server['proxy_port'], server['backend_port']
+    properties_path = os.path.join(server_directory, "server.properties")
+    public_port = int(read_properties(properties_path).get('server-port') or 25565)
+    with proxy_ports_lock:
+        used = {s.get('backend_port') for s in list_servers()}
+        port = get_config()["proxy_backend_base_port"]
+        while port in used:
+            port += 1
+        update_server(server_directory, proxy_port=public_port, backend_port=port)
+    update_properties(properties_path, {'server-port': port, 'server-ip': "127.0.0.1"})
+    return public_port, port
 
-def get_forge_build(version):
-    """Get latest Forge build for a version"""
-    # Simplified - would query Forge files
-    return "47.1.0"  # Placeholder
+def disable_idle_proxy(server_directory):
+    """Give a proxied server its public port back"""
+    server = get_server(path=server_directory)
+    if server is None or not server.get('proxy_port'):
+        return
+    update_properties(os.path.join(server_directory, "server.properties"),
+                      {'server-port': server['proxy_port'], 'server-ip': ""})
+    update_server(server_directory, proxy_port=None, backend_port=None)
 
-def get_vanilla_url(version):
-    """Get Vanilla server URL for a specific version"""
-    try:
-        response = requests.get(VERSION_MANIFEST_URL)
-        manifest = response.json()
-        
-        # Find version details
-        version_entry = next(v for v in manifest['versions'] if v['id'] == version)
-        version_manifest = requests.get(version_entry['url']).json()
-        return version_manifest['downloads']['server']['url']
-    except:
-        # Fallback URL
-        return f"https://piston-data.mojang.com/v1/objects/{version}/server.jar"
+def encode_varint(value):
+    """Minecraft protocol VarInt"""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
 
-def get_paper_url(version):
-    """Get Paper server URL"""
-    build = get_paper_build(version)
-    if not build:
-        raise ValueError(f"No Paper build found for {version}")
-    return f"https://api.papermc.io/v2/projects/paper/versions/{version}/builds/{build}/downloads/paper-{version}-{build}.jar"
+def decode_varint(data, pos=0):
+    """Decode a VarInt from data at pos; returns (value, next pos)"""
+    value = 0
+    for i in range(5):
+        if pos >= len(data):
+            raise ValueError("Truncated VarInt")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return (value - (1 << 32) if value & 0x80000000 else value), pos
+    raise ValueError("VarInt is too long")
 
-def get_server_data():
-    """Load server data from JSON file"""
-    if os.path.exists(SERVER_DATA_FILE):
-        try:
-            with open(SERVER_DATA_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {'servers': []}
-    return {'servers': []}
+def encode_packet(packet_id, payload=b''):
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
 
-def save_server_data(data):
-    """Save server data to JSON file"""
-    with open(SERVER_DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def encode_string(text):
+    data = text.encode('utf-8')
+    return encode_varint(len(data)) + data
 
-def create_server(server_name, version, server_type="vanilla", implementation="java"):
-    """Create a new Minecraft server"""
-    # Create server directory
-    server_dir_name = f"minecraft_server_{server_name}"
-    server_dir = os.path.join(os.path.expanduser("~"), server_dir_name)
-    os.makedirs(server_dir, exist_ok=True)
+async def read_packet(reader):
+    """Read one length-prefixed packet; returns (raw bytes, packet id, payload)"""
+    prefix = b''
+    for _ in range(3):
+        prefix += await reader.readexactly(1)
+        if not prefix[-1] & 0x80:
+            break
+    length = decode_varint(prefix)[0]
+    if not 0 < length <= 65536:
+        raise ValueError(f"Bad packet length {length}")
+    body = await reader.readexactly(length)
+    packet_id, pos = decode_varint(body)
+    return prefix + body, packet_id, body[pos:]
+
+def parse_handshake(payload):
+    """Handshake fields: (protocol version, address, port, next state)"""
+    protocol, pos = decode_varint(payload)
+    length, pos = decode_varint(payload, pos)
+    address = payload[pos:pos + length].decode('utf-8', 'replace')
+    pos += length
+    port = struct.unpack_from(">H", payload, pos)[0]
+    next_state = decode_varint(payload, pos + 2)[0]
+    return protocol, address, port, next_state
+
+async def query_status(port, host="127.0.0.1", timeout=5):
+    """Ask a Java server for its status response (the server list MOTD); returns a dict"""
+    import asyncio
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        handshake = encode_varint(-1) + encode_string(host) + struct.pack(">H", port) + encode_varint(1)
+        writer.write(encode_packet(0, handshake) + encode_packet(0))
+        await writer.drain()
+        _, packet_id, payload = await asyncio.wait_for(read_packet(reader), timeout)
+        length, pos = decode_varint(payload)
+        return json.loads(payload[pos:pos + length].decode('utf-8'))
+    finally:
+        writer.close()
+
+class IdleProxy:
+    """Front end for one proxied server: answers pings while it sleeps, wakes it for logins"""
+    def __init__(self, server):
+        self.server = server
+        self.path = server['path']
+        self.backend_port = server['backend_port']
+        self.connections = 0
+        self.last_active = time.time()
+        self.waking = None  # asyncio task starting the server, shared by every waiting login
     
-    # Hide the folder
-    server_dir = hide_folder(server_dir) or server_dir
+    def is_running(self):
+        return bool(get_server_pid(self.path))
     
-    # Get server URL
-    try:
-        url = SERVER_URLS[implementation][server_type](version)
-    except KeyError:
-        raise ValueError(f"Unsupported server type: {implementation}/{server_type}")
+    def load_status(self):
+        try:
+            with open(get_status_cache_file(self.path), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
     
-    # Download server jar
-    jar_path = os.path.join(server_dir, "server.jar")
-    download_file(url, jar_path)
+    def sleeping_status(self, protocol, starting=False):
+        """Status response shown while the server is stopped or still booting"""
+        status = self.load_status()
+        if status is None:
+            properties = read_properties(os.path.join(self.path, "server.properties"))
+            status = {
+                'version': {'name': self.server['version'], 'protocol': protocol},
+                'players': {'max': int(properties.get('max-players') or 20)},
+                'description': {'text': properties.get('motd') or "A Minecraft Server"}
+            }
+        status['players'] = {'max': status.get('players', {}).get('max', 20), 'online': 0}
+        status['description'] = {'text': "", 'extra': [status.get('description', ""), "\n§7Starting..." if starting else "\n§7Sleeping - join to start it"]}
+        return status
     
-    # Create essential files
-    eula_path = os.path.join(server_dir, "eula.txt")
-    with open(eula_path, 'w') as f:
-        f.write("eula=true\n")
+    async def refresh_status(self):
+        """Cache the running server's status response for when it sleeps"""
+        try:
+            status = await query_status(self.backend_port)
+        except Exception:
+            return  # Still booting, or not answering; keep the last good response
+        status.get('players', {}).pop('sample', None)
+        os.makedirs(RUN_DIR, exist_ok=True)
+        write_json_atomic(get_status_cache_file(self.path), status)
     
-    # Save to server data
-    server_data = get_server_data()
-    server_data['servers'].append({
-        'name': server_name,
-        'version': version,
-        'type': server_type,
-        'implementation': implementation,
-        'path': server_dir,
-        'created': time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-    save_server_data(server_data)
+    async def wake(self):
+        """Start the server and wait until it is ready; returns True once it accepts players"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        offset = log_end_offset(self.path)
+        started = time.time()
+        print(f"Waking {self.server['name']}")
+        try:
+            await loop.run_in_executor(None, lambda: call_manager("start_server", server_directory=self.path))
+        except Exception as e:
+            print(f"Could not start {self.server['name']}: {e}")
+            return False
+        result = await loop.run_in_executor(None, wait_for_ready, self.path, offset, None, started)
+        self.last_active = time.time()
+        if result['ready']:
+            print(f"{self.server['name']} is up after {result['elapsed']:.1f}s")
+            await self.refresh_status()
+        return result['ready']
     
-    return server_dir
-
-def download_file(url, file_path):
-    """Download a file with progress and error handling"""
-    try:
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total_size = int(r.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(file_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            print(f"Downloading... {progress:.1f}%", end='\r')
+    async def handle(self, reader, writer):
+        import asyncio
+        self.connections += 1
+        try:
+            try:
+                raw, packet_id, payload = await asyncio.wait_for(read_packet(reader), 10)
+                if packet_id != 0:
+                    raise ValueError("Expected a handshake")
+                protocol, _, _, next_state = parse_handshake(payload)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, struct.error, OSError):
+                return  # Legacy ping, port scanner or a dropped connection
             
-            print("\nDownload complete.")
-            return True
-    except Exception as e:
-        print(f"Download failed: {str(e)}")
-        return False
-
-def start_server(server_directory):
-    """Start an existing Minecraft server"""
-    server_file = os.path.join(server_directory, "server.jar")
-    log_file = os.path.join(LOG_DIR, f"{os.path.basename(server_directory)}.log")
+            starting = self.waking is not None and not self.waking.done()
+            if next_state == 1 and (starting or not self.is_running()):
+                await self.answer_status(reader, writer, self.sleeping_status(protocol, starting))
+                return
+            if next_state == 2 and (starting or not self.is_running()):
+                if not starting:
+                    self.waking = asyncio.ensure_future(self.wake())
+                try:
+                    ready = await asyncio.wait_for(asyncio.shield(self.waking), get_config()["proxy_hold_seconds"])
+                except asyncio.TimeoutError:
+                    ready = False
+                if not ready:
+                    reason = json.dumps({'text': "The server is starting, please reconnect in a moment"})
+                    writer.write(encode_packet(0, encode_string(reason)))
+                    await writer.drain()
+                    return
+            await self.splice(raw, reader, writer)
+        except Exception as e:
+            print(f"{self.server['name']}: proxy connection failed: {e}")
+        finally:
+            self.connections -= 1
+            self.last_active = time.time()
+            writer.close()
     
-    # Create log file if it doesn't exist
-    open(log_file, 'a').close()
+    async def answer_status(self, reader, writer, status):
+        import asyncio
+        status = json.dumps(status)
+        while True:
+            try:
+                _, packet_id, payload = await asyncio.wait_for(read_packet(reader), 10)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, OSError):
+                return
+            if packet_id == 0:
+                writer.write(encode_packet(0, encode_string(status)))
+            elif packet_id == 1:
+                writer.write(encode_packet(1, payload))  # Pong echoes the ping's payload
+                await writer.drain()
+                return
+            await writer.drain()
     
-    # Start server
-    if platform.system() == "Windows":
-        subprocess.Popen(
-            ["java", "-Xmx1024M", "-Xms1024M", "-jar", server_file, "nogui"],
-            cwd=server_directory,
-            stdout=open(log_file, 'a'),
-            stderr=subprocess.STDOUT
-        )
-    else:
-        # Use screen for Linux/macOS/Termux
-        screen_name = f"mc_{os.path.basename(server_directory)}"
-        cmd = f"screen -dmS {screen_name} java -Xmx1024M -Xms1024M -jar {server_file} nogui"
-        subprocess.Popen(cmd, shell=True, cwd=server_directory)
+    async def splice(self, first, reader, writer):
+        """Forward the connection to the server, starting with the already-read handshake"""
+        import asyncio
+        try:
+            backend_reader, backend_writer = await asyncio.open_connection("127.0.0.1", self.backend_port)
+        except OSError:
+            return  # Booting or shutting down: the client sees a closed connection
+        backend_writer.write(first)
+        
+        async def pump(src, dst):
+            try:
+                while True:
+                    data = await src.read(65536)
+                    if not data:
+                        break
+                    dst.write(data)
+                    await dst.drain()
+            except OSError:
+                pass
+            finally:
+                try:
+                    if dst.can_write_eof():
+                        dst.write_eof()
+                    else:
+                        dst.close()
+                except OSError:
+                    pass
+        
+        try:
+            await asyncio.gather(pump(reader, backend_writer), pump(backend_reader, writer))
+        finally:
+            backend_writer.close()
     
-    print(f"Server started in background. Log: {log_file}")
+    async def watch(self):
+        """Stop the server after idle_stop_minutes without connections; keep its status cached"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        idle_limit = get_config()["idle_stop_minutes"] * 60
+        while True:
+            await asyncio.sleep(min(PROXY_CHECK_INTERVAL, idle_limit or PROXY_CHECK_INTERVAL))
+            if not self.is_running() or (self.waking and not self.waking.done()):
+                continue
+            if self.connections:
+                self.last_active = time.time()
+                await self.refresh_status()
+            elif idle_limit and time.time() - self.last_active >= idle_limit:
+                print(f"Stopping {self.server['name']}: idle for {(time.time() - self.last_active) / 60:.0f} minutes")
+                await loop.run_in_executor(None, lambda: call_manager("stop_server", server_directory=self.path))
+
+async def serve_idle_proxies(servers):
+    import asyncio
+    proxies = [IdleProxy(server) for server in servers]
+    listeners = []
+    for proxy in proxies:
+        listeners.append(await asyncio.start_server(proxy.handle, None, proxy.server['proxy_port']))
+        print(f"{proxy.server['name']}: listening on port {proxy.server['proxy_port']} "
+              f"(server on 127.0.0.1:{proxy.backend_port}, {'running' if proxy.is_running() else 'asleep'})")
+        if proxy.is_running():
+            await proxy.refresh_status()
+    await asyncio.gather(*(proxy.watch() for proxy in proxies))
+
+def run_idle_proxy(names=None):
+    """Run the sleep-on-idle proxy in the foreground for every proxied server (or the named ones)"""
+    import asyncio
+    servers = [s for s in list_servers() if s.get('proxy_port') and (names is None or s['name'] in names)]
+    if not servers:
+        raise ValueError("No servers use the idle proxy (enable it with --sleep-on-idle NAMES)")
+    try:
+        asyncio.run(serve_idle_proxies(servers))
+    except KeyboardInterrupt:
+        pass
+
+# Manager daemon: keeps the registry, caches, telemetry and supervised processes
+# in one long-lived process and serves JSON-RPC 2.0 over a Unix socket (a named
+# pipe on Windows). call_manager talks to it, or runs the method locally.
+DAEMON_KEY_FILE = os.path.join(RUN_DIR, "daemon.key")
+
+class DaemonUnavailable(Exception):
+    pass
 
-def stop_server(server_directory):
-    """Stop an existing Minecraft server"""
+def get_daemon_address():
+    """Listener address and family for the manager daemon"""
     if platform.system() == "Windows":
-        # Find and kill Java process
-        subprocess.run(["taskkill", "/f", "/im", "java.exe"], stderr=subprocess.DEVNULL)
-    else:
-        # Stop screen session
-        screen_name = f"mc_{os.path.basename(server_directory)}"
-        subprocess.run(["screen", "-S", screen_name, "-X", "stuff", "stop\n"])
-        subprocess.run(["screen", "-S", screen_name, "-X", "quit"])
+        user = hashlib.sha1(os.path.expanduser("~").encode()).hexdigest()[:12]
+        return rf"\\.\pipe\minecraft_server_manager-{user}", "AF_PIPE"
+    return os.path.join(RUN_DIR, "manager.sock"), "AF_UNIX"
 
-def restart_server(server_directory):
-    """Restart an existing Minecraft server"""
-    stop_server(server_directory)
-    time.sleep(5)  # Wait for server to stop
-    start_server(server_directory)
+def get_daemon_key(create=False):
+    """Shared secret clients use to authenticate to the daemon"""
+    import secrets
+    if create and not os.path.exists(DAEMON_KEY_FILE):
+        os.makedirs(RUN_DIR, exist_ok=True)
+        fd = os.open(DAEMON_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+    with open(DAEMON_KEY_FILE, 'r') as f:
+        return f.read().strip().encode()
 
-def delete_server(server_directory):
-    """Delete a server and its data"""
-    # Remove from server data
-    server_data = get_server_data()
-    server_data['servers'] = [s for s in server_data['servers'] if s['path'] != server_directory]
-    save_server_data(server_data)
-    
-    # Remove server directory
+def server_status():
+    """Every registered server with its process state and latest telemetry"""
+    servers = list_servers()
+    if telemetry_thread is None:
+        # No background sampler: two samples a moment apart give a CPU reading
+        sample_servers()
+        if any(get_server_stats(s['path']).get('up') for s in servers):
+            time.sleep(0.5)
+            sample_servers()
+        refresh_disk_usage()
+    disk_usage = get_disk_usage()
+    for server in servers:
+        pid = get_server_pid(server['path'])
+        server['pid'] = pid
+        server['state'] = read_server_state(server['path']).get('state') if pid else "stopped"
+        server['stats'] = get_server_stats(server['path'])
+        server['disk_bytes'] = disk_usage.get(server['path'])
+    return servers
+
+def snapshot_summary(manifest):
+    """A snapshot manifest with its file list replaced by a count, for sending to clients"""
+    summary = {k: v for k, v in manifest.items() if k != 'files'}
+    summary['file_count'] = len(manifest['files'])
+    return summary
+
+DAEMON_METHODS = {
+    'ping': lambda: {'pid': os.getpid()},
+    'status': server_status,
+    'versions': get_available_versions,
+    'create_server': create_server,
+    'start_server': start_server,
+    'stop_server': stop_server,
+    'restart_server': restart_server,
+    'delete_server': delete_server,
+    'backup_server': lambda server_directory: snapshot_summary(backup_server(server_directory)),
+    'restore_server': lambda server_directory, snapshot_id=None: snapshot_summary(restore_server(server_directory, snapshot_id)),
+    'list_snapshots': list_snapshots,
+    'list_trash': list_trash,
+    'undelete_server': undelete_server,
+    'rcon_command': rcon_command,
+    'lag_report': lag_report,
+    'profile_diff': profile_diff,
+    'apply_profile': apply_profile,
+}
+
+def daemon_call(method, **params):
+    """Call a method on the running daemon; raises DaemonUnavailable if there is none"""
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Client
+    address, family = get_daemon_address()
+    try:
+        conn = Client(address, family=family, authkey=get_daemon_key())
+    except (OSError, EOFError, AuthenticationError) as e:
+        raise DaemonUnavailable(str(e))
+    with conn:
+        conn.send_bytes(json.dumps({'jsonrpc': "2.0", 'id': 1, 'method': method, 'params': params}).encode())
+        response = json.loads(conn.recv_bytes())
+    if 'error' in response:
+        raise RuntimeError(response['error']['message'])
+    return response['result']
+
+def call_manager(method, **params):
+    """Run a manager operation through the daemon if one is running, otherwise in-process"""
+    try:
+        return daemon_call(method, **params)
+    except DaemonUnavailable:
+        return DAEMON_METHODS[method](**params)
+
+def is_daemon_running():
+    """Whether a manager daemon answers on this host"""
+    try:
+        daemon_call("ping")
+        return True
+    except (DaemonUnavailable, RuntimeError):
+        return False
+
+def handle_daemon_request(request):
+    """Dispatch one JSON-RPC request to DAEMON_METHODS"""
+    response = {'jsonrpc': "2.0", 'id': request.get('id')}
+    method = DAEMON_METHODS.get(request.get('method'))
+    if method is None:
+        response['error'] = {'code': -32601, 'message': f"Unknown method: {request.get('method')}"}
+        return response
     try:
-        shutil.rmtree(server_directory)
+        response['result'] = method(**request.get('params', {}))
+    except TypeError as e:
+        response['error'] = {'code': -32602, 'message': str(e)}
     except Exception as e:
-        return f"Could not delete server directory: {e}"
+        response['error'] = {'code': -32000, 'message': str(e)}
+    return response
+
+def serve_daemon_connection(conn):
+    """Answer requests on one client connection until it closes"""
+    with conn:
+        while True:
+            try:
+                request = json.loads(conn.recv_bytes())
+            except (EOFError, OSError):
+                return
+            except ValueError:
+                conn.send_bytes(json.dumps({'jsonrpc': "2.0", 'id': None,
+                                            'error': {'code': -32700, 'message': "Parse error"}}).encode())
+                continue
+            conn.send_bytes(json.dumps(handle_daemon_request(request), default=str).encode())
+
+def run_daemon():
+    """Run the manager daemon in the foreground until interrupted"""
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Listener
+    if is_daemon_running():
+        raise RuntimeError("A manager daemon is already running")
+    address, family = get_daemon_address()
+    if family == "AF_UNIX" and os.path.exists(address):
+        os.remove(address)  # Left behind by a daemon that did not shut down cleanly
     
-    # Remove log file
-    log_file = os.path.join(LOG_DIR, f"{os.path.basename(server_directory)}.log")
-    if os.path.exists(log_file):
-        try:
-            os.remove(log_file)
-        except:
-            pass
+    os.makedirs(RUN_DIR, exist_ok=True)
+    old_umask = os.umask(0o077) if family == "AF_UNIX" else None
+    try:
+        listener = Listener(address, family=family, authkey=get_daemon_key(create=True))
+    finally:
+        if old_umask is not None:
+            os.umask(old_umask)
     
-    return "Server deleted successfully"
+    start_telemetry()
+    start_trash_reaper()
+    adopted = adopt_running_servers()
+    print(f"Manager daemon listening on {address} ({len(adopted)} running servers adopted)")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # Failed handshake (e.g. wrong key)
+            threading.Thread(target=serve_daemon_connection, args=(conn,), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        print("Manager daemon stopped; servers keep running")
+
+# Modules that must only load when an operation needs them (see --timings)
+LAZY_MODULES = ("requests", "urllib3", "tkinter", "sqlite3", "concurrent.futures")
+
+def report_timings(runs=5):
+    """Time interpreter start, module import and the first CLI prompt in fresh processes"""
+    script = os.path.abspath(__file__)
+    probe = (f"import sys; sys.path.insert(0, {os.path.dirname(script)!r}); import minecraft_server_manager; "
+             f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    cases = [
+        ("Python interpreter", [sys.executable, "-c", "pass"]),
+        ("Import manager", [sys.executable, "-c", probe]),
+        ("First prompt (--cli --manage)", [sys.executable, script, "--cli", "--manage"]),
+        ("HTTP stack (requests)", [sys.executable, "-c", "import requests"]),
+        ("GUI stack (tkinter)", [sys.executable, "-c", "import tkinter"]),
+    ]
+    eager = ""
+    for label, cmd in cases:
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, text=True)
+            samples.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            print(f"{label:32} unavailable")
+            continue
+        if cmd[-1] == probe:
+            eager = result.stdout.strip()
+        samples.sort()
+        print(f"{label:32} {samples[len(samples) // 2]:7.1f} ms (median of {runs}, best {samples[0]:.1f} ms)")
+    if eager:
+        print(f"Warning: importing the manager loaded {eager}; these should load on first use")
+    return not eager
+
+def cli_choose_profile(current=None):
+    """Ask for a performance profile; returns its name, or current if none is picked"""
+    profiles = list(PERFORMANCE_PROFILES)
+    print("Select performance profile:")
+    print(f"0. {current or 'None'} (keep current settings)" if current else "0. None (server defaults)")
+    for i, name in enumerate(profiles, 1):
+        print(f"{i}. {name}: {PERFORMANCE_PROFILES[name]['description']}")
+    choice = input(f"Choice (0-{len(profiles)}): ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(profiles):
+        return profiles[int(choice) - 1]
+    return current
 
 def cli_install_server():
     """Command-line interface for server installation"""
@@ -316,61 +4514,206 @@ def cli_install_server():
     else:
         server_type = "vanilla"
     
+    profile = cli_choose_profile()
+    
     # Create server
     try:
-        server_dir = create_server(server_name, version, server_type, implementation)
+        server_dir = create_server(server_name, version, server_type, implementation, console_progress, profile=profile)
         print(f"Server created at: {server_dir}")
         
         # Start server to generate files
         print("Starting server to initialize files...")
-        start_server(server_dir)
-        time.sleep(30)
-        stop_server(server_dir)
-        print("Server initialized successfully")
+        result = initialize_server(server_dir)
+        if result['ready']:
+            print(f"Server initialized successfully in {result['elapsed']:.1f}s")
+        else:
+            print(f"Server did not finish booting within {result['elapsed']:.0f}s; check {get_log_file(server_dir)}")
     except Exception as e:
         print(f"Error creating server: {str(e)}")
 
 def cli_manage_servers():
     """Command-line interface for server management"""
-    server_data = get_server_data()
-    if not server_data['servers']:
+    servers = call_manager("status")
+    if not servers:
         print("No servers found")
         return
     
     print("===== Minecraft Server Manager (CLI) =====")
-    print("ID | Name          | Version | Type")
-    print("-" * 40)
+    print("ID | Name          | Version | Type     | Status  | CPU    | Memory | Disk")
+    print("-" * 78)
     
-    for i, server in enumerate(server_data['servers'], 1):
-        print(f"{i:2} | {server['name'][:12]:12} | {server['version']:7} | {server['type']}")
+    for i, server in enumerate(servers, 1):
+        stats = server['stats']
+        cpu = f"{stats['cpu_percent']:.0f}%" if stats.get('cpu_percent') is not None else "-"
+        print(f"{i:2} | {server['name'][:12]:12} | {server['version']:7} | {server['type']:8} | {server['state'][:7]:7} | {cpu:6} | {format_bytes(stats.get('rss_bytes')):6} | {format_bytes(server.get('disk_bytes'))}")
     
     choice = input("\nSelect server ID (0 to exit): ").strip()
     if not choice.isdigit() or int(choice) == 0:
         return
     
     server_id = int(choice) - 1
-    if server_id < 0 or server_id >= len(server_data['servers']):
+    if server_id < 0 or server_id >= len(servers):
         print("Invalid selection")
         return
     
-    server = server_data['servers'][server_id]
+    server = servers[server_id]
     
     print("\nActions:")
     print("1. Start server")
     print("2. Stop server")
     print("3. Restart server")
     print("4. Delete server")
-    action = input("Choice (1-4): ").strip()
-    
-    if action == "1":
-        start_server(server['path'])
-    elif action == "2":
-        stop_server(server['path'])
-    elif action == "3":
-        restart_server(server['path'])
-    elif action == "4":
-        result = delete_server(server['path'])
-        print(result)
+    print("5. Send console command")
+    print("6. Back up worlds")
+    print("7. Restore a backup")
+    print("8. Show console log")
+    print("9. Performance profile")
+    action = input("Choice (1-9): ").strip()
+    
+    try:
+        if action == "1":
+            pid = call_manager("start_server", server_directory=server['path'])
+            print(f"Server started in background (PID {pid}). Log: {get_log_file(server['path'])}")
+        elif action == "2":
+            stopped = call_manager("stop_server", server_directory=server['path'])
+            print("Server stopped" if stopped else "Server did not stop")
+        elif action == "3":
+            pid = call_manager("restart_server", server_directory=server['path'])
+            print(f"Server restarted (PID {pid})")
+        elif action == "4":
+            print(call_manager("delete_server", server_directory=server['path']))
+        elif action == "5":
+            command = input("Command: ").strip()
+            try:
+                print(call_manager("rcon_command", server_directory=server['path'], command=command) or "(no output)")
+            except (OSError, RconError) as e:
+                print(f"Could not reach server over RCON: {e}")
+        elif action == "6":
+            summary = call_manager("backup_server", server_directory=server['path'])
+            print(f"Backup {summary['id']}: {summary['file_count']} files, "
+                  f"{format_bytes(summary['bytes_written'])} new data in {summary['duration']:.1f}s")
+        elif action == "7":
+            snapshots = call_manager("list_snapshots", server_directory=server['path'])
+            if not snapshots:
+                print("No backups found")
+                return
+            print(f"Backups: {', '.join(snapshots)}")
+            snapshot_id = input(f"Restore which backup [{snapshots[-1]}]: ").strip() or snapshots[-1]
+            try:
+                call_manager("restore_server", server_directory=server['path'], snapshot_id=snapshot_id)
+                print(f"Restored backup {snapshot_id}")
+            except (RuntimeError, ValueError, OSError) as e:
+                print(f"Restore failed: {e}")
+        elif action == "8":
+            for line in tail_log(server['path'], 50):
+                print(line)
+            if input("Follow new output? (y/n): ").strip().lower() == "y":
+                print("(Ctrl+C to stop)")
+                try:
+                    for line in follow_log(server['path']):
+                        print(line, flush=True)
+                except KeyboardInterrupt:
+                    pass
+        elif action == "9":
+            profile = cli_choose_profile(server.get('profile'))
+            if not profile:
+                return
+            if print_profile_diff([server], profile) and input("Apply these settings? (y/n): ").strip().lower() == "y":
+                call_manager("apply_profile", server_directory=server['path'], profile=profile)
+                print(f"Applied {profile}" + ("; restart the server for it to take effect" if server['state'] == "running" else ""))
+    except RuntimeError as e:
+        print(f"Error: {e}")
+
+# Background jobs for the GUIs. Workers never touch Tk: they post
+# (task, kind, payload) events to a queue that the window drains with after().
+class Task:
+    """One background job; the job reports progress and checks for cancellation through it"""
+    def __init__(self, task_id, label, events):
+        self.id = task_id
+        self.label = label
+        self.events = events
+        self.cancelled = threading.Event()
+        self.future = None
+        self.last_report = 0
+    
+    def progress(self, downloaded, total, rate):
+        """Download progress callback; throttled so the queue is not flooded"""
+        now = time.time()
+        if now - self.last_report < 0.1 and not (total and downloaded >= total):
+            return
+        self.last_report = now
+        eta = (total - downloaded) / rate if total and rate else None
+        self.events.put((self, "progress", {'downloaded': downloaded, 'total': total, 'rate': rate, 'eta': eta}))
+    
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise DownloadCancelled(f"{self.label} cancelled")
+    
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.events.put((self, "cancelled", None))  # Never started
+
+class TaskRunner:
+    """Runs jobs on a worker pool and reports their progress and outcome through a queue"""
+    def __init__(self, workers=None):
+        import concurrent.futures
+        import queue
+        self.events = queue.Queue()
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers or get_config()["gui_workers"])
+        self.tasks = {}
+        self.next_id = 0
+    
+    def submit(self, label, job):
+        """Queue job(task); returns the Task"""
+        self.next_id += 1
+        task = Task(self.next_id, label, self.events)
+        self.tasks[task.id] = task
+        self.events.put((task, "queued", None))
+        task.future = self.pool.submit(self.run, task, job)
+        return task
+    
+    def run(self, task, job):
+        if task.cancelled.is_set():
+            self.events.put((task, "cancelled", None))
+            return
+        self.events.put((task, "running", None))
+        try:
+            result = job(task)
+        except DownloadCancelled:
+            self.events.put((task, "cancelled", None))
+        except Exception as e:
+            self.events.put((task, "failed", str(e)))
+        else:
+            self.events.put((task, "done", result))
+    
+    def active(self):
+        return [t for t in self.tasks.values() if not t.future.done()]
+    
+    def poll(self, handler):
+        """Pass every pending event to handler(task, kind, payload); call from the Tk thread"""
+        import queue
+        while True:
+            try:
+                task, kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if kind in ("done", "failed", "cancelled"):
+                self.tasks.pop(task.id, None)
+            handler(task, kind, payload)
+    
+    def shutdown(self):
+        """Cancel everything and stop accepting work without waiting for running jobs"""
+        for task in list(self.tasks.values()):
+            task.cancel()
+        self.pool.shutdown(wait=False)
+
+def format_eta(seconds):
+    """Minutes and seconds left, for progress displays"""
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
 
 def gui_install_server():
     """GUI interface for server installation"""
@@ -378,18 +4721,22 @@ def gui_install_server():
         def __init__(self):
             super().__init__()
             self.title("Minecraft Server Installer")
-            self.geometry("500x400")
-            self.resizable(False, False)
+            self.geometry("600x570")
+            self.minsize(500, 500)
             
             # Variables
             self.server_name = tk.StringVar()
             self.version = tk.StringVar()
             self.server_type = tk.StringVar(value="vanilla")
             self.implementation = tk.StringVar(value="java")
+            self.profile = tk.StringVar(value="none")
             self.versions = []
+            self.runner = TaskRunner()
             
             self.create_widgets()
             self.load_versions()
+            self.protocol("WM_DELETE_WINDOW", self.on_close)
+            self.after(100, self.poll_tasks)
             
         def create_widgets(self):
             ttk.Label(self, text="Server Name:").grid(row=0, column=0, padx=10, pady=10, sticky="w")
@@ -409,19 +4756,36 @@ def gui_install_server():
             self.type_combo = ttk.Combobox(self, textvariable=self.server_type, width=15)
             self.type_combo.grid(row=3, column=1, padx=10, pady=10, sticky="w")
             
-            ttk.Button(self, text="Install Server", command=self.install).grid(row=4, column=0, columnspan=2, pady=20)
+            ttk.Label(self, text="Performance Profile:").grid(row=4, column=0, padx=10, pady=10, sticky="w")
+            profile_combo = ttk.Combobox(self, textvariable=self.profile, values=["none", *PERFORMANCE_PROFILES], width=15, state="readonly")
+            profile_combo.grid(row=4, column=1, padx=10, pady=10, sticky="w")
+            
+            ttk.Button(self, text="Install Server", command=self.install).grid(row=5, column=0, columnspan=2, pady=10)
+            
+            # Installs run in the background; several can be in flight at once
+            self.task_tree = ttk.Treeview(self, columns=("server", "status", "progress", "speed", "eta"), show="headings", height=5)
+            for column, heading, width in (("server", "Server", 140), ("status", "Status", 160), ("progress", "Progress", 80),
+                                           ("speed", "Speed", 80), ("eta", "ETA", 60)):
+                self.task_tree.heading(column, text=heading)
+                self.task_tree.column(column, width=width)
+            self.task_tree.grid(row=6, column=0, columnspan=2, padx=10, sticky="nsew")
+            self.cancel_btn = ttk.Button(self, text="Cancel Selected", command=self.cancel_selected)
+            self.cancel_btn.grid(row=7, column=0, columnspan=2, pady=5)
             
             self.status = ttk.Label(self, text="", foreground="blue")
-            self.status.grid(row=5, column=0, columnspan=2)
+            self.status.grid(row=8, column=0, columnspan=2)
+            self.columnconfigure(1, weight=1)
+            self.rowconfigure(6, weight=1)
             
         def load_versions(self):
-            self.versions = get_available_versions(self.implementation.get())
-            self.version_combo['values'] = self.versions
-            if self.versions:
-                self.version.set(self.versions[0])
+            implementation = self.implementation.get()
+            self.version_combo['values'] = []
+            self.version.set("")
+            self.status.config(text="Loading versions...", foreground="blue")
+            self.versions_task = self.runner.submit("Load versions", lambda task: get_available_versions(implementation))
             
             # Update server types
-            if self.implementation.get() == "java":
+            if implementation == "java":
                 self.type_combo['values'] = ["vanilla", "paper", "fabric", "forge"]
                 self.server_type.set("vanilla")
             else:
@@ -433,29 +4797,89 @@ def gui_install_server():
             if not server_name:
                 self.status.config(text="Server name cannot be empty", foreground="red")
                 return
+            if any(t.label == server_name for t in self.active_installs()):
+                self.status.config(text=f"{server_name} is already being installed", foreground="red")
+                return
                 
             version = self.version.get()
             server_type = self.server_type.get()
             implementation = self.implementation.get()
+            profile = None if self.profile.get() == "none" else self.profile.get()
             
-            try:
-                self.status.config(text="Creating server...", foreground="blue")
-                self.update()
-                
-                server_dir = create_server(server_name, version, server_type, implementation)
-                
-                self.status.config(text="Starting server for initialization...", foreground="blue")
-                self.update()
-                
-                start_server(server_dir)
-                self.after(30000, self.finalize_installation, server_dir)  # Wait 30 seconds
-                
-            except Exception as e:
-                self.status.config(text=f"Error: {str(e)}", foreground="red")
+            def job(task):
+                server_dir = create_server(server_name, version, server_type, implementation,
+                                           progress=task.progress, cancel=task.cancelled, profile=profile)
+                task.check_cancelled()
+                task.events.put((task, "status", "Initializing"))
+                return server_dir, initialize_server(server_dir)
+            
+            task = self.runner.submit(server_name, job)
+            self.task_tree.insert("", "end", iid=str(task.id), values=(server_name, "Queued", "", "", ""))
+            self.server_name.set("")
+        
+        def cancel_selected(self):
+            for iid in self.task_tree.selection():
+                task = self.runner.tasks.get(int(iid))
+                if task:
+                    task.cancel()
+                    self.task_tree.set(iid, "status", "Cancelling...")
+        
+        def poll_tasks(self):
+            self.runner.poll(self.on_task_event)
+            self.after(100, self.poll_tasks)
+        
+        def active_installs(self):
+            return [t for t in self.runner.active() if self.task_tree.exists(str(t.id))]
+        
+        def on_task_event(self, task, kind, payload):
+            if task is self.versions_task:  # Results of superseded version lookups are dropped
+                if kind == "done":
+                    self.versions = payload
+                    self.version_combo['values'] = payload
+                    if payload:
+                        self.version.set(payload[0])
+                    self.status.config(text="")
+                elif kind == "failed":
+                    self.status.config(text=f"Could not load versions: {payload}", foreground="red")
+                return
+            
+            iid = str(task.id)
+            if not self.task_tree.exists(iid):
+                return
+            if kind == "running":
+                self.task_tree.set(iid, "status", "Downloading")
+            elif kind == "status":
+                self.task_tree.set(iid, "status", payload)
+                self.task_tree.set(iid, "speed", "")
+                self.task_tree.set(iid, "eta", "")
+            elif kind == "progress":
+                if payload['total']:
+                    self.task_tree.set(iid, "progress", f"{payload['downloaded'] / payload['total'] * 100:.0f}%")
+                else:
+                    self.task_tree.set(iid, "progress", format_bytes(payload['downloaded']))
+                self.task_tree.set(iid, "speed", f"{format_bytes(payload['rate'])}/s")
+                self.task_tree.set(iid, "eta", format_eta(payload['eta']))
+            elif kind == "cancelled":
+                self.task_tree.set(iid, "status", "Cancelled")
+            elif kind == "failed":
+                self.task_tree.set(iid, "status", "Failed")
+                self.status.config(text=f"{task.label}: {payload}", foreground="red")
+            elif kind == "done":
+                server_dir, result = payload
+                self.task_tree.set(iid, "progress", "100%")
+                if result['ready']:
+                    self.task_tree.set(iid, "status", f"Installed ({result['elapsed']:.1f}s boot)")
+                    self.status.config(text=f"{task.label} installed at: {server_dir}", foreground="green")
+                else:
+                    self.task_tree.set(iid, "status", "Did not boot")
+                    self.status.config(text=f"{task.label} at {server_dir} did not finish booting; see its log", foreground="red")
         
-        def finalize_installation(self, server_dir):
-            stop_server(server_dir)
-            self.status.config(text=f"Server installed at: {server_dir}", foreground="green")
+        def on_close(self):
+            if self.active_installs():
+                if not messagebox.askyesno("Installs Running", "Cancel the running installs and quit?"):
+                    return
+            self.runner.shutdown()
+            self.destroy()
     
     app = InstallerGUI()
     app.mainloop()
@@ -471,19 +4895,39 @@ def gui_manage_servers():
             
             self.servers = []
             self.selected_server = None
+            self.runner = TaskRunner()  # Start/stop/delete run here so the window stays responsive
+            
+            # Live resource columns; a running daemon samples for us
+            self.stats_interval = get_config()["telemetry_interval"]
+            if not is_daemon_running():
+                start_telemetry(self.stats_interval)
+                start_trash_reaper()
             
             self.create_widgets()
             self.load_servers()
+            self.protocol("WM_DELETE_WINDOW", self.on_close)
+            self.after(1000, self.refresh_stats)
+            self.after(100, self.poll_tasks)
             
         def create_widgets(self):
             # Server list
-            self.tree = ttk.Treeview(self, columns=("name", "version", "type"), show="headings")
+            self.tree = ttk.Treeview(self, columns=("name", "version", "type", "status", "cpu", "memory", "disk", "lag"), show="headings")
             self.tree.heading("name", text="Server Name")
             self.tree.heading("version", text="Version")
             self.tree.heading("type", text="Type")
+            self.tree.heading("status", text="Status")
+            self.tree.heading("cpu", text="CPU")
+            self.tree.heading("memory", text="Memory")
+            self.tree.heading("disk", text="Disk")
+            self.tree.heading("lag", text="Lag Warnings")
             self.tree.column("name", width=200)
             self.tree.column("version", width=100)
             self.tree.column("type", width=100)
+            self.tree.column("status", width=80)
+            self.tree.column("cpu", width=60)
+            self.tree.column("memory", width=80)
+            self.tree.column("disk", width=80)
+            self.tree.column("lag", width=90)
             self.tree.pack(fill="both", expand=True, padx=10, pady=10)
             self.tree.bind("<<TreeviewSelect>>", self.on_select)
             
@@ -503,24 +4947,50 @@ def gui_manage_servers():
             self.delete_btn = ttk.Button(btn_frame, text="Delete", command=self.delete_server, state="disabled")
             self.delete_btn.pack(side="left", padx=5)
             
+            self.logs_btn = ttk.Button(btn_frame, text="Logs", command=self.show_logs, state="disabled")
+            self.logs_btn.pack(side="left", padx=5)
+            
+            self.profile_btn = ttk.Button(btn_frame, text="Profile", command=self.show_profile, state="disabled")
+            self.profile_btn.pack(side="left", padx=5)
+            
+            ttk.Button(btn_frame, text="Lag Report", command=self.lag_report).pack(side="right", padx=5)
+            
             # Status bar
             self.status = ttk.Label(self, text="Ready", relief="sunken", anchor="w")
             self.status.pack(side="bottom", fill="x")
             
         def load_servers(self):
             self.tree.delete(*self.tree.get_children())
-            server_data = get_server_data()
-            self.servers = server_data.get('servers', [])
+            self.servers = call_manager("status")
             
             for server in self.servers:
-                self.tree.insert("", "end", values=(
+                self.tree.insert("", "end", iid=server['path'], values=(
                     server['name'],
                     server['version'],
-                    server['type']
+                    server['type'],
+                    "", "", "", "", ""
                 ), tags=(server['path'],))
             
             self.status.config(text=f"Loaded {len(self.servers)} servers")
         
+        def refresh_stats(self):
+            for server in call_manager("status"):
+                if not self.tree.exists(server['path']):
+                    continue
+                stats = server['stats']
+                cpu = f"{stats['cpu_percent']:.0f}%" if stats.get('cpu_percent') is not None else "-"
+                self.tree.item(server['path'], values=(
+                    server['name'],
+                    server['version'],
+                    server['type'],
+                    server['state'],
+                    cpu,
+                    format_bytes(stats.get('rss_bytes')),
+                    format_bytes(server.get('disk_bytes')),
+                    stats.get('lag_events', "-")
+                ))
+            self.after(self.stats_interval * 1000, self.refresh_stats)
+        
         def on_select(self, event):
             selection = self.tree.selection()
             if selection:
@@ -529,40 +4999,204 @@ def gui_manage_servers():
                 self.stop_btn.config(state="normal")
                 self.restart_btn.config(state="normal")
                 self.delete_btn.config(state="normal")
+                self.logs_btn.config(state="normal")
+                self.profile_btn.config(state="normal")
             else:
                 self.selected_server = None
                 self.start_btn.config(state="disabled")
                 self.stop_btn.config(state="disabled")
                 self.restart_btn.config(state="disabled")
                 self.delete_btn.config(state="disabled")
+                self.logs_btn.config(state="disabled")
+                self.profile_btn.config(state="disabled")
+        
+        def show_logs(self):
+            """Open a window with the server's recent console output that follows new lines"""
+            if not self.selected_server:
+                return
+            path = self.selected_server
+            window = tk.Toplevel(self)
+            window.title(f"{self.server_name(path)} - Console Log")
+            window.geometry("900x500")
+            text = tk.Text(window, wrap="none", font="TkFixedFont", state="disabled")
+            scroll = ttk.Scrollbar(window, command=text.yview)
+            text.configure(yscrollcommand=scroll.set)
+            scroll.pack(side="right", fill="y")
+            text.pack(fill="both", expand=True)
+            
+            def append(lines):
+                at_bottom = text.yview()[1] >= 1.0
+                text.configure(state="normal")
+                text.insert("end", "".join(line + "\n" for line in lines))
+                excess = int(text.index("end-1c").split(".")[0]) - 5000
+                if excess > 0:
+                    text.delete("1.0", f"{excess + 1}.0")
+                text.configure(state="disabled")
+                if at_bottom:
+                    text.see("end")
+            
+            follow = {'offset': log_end_offset(path), 'pending': b''}
+            append(tail_log(path, 1000, follow['offset']))
+            
+            def poll():
+                if not window.winfo_exists():
+                    return
+                data, follow['offset'] = read_log(path, follow['offset'])
+                if data:
+                    *lines, follow['pending'] = (follow['pending'] + data).split(b'\n')
+                    append([line.decode('utf-8', 'replace').rstrip('\r') for line in lines])
+                window.after(500, poll)
+            window.after(500, poll)
+        
+        def show_profile(self):
+            """Compare the server's config files with a performance profile and apply it"""
+            if not self.selected_server:
+                return
+            path = self.selected_server
+            server = get_server(path=path)
+            window = tk.Toplevel(self)
+            window.title(f"{server['name']} - Performance Profile")
+            window.geometry("760x420")
+            
+            top = ttk.Frame(window)
+            top.pack(fill="x", padx=10, pady=10)
+            ttk.Label(top, text="Profile:").pack(side="left")
+            profile = tk.StringVar(value=server.get('profile') or next(iter(PERFORMANCE_PROFILES)))
+            combo = ttk.Combobox(top, textvariable=profile, values=list(PERFORMANCE_PROFILES), state="readonly", width=15)
+            combo.pack(side="left", padx=5)
+            description = ttk.Label(top, text="")
+            description.pack(side="left", padx=5)
+            
+            columns = ("file", "key", "current", "wanted")
+            diff = ttk.Treeview(window, columns=columns, show="headings")
+            for column, title, width in zip(columns, ("File", "Setting", "Current", "Profile"), (170, 330, 110, 110)):
+                diff.heading(column, text=title)
+                diff.column(column, width=width)
+            diff.pack(fill="both", expand=True, padx=10)
+            
+            def refresh(event=None):
+                if not window.winfo_exists():
+                    return
+                description.config(text=PERFORMANCE_PROFILES[profile.get()]['description'])
+                diff.delete(*diff.get_children())
+                for filename, key, current, wanted in profile_diff(path, profile.get()):
+                    diff.insert("", "end", values=(filename, key, "(unset)" if current is None else current, wanted))
+            
+            def apply():
+                name = profile.get()
+                self.runner.submit(("Applying profile", path),
+                                   lambda task: call_manager("apply_profile", server_directory=path, profile=name))
+                self.status.config(text=f"Applying {name} to {server['name']}...")
+                window.after(500, refresh)
+            
+            combo.bind("<<ComboboxSelected>>", refresh)
+            ttk.Button(window, text="Apply", command=apply).pack(pady=10)
+            refresh()
+        
+        def lag_report(self):
+            if not any(t.label[0] == "Lag report" for t in self.runner.active()):
+                self.runner.submit(("Lag report", None), lambda task: call_manager("lag_report"))
+                self.status.config(text="Reading lag history...")
+        
+        def show_lag_report(self, report):
+            """Worst servers and worst hours of the last week"""
+            window = tk.Toplevel(self)
+            window.title("Lag Report - Last 7 Days")
+            window.geometry("760x480")
+            
+            ttk.Label(window, text="Worst servers").pack(anchor="w", padx=10, pady=(10, 0))
+            columns = ("name", "events", "behind", "worst", "watchdogs", "histogram")
+            servers = ttk.Treeview(window, columns=columns, show="headings", height=8)
+            for column, title, width in zip(columns, ("Server", "Events", "Behind", "Worst", "Watchdog", "Histogram"),
+                                            (160, 70, 80, 70, 70, 280)):
+                servers.heading(column, text=title)
+                servers.column(column, width=width)
+            for s in report['servers']:
+                servers.insert("", "end", values=(
+                    s['name'], s['events'], format_duration_ms(s['behind_ms']), format_duration_ms(s['max_ms']),
+                    s['watchdogs'], "  ".join(f"{label}: {n}" for label, n in zip(lag_bucket_labels(), s['histogram']) if n)
+                ))
+            servers.pack(fill="both", expand=True, padx=10, pady=5)
+            
+            ttk.Label(window, text="Worst hours").pack(anchor="w", padx=10)
+            columns = ("hour", "name", "events", "behind", "worst", "watchdogs")
+            hours = ttk.Treeview(window, columns=columns, show="headings", height=8)
+            for column, title, width in zip(columns, ("Hour", "Server", "Events", "Behind", "Worst", "Watchdog"),
+                                            (140, 160, 70, 80, 70, 70)):
+                hours.heading(column, text=title)
+                hours.column(column, width=width)
+            for h in report['hours']:
+                hours.insert("", "end", values=(
+                    time.strftime("%Y-%m-%d %H:00", time.localtime(h['hour'])), h['name'], h['events'],
+                    format_duration_ms(h['behind_ms']), format_duration_ms(h['max_ms']), h['watchdogs']
+                ))
+            hours.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        
+        def server_name(self, path):
+            return next((s['name'] for s in self.servers if s['path'] == path), path)
+        
+        def submit(self, verb, method):
+            """Run a manager method for the selected server in the background"""
+            if not self.selected_server:
+                return
+            path = self.selected_server
+            name = self.server_name(path)
+            if any(t.label[1] == path for t in self.runner.active()):
+                self.status.config(text=f"{name} is busy")
+                return
+            self.runner.submit((verb, path), lambda task: call_manager(method, server_directory=path))
+            self.status.config(text=f"{verb} {name}...")
         
         def start_server(self):
-            if self.selected_server:
-                self.status.config(text="Starting server...")
-                self.update()
-                start_server(self.selected_server)
-                self.status.config(text="Server started in background")
+            self.submit("Starting", "start_server")
         
         def stop_server(self):
-            if self.selected_server:
-                self.status.config(text="Stopping server...")
-                self.update()
-                stop_server(self.selected_server)
-                self.status.config(text="Server stopped")
+            self.submit("Stopping", "stop_server")
         
         def restart_server(self):
-            if self.selected_server:
-                self.status.config(text="Restarting server...")
-                self.update()
-                restart_server(self.selected_server)
-                self.status.config(text="Server restarted")
+            self.submit("Restarting", "restart_server")
         
         def delete_server(self):
             if self.selected_server:
                 if messagebox.askyesno("Confirm Delete", "Delete this server and all its files?"):
-                    result = delete_server(self.selected_server)
-                    self.status.config(text=result)
-                    self.load_servers()
+                    self.submit("Deleting", "delete_server")
+        
+        def poll_tasks(self):
+            self.runner.poll(self.on_task_event)
+            self.after(100, self.poll_tasks)
+        
+        def on_task_event(self, task, kind, payload):
+            verb, path = task.label
+            name = self.server_name(path)
+            if verb == "Lag report":
+                if kind == "failed":
+                    self.status.config(text=f"Lag report failed: {payload}")
+                elif kind == "done":
+                    self.status.config(text="Ready")
+                    self.show_lag_report(payload)
+                return
+            if kind == "failed":
+                self.status.config(text=f"{verb} {name} failed: {payload}")
+            elif kind != "done":
+                return
+            elif verb == "Starting":
+                self.status.config(text=f"{name} started in background")
+            elif verb == "Stopping":
+                self.status.config(text=f"{name} stopped" if payload else f"{name} did not stop")
+            elif verb == "Restarting":
+                self.status.config(text=f"{name} restarted")
+            elif verb == "Applying profile":
+                self.status.config(text=f"{name}: {len(payload)} settings changed; restart to take effect")
+            elif verb == "Deleting":
+                self.status.config(text=payload)
+                self.load_servers()
+        
+        def on_close(self):
+            if self.runner.active():
+                if not messagebox.askyesno("Tasks Running", "Servers are still starting or stopping. Quit anyway?"):
+                    return
+            self.runner.shutdown()
+            self.destroy()
     
     app = ServerManagerGUI()
     app.mainloop()
@@ -570,6 +5204,210 @@ def gui_manage_servers():
 
 
 
+def run_batch_command(args, parser):
+    """Run a non-interactive command-line operation; returns False if none was requested"""
+    if args.mirror:
+        config_overrides['mirror'] = args.mirror
+    
+    if args.export_bundle:
+        targets = parse_bundle_targets(args.include or "registered")
+        if not targets:
+            raise ValueError("Nothing to bundle: no servers are registered; pick artifacts with --include")
+        started = time.time()
+        index = export_bundle(args.export_bundle, targets, args.jobs)
+        print(f"Wrote {len(index['artifacts'])} artifacts to {args.export_bundle} "
+              f"({format_bytes(os.path.getsize(args.export_bundle))}) in {time.time() - started:.1f}s")
+        return True
+    
+    if args.import_bundle:
+        started = time.time()
+        entries = import_bundle(args.import_bundle)
+        for name in sorted(entries):
+            print(f"imported  {name}")
+        print(f"Imported {len(entries)} artifacts in {time.time() - started:.1f}s; they resolve without network access now")
+        return True
+    
+    if args.serve_bundle:
+        server = serve_bundle(args.serve_bundle)
+        print(f"Serving {args.serve_bundle} on port {server.server_address[1]}; "
+              f"use --mirror http://<this host>:{server.server_address[1]} elsewhere (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        return True
+    
+    if args.mark_template:
+        server = get_server(name=args.mark_template)
+        if not server:
+            raise ValueError(f"No server named {args.mark_template}")
+        mark_template(server['path'])
+        print(f"{args.mark_template} is now a template")
+        return True
+    
+    if args.clone:
+        if not args.name:
+            parser.error("--clone needs --name")
+        started = time.time()
+        server_dir = clone_server(args.clone, args.name)
+        print(f"Server created at: {server_dir} ({time.time() - started:.2f}s)")
+        return True
+    
+    if args.lineage:
+        print_lineage()
+        return True
+    
+    if args.trash:
+        entries = list_trash()
+        if not entries:
+            print("Trash is empty")
+        for entry in entries:
+            deleted = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['deleted']))
+            expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['expires']))
+            print(f"{entry['name']:20} deleted {deleted}, {format_bytes(entry['bytes']):>7}, removed after {expires}")
+        return True
+    
+    if args.undelete:
+        server = undelete_server(args.undelete)
+        print(f"Restored {server['name']} to {server['path']}")
+        return True
+    
+    if args.empty_trash:
+        print(f"Freed {format_bytes(purge_trash(force=True))}")
+        return True
+    
+    if args.backup:
+        wanted = set(args.backup.split(","))
+        for server in list_servers():
+            if "all" in wanted or server['name'] in wanted:
+                manifest = backup_server(server['path'])
+                print(f"{server['name']}: backup {manifest['id']}, {len(manifest['files'])} files, "
+                      f"{format_bytes(manifest['bytes_written'])} new data in {manifest['duration']:.1f}s")
+        return True
+    
+    if args.restore:
+        server = get_server(name=args.restore)
+        if not server:
+            raise ValueError(f"No server named {args.restore}")
+        manifest = restore_server(server['path'], args.snapshot)
+        print(f"{server['name']}: restored backup {manifest['id']}")
+        return True
+    
+    if args.rcon:
+        if args.servers:
+            wanted = set(args.servers.split(","))
+            targets = [s for s in list_servers() if s['name'] in wanted]
+        else:
+            targets = [s for s in list_servers() if get_server_pid(s['path'])]
+        names = {s['path']: s['name'] for s in targets}
+        for path, reply in sorted(rcon_fanout(list(names), args.rcon).items(), key=lambda r: names[r[0]]):
+            if isinstance(reply, Exception):
+                print(f"{names[path]}: error: {reply}")
+            else:
+                print(f"{names[path]}: {reply.strip() or '(no output)'}")
+        return True
+    
+    if args.metrics is not None:
+        server = serve_metrics(args.metrics or None)
+        print(f"Serving metrics on http://127.0.0.1:{server.server_address[1]}/metrics (Ctrl+C to stop)")
+        try:
+            start_telemetry().join()
+        except KeyboardInterrupt:
+            pass
+        return True
+    
+    if args.daemon:
+        run_daemon()
+        return True
+    
+    if args.sleep_on_idle or args.always_on:
+        for name in (args.sleep_on_idle or args.always_on).split(","):
+            server = get_server(name=name)
+            if not server:
+                raise ValueError(f"No server named {name}")
+            if args.sleep_on_idle:
+                public_port, backend_port = enable_idle_proxy(server['path'])
+                print(f"{name}: proxied on port {public_port}, server moved to 127.0.0.1:{backend_port}")
+            else:
+                disable_idle_proxy(server['path'])
+                print(f"{name}: listening on its own port again")
+            if get_server_pid(server['path']):
+                print(f"{name}: restart it for the port change to take effect")
+        return True
+    
+    if args.idle_proxy:
+        run_idle_proxy()
+        return True
+    
+    if args.log_pump:
+        run_log_pump(args.log_pump)
+        return True
+    
+    if args.lag_report is not None:
+        print_lag_report(args.lag_report, args.servers.split(",") if args.servers else None)
+        return True
+    
+    if args.profile or args.profile_diff is not None:
+        if args.profile and not args.servers:
+            parser.error("--profile needs --servers")
+        wanted = set(args.servers.split(",")) if args.servers else None
+        servers = [s for s in list_servers() if wanted is None or s['name'] in wanted]
+        missing = (wanted or set()) - {s['name'] for s in servers}
+        if missing:
+            raise ValueError(f"Unknown servers: {', '.join(sorted(missing))}")
+        if not args.profile:
+            print_profile_diff(servers, args.profile_diff or None)
+            return True
+        for server in servers:
+            changes = call_manager("apply_profile", server_directory=server['path'], profile=args.profile)
+            pending = get_server(path=server['path']).get('profile_pending')
+            note = f"; {', '.join(pending)} patched after first boot" if pending else ""
+            restart = "; restart to take effect" if changes and get_server_pid(server['path']) else ""
+            print(f"{server['name']}: {args.profile}, {len(changes)} settings changed{note}{restart}")
+        return True
+    
+    if args.logs:
+        server = get_server(name=args.logs)
+        if not server:
+            raise ValueError(f"No server named {args.logs}")
+        if args.since:
+            until = parse_log_time(args.until) if args.until else None
+            lines = log_lines_between(server['path'], parse_log_time(args.since), until)
+            if args.tail:
+                lines = lines[-args.tail:]
+        else:
+            lines = tail_log(server['path'], args.tail or 100)
+        for line in lines:
+            print(line)
+        if args.follow:
+            try:
+                for line in follow_log(server['path']):
+                    print(line, flush=True)
+            except KeyboardInterrupt:
+                pass
+        return True
+    
+    if args.timings:
+        if not report_timings():
+            sys.exit(1)
+        return True
+    
+    if args.upgrade:
+        names = None if args.upgrade == "all" else set(args.upgrade.split(","))
+        results = upgrade_fleet(names, args.to_version, args.jobs, args.max_unavailable)
+        if any(r['status'] == "failed" for r in results):
+            sys.exit(1)
+        return True
+    
+    if args.apply:
+        results = apply_fleet(args.apply, args.jobs)
+        if any(r['status'] == "failed" for r in results):
+            sys.exit(1)
+        return True
+    
+    return False
+
 def main():
     """Main entry point with mode selection"""
     parser = argparse.ArgumentParser(description="Minecraft Server Installer and Manager")
@@ -577,8 +5415,60 @@ def main():
     parser.add_argument("--gui", action="store_true", help="Force graphical interface")
     parser.add_argument("--install", action="store_true", help="Run installer")
     parser.add_argument("--manage", action="store_true", help="Run server manager")
+    parser.add_argument("--apply", metavar="SPEC", help="Provision every server in a fleet spec (JSON/YAML)")
+    parser.add_argument("--jobs", type=int, help="Servers provisioned (--apply) or artifacts downloaded (--upgrade, --export-bundle) in parallel")
+    parser.add_argument("--upgrade", metavar="NAMES", help="Upgrade servers in place to the latest build (comma-separated, or 'all')")
+    parser.add_argument("--to-version", metavar="VERSION", help="Minecraft version to move servers to with --upgrade")
+    parser.add_argument("--max-unavailable", type=int, metavar="N", help="Running servers restarted at once by --upgrade")
+    parser.add_argument("--metrics", nargs="?", const=0, type=int, metavar="PORT",
+                        help="Sample server resources and serve Prometheus-style /metrics on localhost")
+    parser.add_argument("--rcon", metavar="COMMAND", help="Send a console command over RCON to running servers")
+    parser.add_argument("--servers", metavar="NAMES", help="Comma-separated server names for --rcon (default: all running), --profile and --lag-report")
+    parser.add_argument("--backup", metavar="NAMES", help="Back up the worlds of the named servers (comma-separated, or 'all')")
+    parser.add_argument("--restore", metavar="NAME", help="Restore a stopped server's worlds from a backup")
+    parser.add_argument("--snapshot", metavar="ID", help="Backup to restore with --restore (default: latest)")
+    parser.add_argument("--mark-template", metavar="NAME", help="Mark an initialized server as a template")
+    parser.add_argument("--clone", metavar="TEMPLATE", help="Create a server from a template (use with --name)")
+    parser.add_argument("--name", help="Name of the server created by --clone")
+    parser.add_argument("--lineage", action="store_true", help="List templates and the servers cloned from them")
+    parser.add_argument("--trash", action="store_true", help="List deleted servers that can still be restored")
+    parser.add_argument("--undelete", metavar="NAME", help="Restore a deleted server from the trash")
+    parser.add_argument("--empty-trash", action="store_true", help="Permanently remove every deleted server now")
+    parser.add_argument("--daemon", action="store_true", help="Run the manager daemon that the CLI and GUI connect to")
+    parser.add_argument("--sleep-on-idle", metavar="NAMES", help="Put Java servers behind the idle proxy (comma-separated)")
+    parser.add_argument("--always-on", metavar="NAMES", help="Take servers off the idle proxy (comma-separated)")
+    parser.add_argument("--idle-proxy", action="store_true", help="Run the proxy that wakes sleeping servers on login")
+    parser.add_argument("--timings", action="store_true", help="Measure import and startup latency")
+    parser.add_argument("--logs", metavar="NAME", help="Print a server's console log (last 100 lines unless --tail/--since)")
+    parser.add_argument("--tail", type=int, metavar="N", help="Lines printed by --logs")
+    parser.add_argument("--since", metavar="TIME", help="Print --logs output from TIME (HH:MM or YYYY-MM-DD HH:MM)")
+    parser.add_argument("--until", metavar="TIME", help="Stop --logs output at TIME")
+    parser.add_argument("--follow", action="store_true", help="Keep printing new --logs lines as they are written")
+    parser.add_argument("--log-pump", metavar="DIR", help=argparse.SUPPRESS)
+    parser.add_argument("--lag-report", nargs="?", const=7, type=int, metavar="DAYS",
+                        help="Rank servers and hours by lag over the last DAYS (default 7); add --servers for timelines")
+    parser.add_argument("--profile", choices=list(PERFORMANCE_PROFILES),
+                        help="Apply a performance profile to the --servers' configs")
+    parser.add_argument("--profile-diff", nargs="?", const="", choices=["", *PERFORMANCE_PROFILES], metavar="PROFILE",
+                        help="Show settings that differ from a profile (default: each server's own)")
+    parser.add_argument("--export-bundle", metavar="FILE",
+                        help="Pack resolved, verified artifacts into one archive for offline hosts")
+    parser.add_argument("--include", metavar="TARGETS",
+                        help="Artifacts for --export-bundle: type:version, implementation/type:version, fleet specs "
+                             "or 'registered' (comma-separated; default: registered)")
+    parser.add_argument("--import-bundle", metavar="FILE", help="Add a bundle's artifacts to the local store and pin them")
+    parser.add_argument("--mirror", metavar="SOURCE",
+                        help="Resolve and download every artifact from a bundle file or http:// mirror for this run")
+    parser.add_argument("--serve-bundle", metavar="FILE", help="Serve a bundle to other hosts as an HTTP mirror")
     args = parser.parse_args()
     
+    try:
+        if run_batch_command(args, parser):
+            return
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    
     # Determine interface mode
     if args.cli:
         use_gui = False
@@ -598,8 +5488,9 @@ def main():
     elif args.manage:
         operation = "manage"
     else:
-        # Ask user what they want to do
-        if use_gui:
+        # Ask user what they want to do; from a terminal, ask there rather than
+        # paying for an extra Tk window before the real one
+        if use_gui and not (sys.stdin and sys.stdin.isatty()):
             try:
                 root = tk.Tk()
                 root.withdraw()
@@ -607,6 +5498,7 @@ def main():
                                               detail="Install a new server or manage existing servers?",
                                               icon="question", type="yesnocancel",
                                               default="yes")
+                root.destroy()
                 if choice == "yes":
                     operation = "install"
                 elif choice == "no":